@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
 '''
-
+The package imports nothing when it is imported.  Its public names (Store,
+loadPeptideDataFile and the rest of PUBLIC_MODULES) are imported, with
+SQLAlchemy and numpy, the first time one of them is looked up, so that the
+command line tools can parse their arguments and answer --version without
+loading them.
 
 Created on  2017-03-31 11:57:28
 
@@ -9,9 +13,57 @@ Created on  2017-03-31 11:57:28
 @copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
 @license: GPL v2.0
 '''
+import sys
+import types
+import importlib
+
+__version__ = '0.1.0'
 
+# Submodules whose public names are the package's.  Later ones win.
+PUBLIC_MODULES = ['dimadb', 'store', 'reader', 'columns', 'instrument']
 
-from dimadb import *
-from store import *
 
-__version__ = '0.1.0'
+class LazyPackage(types.ModuleType):
+    '''
+    Module class of the package.  A name that is not there yet is looked
+    up by importing PUBLIC_MODULES and copying their public names in, as
+    "from X import *" would.
+    '''
+
+    def __getattr__(self, name):
+        if (name.startswith('__') and name != '__all__') or self.__dict__.get('_loaded'):
+            raise AttributeError(name)
+        self.loadPublic()
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def loadPublic(self):
+        '''
+        Imports PUBLIC_MODULES and copies their public names into the package
+        '''
+        # Set first so that lookups while the modules import do not recurse
+        self._loaded = True
+        names = set()
+        try:
+            for modulename in PUBLIC_MODULES:
+                module = importlib.import_module('%s.%s' % (self.__name__, modulename))
+                public = getattr(module, '__all__', None)
+                if public is None:
+                    public = [key for key in vars(module) if not key.startswith('_')]
+                for key in public:
+                    self.__dict__[key] = getattr(module, key)
+                names.update(public)
+        except Exception:
+            self._loaded = False
+            raise
+        self.__all__ = sorted(names)
+
+
+# Swap the package module for a LazyPackage.  The original is kept, since
+# Python 2 clears the globals of a module when it is freed.
+_package = LazyPackage(__name__, __doc__)
+_package.__dict__.update(sys.modules[__name__].__dict__)
+_package._original = sys.modules[__name__]
+sys.modules[__name__] = _package
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.arrowreader - Reader for peptide data in Parquet and Arrow files
+
+Reads the Proteome Discoverer peptide table from a Parquet file or an Arrow
+IPC file with the export headers as column names, a record batch at a
+time.  The batches are handed out as split lines, like TextReader does, so
+they go through the same ColumnPlan, and ColumnBlocks are built with the
+integer and float columns taken straight from the typed arrays, so numbers
+are never parsed from strings.
+
+Positions and sizes are in rows rather than bytes.
+
+Needs pyarrow.
+
+Created on  2026-10-18 20:16:38
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import os
+
+from reader import FORMAT_PARQUET, FORMAT_ARROW, DEFAULT_BATCH_SIZE
+from columnar import parseBlock
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def formatValue(v):
+    '''
+    Field string for a value from an Arrow column, written the way the text
+    export would have it
+    '''
+    if v is None:
+        return ''
+    if v is True:
+        return 'TRUE'
+    if v is False:
+        return 'FALSE'
+    if isinstance(v, unicode):
+        return v.encode('utf-8')
+    if isinstance(v, float):
+        return repr(v)
+    return str(v)
+
+
+def isNumeric(arrowtype):
+    return pyarrow.types.is_integer(arrowtype) or pyarrow.types.is_floating(arrowtype)
+
+
+class RecordLines(list):
+    '''
+    Split lines of a record batch.  record is the batch, whose typed columns
+    are used when the lines are made into a ColumnBlock.
+    '''
+    record = None
+
+
+class ArrowReader(object):
+    '''
+    Reader for Parquet (FORMAT_PARQUET) and Arrow IPC (FORMAT_ARROW) files.
+    The file is memory mapped.
+
+    headers     list of column names
+    size        number of rows
+    position    number of rows handed out, where a load can resume
+    typed       True, since the numeric columns need no parsing
+    '''
+
+    typed = True
+
+    def __init__(self, filename, format=FORMAT_PARQUET):
+        if pyarrow is None:
+            raise Exception('pyarrow is required to read %s files' % format)
+        self.filename = filename
+        self.format = format
+        self.position = 0
+        self.start = 0
+        if format == FORMAT_PARQUET:
+            self.parquet = pyarrow.parquet.ParquetFile(filename, memory_map=True)
+            schema = self.parquet.schema.to_arrow_schema()
+            self.size = self.parquet.metadata.num_rows
+        elif format == FORMAT_ARROW:
+            self.ipc = pyarrow.ipc.open_file(pyarrow.memory_map(filename, 'r'))
+            schema = self.ipc.schema
+            self.size = sum(self.ipc.get_batch(i).num_rows for i in range(self.ipc.num_record_batches))
+        else:
+            raise Exception('ArrowReader cannot read %s files' % format)
+        self.headers = [formatValue(name) for name in schema.names]
+
+    def seek(self, position):
+        '''
+        Skips the first position rows
+        '''
+        self.start = position
+        self.position = position
+
+    def records(self):
+        '''
+        Yields the record batches of the file
+        '''
+        if self.format == FORMAT_PARQUET:
+            for i in range(self.parquet.num_row_groups):
+                for record in self.parquet.read_row_group(i).to_batches():
+                    yield record
+        else:
+            for i in range(self.ipc.num_record_batches):
+                yield self.ipc.get_batch(i)
+
+    def lines(self, record):
+        '''
+        RecordLines for a record batch
+        '''
+        columns = [
+            [formatValue(v) for v in record.column(i).to_pylist()]
+            for i in range(record.num_columns)
+        ]
+        lines = RecordLines(list(fields) for fields in zip(*columns))
+        lines.record = record
+        return lines
+
+    def batches(self, batch_size=DEFAULT_BATCH_SIZE, plan=None):
+        '''
+        Yields RecordLines of at most batch_size rows.  Batches do not span
+        record batches.  plan is not used.
+        '''
+        if batch_size < 1:
+            raise Exception('Batch size must be at least 1, not %s' % batch_size)
+        row = 0
+        for record in self.records():
+            for offset in range(max(0, self.start - row), record.num_rows, batch_size):
+                piece = record.slice(offset, batch_size)
+                self.position = row + offset + piece.num_rows
+                yield self.lines(piece)
+            row += record.num_rows
+
+    def block(self, plan, batch):
+        '''
+        ColumnBlock for a batch, with the numeric columns from the typed
+        arrays.  Batches that are not a whole RecordLines, e.g. with some
+        lines skipped, are parsed from the strings.
+        '''
+        record = getattr(batch, 'record', None)
+        if record is None or record.num_rows != len(batch):
+            return parseBlock(plan, batch)
+        numeric = {}
+        for index, field in enumerate(record.schema):
+            if isNumeric(field.type):
+                numeric[index] = record.column(index).cast(pyarrow.float64()).to_numpy(zero_copy_only=False)
+        return parseBlock(plan, batch, numeric)
+
+    def close(self):
+        self.parquet = None
+        self.ipc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.benchmark - Ingestion benchmarks
+
+Generates synthetic peptide exports (see generate) and times
+loadPeptideDataFile on them against SQLite (see run), e.g.
+
+    python -m dimadb.benchmark --rows 100000 --output results.json
+
+and times how long the package and the loader take to start (see startup)
+
+    python -m dimadb.benchmark.startup --repeat 20
+
+Created on  2026-10-18 17:50:11
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+from dimadb.benchmark.generate import ExportGenerator, writeExport, exportHeaders
+from dimadb.benchmark.run import runScenario, runBenchmark
+from dimadb.benchmark.startup import runStartupBenchmark, timeCommand
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+'''
+python -m dimadb.benchmark runs the ingestion benchmark
+
+Created on  2026-10-18 17:50:11
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import sys
+from dimadb.benchmark.run import main
+
+sys.exit(main())
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.benchmark.generate - Synthetic Proteome Discoverer peptide exports
+
+Writes peptide group exports with the columns of the test file
+(test/partialSpreadforTesting.txt) filled with random but plausible
+values.  The same seed always gives the same file.  The number of rows and
+TMT channels, the number of modifications per peptide and the number of
+master proteins per peptide can be set.
+
+Created on  2026-10-18 17:52:40
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import random
+
+from dimadb.columns import ABUNDANCE_PREFIX, RATIO_PREFIX
+
+
+# TMTpro channel names in plex order.  Larger plexes get made up names.
+TMT_CHANNELS = [
+    '126', '127N', '127C', '128N', '128C', '129N', '129C', '130N', '130C', '131',
+    '131C', '132N', '132C', '133N', '133C', '134N',
+]
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+# Variable modifications as (name, residues they can sit on)
+MODIFICATIONS = [
+    ('Phospho',         'STY'),
+    ('Oxidation',       'M'),
+    ('Deamidated',      'NQ'),
+    ('Carbamidomethyl', 'C'),
+]
+
+# Columns that follow the abundances, as in the Proteome Discoverer export
+TRAILING_HEADERS = [
+    'Contaminant',
+    'Off by X',
+    'Position in Protein',
+    'Confidence (by Search Engine): A9 PMI-Byonic',
+    'Confidence (by Search Engine): Sequest HT',
+    'Percolator q-Value (by Search Engine): Sequest HT',
+    'Percolator PEP (by Search Engine): Sequest HT',
+    'Percolator SVMScore (by Search Engine): Sequest HT',
+]
+
+LEADING_HEADERS = [
+    'Confidence',
+    'Annotated Sequence',
+    'Modifications',
+    'Modifications in Master Proteins',
+    '# Protein Groups',
+    '# Proteins',
+    '# PSMs',
+    'Master Protein Accessions',
+    'Positions in Master Proteins',
+    '# Missed Cleavages',
+    'Theo. MH+ [Da]',
+]
+
+# Fraction of abundance values left empty
+MISSING_ABUNDANCE_RATE = 0.05
+
+
+def channelNames(channels):
+    '''
+    Names of the first channels of the TMT plex
+    '''
+    names = TMT_CHANNELS[:channels]
+    names += ['C%d' % i for i in range(len(names), channels)]
+    return names
+
+
+def ratioPairs(channels):
+    '''
+    (numerator, denominator) channel names of the ratio columns.  The channels
+    are split into two groups and every channel is divided by the first one
+    of its group, which for 10 channels gives the ratios of the test file.
+    '''
+    names = channelNames(channels)
+    half = (len(names) + 1) // 2
+    pairs = []
+    for group in (names[:half], names[half:]):
+        pairs.extend([(name, group[0]) for name in group[1:]])
+    return pairs
+
+
+def exportHeaders(channels=10):
+    '''
+    Header of an export with channels abundance columns
+    '''
+    headers = list(LEADING_HEADERS)
+    headers += ['%s(%s) / (%s)' % (RATIO_PREFIX, numerator, denominator) for numerator, denominator in ratioPairs(channels)]
+    headers += ['%s%s' % (ABUNDANCE_PREFIX, name) for name in channelNames(channels)]
+    headers += TRAILING_HEADERS
+    return headers
+
+
+class ExportGenerator(object):
+    '''
+    Random peptide export rows.
+
+    channels                number of TMT abundance channels
+    modification_density    mean number of variable modification sites per peptide
+    fanout                  number of master proteins per peptide
+    proteins                size of the pool of protein accessions
+    seed                    random seed
+    '''
+
+    def __init__(self, channels=10, modification_density=1.5, fanout=1, proteins=2000, seed=0):
+        if channels < 2:
+            raise Exception('Exports need at least 2 channels, not %s' % channels)
+        if fanout < 1:
+            raise Exception('Master protein fan-out must be at least 1, not %s' % fanout)
+        self.channels = channels
+        self.modification_density = modification_density
+        self.fanout = fanout
+        self.random = random.Random(seed)
+        self.accessions = ['P%05d' % i for i in range(max(proteins, fanout))]
+        self.headers = exportHeaders(channels)
+        self.ratios = len(ratioPairs(channels))
+
+    def sequence(self):
+        length = self.random.randint(7, 30)
+        residues = ''.join(self.random.choice(AMINO_ACIDS) for i in range(length - 1))
+        return residues + self.random.choice('KR')
+
+    def modifications(self, sequence):
+        '''
+        Returns (Modifications, phospho sites) for a sequence.  The number of
+        sites averages modification_density and each site goes on a residue
+        the modification can sit on.  Sites that land on the same residue
+        are counted once.
+        '''
+        sites = {}
+        count = int(self.modification_density)
+        if self.random.random() < self.modification_density - count:
+            count += 1
+        for i in range(count):
+            name, residues = self.random.choice(MODIFICATIONS)
+            positions = [pos for pos, residue in enumerate(sequence, 1) if residue in residues]
+            if positions:
+                pos = self.random.choice(positions)
+                sites.setdefault(name, set()).add('%s%d' % (sequence[pos - 1], pos))
+        mods = []
+        for name, residues in MODIFICATIONS:
+            if name in sites:
+                locations = sorted(sites[name], key=lambda site: int(site[1:]))
+                mods.append('%dx%s [%s]' % (len(locations), name, '; '.join(locations)))
+        mods.append('1xTMT6plex [N-Term]')
+        phospho = sites.get('Phospho')
+        return '; '.join(mods), phospho
+
+    def row(self):
+        '''
+        Fields of one export line, in header order
+        '''
+        rnd = self.random
+        sequence = self.sequence()
+        modifications, phospho = self.modifications(sequence)
+        accessions = rnd.sample(self.accessions, self.fanout)
+        start = rnd.randint(1, 500)
+        end = start + len(sequence) - 1
+
+        modsinmaster = ''
+        if phospho:
+            sites = sorted(phospho, key=lambda site: int(site[1:]))
+            modsinmaster = '; '.join(
+                '%s %dxPhospho [%s]' % (accession, len(sites), '; '.join(sites)) for accession in accessions
+            )
+
+        fields = [
+            'High',
+            '[%s].%s.[%s]' % (rnd.choice('KR-'), sequence, rnd.choice(AMINO_ACIDS + '-')),
+            modifications,
+            modsinmaster,
+            str(self.fanout),
+            str(self.fanout + rnd.randint(0, 2)),
+            str(rnd.randint(1, 20)),
+            '; '.join(accessions),
+            '; '.join('%s [%d-%d]' % (accession, start, end) for accession in accessions),
+            str(rnd.randint(0, 2)),
+            '%.5f' % rnd.uniform(700, 4500),
+        ]
+        fields += ['%.2f' % rnd.uniform(0.5, 1.5) for i in range(self.ratios)]
+        for i in range(self.channels):
+            if rnd.random() < MISSING_ABUNDANCE_RATE:
+                fields.append('')
+            else:
+                fields.append('%d' % rnd.randint(1000, 30000))
+        fields += [
+            'TRUE' if rnd.random() < 0.01 else 'FALSE',
+            '0',
+            '0',
+            rnd.choice(['High', 'n/a']),
+            'High',
+            '%.6f' % rnd.uniform(0, 0.01),
+            '%.6g' % rnd.uniform(0, 0.1),
+            '%.3f' % rnd.uniform(0, 4),
+        ]
+        return fields
+
+
+def writeExport(filename, rows=1000, channels=10, modification_density=1.5, fanout=1, seed=0):
+    '''
+    Writes a synthetic export of rows peptides to filename.  See ExportGenerator
+    for the other arguments.
+    '''
+    generator = ExportGenerator(channels, modification_density, fanout, seed=seed)
+    with open(filename, 'w') as f:
+        f.write('\t'.join(generator.headers) + '\n')
+        for i in range(rows):
+            f.write('\t'.join(generator.row()) + '\n')
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.benchmark.run - Times loadPeptideDataFile on synthetic exports
+
+Each scenario (database, load mode) loads the export into a fresh SQLite
+database in a process of its own, so that peak RSS and the caches start
+from the same place every time.  The load is split into stages:
+
+    parse       reading and splitting lines (everything outside the Store)
+    transform   building the table rows from the split lines
+    write       id allocation, reference data lookups and the inserts,
+                plus the bulk load at the end in bulk mode
+
+The results, with the versions of everything involved, are written out as
+JSON so that runs can be compared between releases.
+
+Created on  2026-10-18 18:14:56
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import sys, os, time, json, shutil, tempfile, platform, resource, traceback
+import multiprocessing
+import datetime
+from contextlib import contextmanager
+
+import sqlalchemy
+from sqlalchemy import event
+
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from dimadb import __version__ as version
+from dimadb import Store, loadPeptideDataFile
+from dimadb.benchmark.generate import writeExport
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+DATABASES = ['memory', 'file']
+MODES = ['row', 'columnar', 'bulk']
+
+
+class StageTimer(object):
+    '''
+    Accumulates wall clock seconds by stage name.  Nested entries into the
+    same stage are only counted once.
+    '''
+
+    def __init__(self):
+        self.seconds = {}
+        self.depth = {}
+
+    @contextmanager
+    def stage(self, name):
+        depth = self.depth.get(name, 0)
+        self.depth[name] = depth + 1
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.depth[name] = depth
+            if depth == 0:
+                self.seconds[name] = self.seconds.get(name, 0.0) + time.time() - start
+
+    def get(self, name):
+        return self.seconds.get(name, 0.0)
+
+
+class TimedStore(Store):
+    '''
+    Store that times its save and write steps with a StageTimer
+    '''
+
+    def __init__(self, *args, **kwargs):
+        Store.__init__(self, *args, **kwargs)
+        self.stagetimer = StageTimer()
+
+    def savePeptideFields(self, *args, **kwargs):
+        with self.stagetimer.stage('save'):
+            return Store.savePeptideFields(self, *args, **kwargs)
+
+    def savePeptideBlock(self, *args, **kwargs):
+        with self.stagetimer.stage('save'):
+            return Store.savePeptideBlock(self, *args, **kwargs)
+
+    def allocateIds(self, *args, **kwargs):
+        with self.stagetimer.stage('write'):
+            return Store.allocateIds(self, *args, **kwargs)
+
+    def writeBatch(self, *args, **kwargs):
+        with self.stagetimer.stage('write'):
+            return Store.writeBatch(self, *args, **kwargs)
+
+    def endBulk(self, *args, **kwargs):
+        with self.stagetimer.stage('bulkload'):
+            return Store.endBulk(self, *args, **kwargs)
+
+
+class StatementCounter(object):
+    '''
+    Counts the statements an engine sends to the database and the rows of
+    parameters they carry (more than one for executemany)
+    '''
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = 0
+        self.rows = 0
+        event.listen(engine, 'before_cursor_execute', self.count)
+
+    def count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+        self.rows += len(parameters) if executemany else 1
+
+    def remove(self):
+        event.remove(self.engine, 'before_cursor_execute', self.count)
+
+
+def peakRss():
+    '''
+    Peak resident set size of this process in kilobytes
+    '''
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss = maxrss / 1024
+    return maxrss
+
+
+def runScenario(filename, database='memory', mode='row', batch_size=1000):
+    '''
+    Loads filename into a new SQLite database (memory or file) in the given
+    mode (row, columnar or bulk) and returns a dictionary of the timings and
+    counts.  Bulk loads into SQLite use raw DBAPI inserts, which the
+    statement counts do not see.
+    '''
+    if database not in DATABASES:
+        raise Exception('Benchmark database must be one of %s, not %s' % (', '.join(DATABASES), database))
+    if mode not in MODES:
+        raise Exception('Benchmark mode must be one of %s, not %s' % (', '.join(MODES), mode))
+
+    tempdir = tempfile.mkdtemp(prefix='dimadb-benchmark-')
+    try:
+        if database == 'memory':
+            connectstring = 'sqlite://'
+        else:
+            connectstring = 'sqlite:///%s' % os.path.join(tempdir, 'benchmark.db')
+        store = TimedStore(connectstring)
+        store.create()
+
+        counter = StatementCounter(store.engine)
+        start = time.time()
+        count = loadPeptideDataFile(
+            store,
+            filename,
+            'benchmark',
+            batch_size=batch_size,
+            bulk=(mode == 'bulk'),
+            columnar=(mode == 'columnar'),
+        )
+        seconds = time.time() - start
+        counter.remove()
+        store.close()
+
+        timer = store.stagetimer
+        result = {
+            'database'          : database,
+            'mode'              : mode,
+            'batch_size'        : batch_size,
+            'peptides'          : count,
+            'seconds'           : seconds,
+            'rows_per_second'   : count / seconds if seconds > 0 else 0.0,
+            'stages'            : {
+                'parse'         : seconds - timer.get('save') - timer.get('bulkload'),
+                'transform'     : timer.get('save') - timer.get('write'),
+                'write'         : timer.get('write') + timer.get('bulkload'),
+            },
+            'statements'        : counter.statements,
+            'statement_rows'    : counter.rows,
+            'peak_rss_kb'       : peakRss(),
+        }
+        return result
+    finally:
+        shutil.rmtree(tempdir, True)
+
+
+def runIsolated(args):
+    '''
+    runScenario for a pool process.  Failures come back as the error message.
+    '''
+    try:
+        return runScenario(*args)
+    except Exception as e:
+        return {'error' : str(e), 'traceback' : traceback.format_exc()}
+
+
+def runBenchmark(filename, databases=DATABASES, modes=MODES, batch_size=1000, repeat=1, isolate=True):
+    '''
+    Runs every database and mode scenario repeat times on filename, each in a
+    new process unless isolate is False.  Columnar scenarios are skipped when
+    numpy is not installed.
+
+    Returns the list of runScenario results.
+    '''
+    results = []
+    for database in databases:
+        for mode in modes:
+            if mode == 'columnar' and numpy is None:
+                continue
+            for i in range(repeat):
+                args = (filename, database, mode, batch_size)
+                if isolate:
+                    pool = multiprocessing.Pool(1)
+                    try:
+                        result = pool.apply(runIsolated, (args,))
+                    finally:
+                        pool.close()
+                        pool.join()
+                else:
+                    result = runScenario(*args)
+                result.update({'database' : database, 'mode' : mode, 'repeat' : i})
+                results.append(result)
+    return results
+
+
+def environment():
+    '''
+    Versions of the things that affect the results
+    '''
+    return {
+        'dimadb'        : version,
+        'python'        : platform.python_version(),
+        'sqlalchemy'    : sqlalchemy.__version__,
+        'sqlite'        : __import__('sqlite3').sqlite_version,
+        'numpy'         : numpy.__version__ if numpy is not None else None,
+        'platform'      : platform.platform(),
+        'created'       : datetime.datetime.now().isoformat(),
+    }
+
+
+def initArgs():
+    '''
+    Setup arguments with parameterdef, check envs, parse commandline, return args
+    '''
+
+    parameterdefs = [
+        {
+            'name'      : 'DIMADB_BENCHMARK_ROWS',
+            'switches'  : ['--rows'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of peptides in the synthetic export',
+            'default'   : 10000,
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_CHANNELS',
+            'switches'  : ['--channels'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of TMT abundance channels',
+            'default'   : 10,
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_MODIFICATION_DENSITY',
+            'switches'  : ['--modification-density'],
+            'required'  : False,
+            'type'      : float,
+            'help'      : 'Mean number of variable modification sites per peptide',
+            'default'   : 1.5,
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_FANOUT',
+            'switches'  : ['--fanout'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of master proteins per peptide',
+            'default'   : 1,
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_SEED',
+            'switches'  : ['--seed'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Random seed for the export',
+            'default'   : 0,
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_EXPORT',
+            'switches'  : ['--export'],
+            'required'  : False,
+            'help'      : 'Benchmark this peptide data file instead of generating one',
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_DATABASES',
+            'switches'  : ['--databases'],
+            'required'  : False,
+            'help'      : 'Comma separated SQLite databases to load into (%s)' % ', '.join(DATABASES),
+            'default'   : ','.join(DATABASES),
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_MODES',
+            'switches'  : ['--modes'],
+            'required'  : False,
+            'help'      : 'Comma separated load modes (%s)' % ', '.join(MODES),
+            'default'   : ','.join(MODES),
+        },
+        {
+            'name'      : 'DIMADB_BATCH_SIZE',
+            'switches'  : ['--batch-size'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of peptides parsed and written per transaction',
+            'default'   : 1000,
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_REPEAT',
+            'switches'  : ['--repeat'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of times to run each scenario',
+            'default'   : 1,
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_OUTPUT',
+            'switches'  : ['--output', '-o'],
+            'required'  : False,
+            'help'      : 'Write the JSON results here instead of to stdout',
+        },
+    ]
+
+    # Check for environment variable values
+    # Set to 'default' if they are found
+    for parameterdef in parameterdefs:
+        if os.environ.get(parameterdef['name'],None) is not None:
+            parameterdef['default'] = os.environ.get(parameterdef['name'])
+
+    # Setup argument parser
+    parser = ArgumentParser(description='Benchmarks peptide data loads into SQLite', formatter_class=RawDescriptionHelpFormatter)
+
+    # Use the parameterdefs for the ArgumentParser
+    for parameterdef in parameterdefs:
+        switches = parameterdef.pop('switches')
+        if not isinstance(switches, list):
+            switches = [switches]
+
+        # Gotta take it off for add_argument
+        name = parameterdef.pop('name')
+        parameterdef['dest'] = name
+        if 'default' in parameterdef:
+            parameterdef['help'] += '  [default: %s]' % parameterdef['default']
+        parser.add_argument(*switches,**parameterdef)
+
+        # Gotta put it back on for later
+        parameterdef['name'] = name
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = initArgs()
+
+    tempdir = tempfile.mkdtemp(prefix='dimadb-benchmark-')
+    try:
+        export = {}
+        filename = args.DIMADB_BENCHMARK_EXPORT
+        if filename is None:
+            export = {
+                'rows'                  : int(args.DIMADB_BENCHMARK_ROWS),
+                'channels'              : int(args.DIMADB_BENCHMARK_CHANNELS),
+                'modification_density'  : float(args.DIMADB_BENCHMARK_MODIFICATION_DENSITY),
+                'fanout'                : int(args.DIMADB_BENCHMARK_FANOUT),
+                'seed'                  : int(args.DIMADB_BENCHMARK_SEED),
+            }
+            filename = os.path.join(tempdir, 'export.txt')
+            start = time.time()
+            writeExport(filename, **export)
+            export['generate_seconds'] = time.time() - start
+        else:
+            export['filename'] = filename
+        export['bytes'] = os.path.getsize(filename)
+
+        results = runBenchmark(
+            filename,
+            [database.strip() for database in args.DIMADB_BENCHMARK_DATABASES.split(',')],
+            [mode.strip() for mode in args.DIMADB_BENCHMARK_MODES.split(',')],
+            int(args.DIMADB_BATCH_SIZE),
+            int(args.DIMADB_BENCHMARK_REPEAT),
+        )
+    except Exception as e:
+        print '%s:\n%s' % (str(e), traceback.format_exc())
+        return 1
+    finally:
+        shutil.rmtree(tempdir, True)
+
+    report = json.dumps({
+        'environment'   : environment(),
+        'export'        : export,
+        'results'       : results,
+    }, indent=2, sort_keys=True)
+    if args.DIMADB_BENCHMARK_OUTPUT:
+        with open(args.DIMADB_BENCHMARK_OUTPUT, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print report
+
+    for result in results:
+        if 'error' in result:
+            sys.stderr.write('%(database)s %(mode)s: %(error)s\n' % result)
+        else:
+            sys.stderr.write('%(database)s %(mode)s: %(peptides)d peptides in %(seconds).2fs (%(rows_per_second).0f rows/s)\n' % result)
+    if any('error' in result for result in results):
+        return 1
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.benchmark.startup - Times how long the package and loader take to start
+
+Each command is run repeat times, each time in a new interpreter, and the
+wall clock seconds are reported with the median and the best.  Along with
+the times each command reports which of HEAVY_MODULES it ended up
+importing.  The loader is run the way it is installed, as a script outside
+of the package, so --version and --help should import none of them.
+
+    python -m dimadb.benchmark.startup --repeat 20 --output startup.json
+
+Created on  2026-10-18 23:14:36
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import sys, os, time, json, shutil, tempfile, subprocess, traceback
+
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+import dimadb
+from dimadb.benchmark.generate import writeExport
+from dimadb.benchmark.run import environment
+
+
+# Modules that are slow to import
+HEAVY_MODULES = ['sqlalchemy', 'numpy', 'pyarrow', 'multiprocessing']
+
+STARTUP_COMMANDS = ['python', 'import', 'version', 'help', 'load']
+
+LOADER = os.path.join(os.path.dirname(os.path.abspath(dimadb.__file__)), 'loader.py')
+
+# Run in each new interpreter.  body is the command and report the file
+# the heavy modules it imported are written to.
+STARTUP_SCRIPT = '''
+import sys
+try:
+%(body)s
+except SystemExit:
+    pass
+with open(%(report)r, 'w') as f:
+    f.write(' '.join([name for name in %(heavy)r if name in sys.modules]))
+'''
+
+LOADER_SCRIPT = '''
+    import runpy
+    sys.argv = %(argv)r
+    runpy.run_path(%(loader)r, run_name='__main__')
+'''
+
+LOAD_SCRIPT = '''
+    import imp
+    loader = imp.load_source('loader', %(loader)r)
+    from dimadb import Store
+    Store(%(connectstring)r).create()
+    loader.loadFiles(%(connectstring)r, [%(filename)r], 'startup')
+'''
+
+
+def commandBody(command, tempdir, filename=None):
+    '''
+    Indented body of STARTUP_SCRIPT for one of STARTUP_COMMANDS
+    '''
+    if command == 'python':
+        return '    pass'
+    if command == 'import':
+        return '    import dimadb'
+    if command in ('version', 'help'):
+        return LOADER_SCRIPT % {'argv' : ['loader.py', '--%s' % command], 'loader' : LOADER}
+    if command == 'load':
+        return LOAD_SCRIPT % {
+            'loader'        : LOADER,
+            'connectstring' : 'sqlite:///%s' % os.path.join(tempdir, 'startup.db'),
+            'filename'      : filename,
+        }
+    raise Exception('Startup command must be one of %s, not %s' % (', '.join(STARTUP_COMMANDS), command))
+
+
+def timeCommand(command, tempdir, filename=None):
+    '''
+    Runs a command in a new interpreter.  Returns (seconds, heavy modules imported).
+    '''
+    report = os.path.join(tempdir, 'modules.txt')
+    database = os.path.join(tempdir, 'startup.db')
+    for path in (report, database):
+        if os.path.exists(path):
+            os.remove(path)
+    script = STARTUP_SCRIPT % {
+        'body'      : commandBody(command, tempdir, filename),
+        'report'    : report,
+        'heavy'     : HEAVY_MODULES,
+    }
+    env = dict(os.environ)
+    packagedir = os.path.dirname(os.path.dirname(os.path.abspath(dimadb.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([packagedir] + [path for path in [env.get('PYTHONPATH')] if path])
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        returncode = subprocess.call([sys.executable, '-c', script], stdout=devnull, stderr=devnull, env=env)
+        seconds = time.time() - start
+    if returncode != 0 or not os.path.exists(report):
+        raise Exception('Startup command %s failed' % command)
+    with open(report, 'r') as f:
+        modules = f.read().split()
+    return seconds, modules
+
+
+def runStartupBenchmark(commands=STARTUP_COMMANDS, repeat=10, rows=100):
+    '''
+    Times each command repeat times.  The load command loads a synthetic
+    export of rows peptides into a new SQLite file.  Returns a dictionary of
+    command name to a dictionary of seconds (every run), median, best and
+    modules.
+    '''
+    tempdir = tempfile.mkdtemp(prefix='dimadb-startup-')
+    try:
+        filename = os.path.join(tempdir, 'export.txt')
+        writeExport(filename, rows=rows)
+        results = {}
+        for command in commands:
+            seconds = []
+            for i in range(repeat):
+                elapsed, modules = timeCommand(command, tempdir, filename)
+                seconds.append(elapsed)
+            ordered = sorted(seconds)
+            results[command] = {
+                'seconds'   : seconds,
+                'median'    : ordered[len(ordered) // 2],
+                'best'      : ordered[0],
+                'modules'   : modules,
+            }
+        return results
+    finally:
+        shutil.rmtree(tempdir, True)
+
+
+def initArgs():
+    '''
+    Setup arguments with parameterdef, check envs, parse commandline, return args
+    '''
+
+    parameterdefs = [
+        {
+            'name'      : 'DIMADB_BENCHMARK_COMMANDS',
+            'switches'  : ['--commands'],
+            'required'  : False,
+            'help'      : 'Comma separated commands to time (%s)' % ', '.join(STARTUP_COMMANDS),
+            'default'   : ','.join(STARTUP_COMMANDS),
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_REPEAT',
+            'switches'  : ['--repeat'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of times to run each command',
+            'default'   : 10,
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_ROWS',
+            'switches'  : ['--rows'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of peptides in the export loaded by the load command',
+            'default'   : 100,
+        },
+        {
+            'name'      : 'DIMADB_BENCHMARK_OUTPUT',
+            'switches'  : ['--output', '-o'],
+            'required'  : False,
+            'help'      : 'Write the JSON results here instead of to stdout',
+        },
+    ]
+
+    # Check for environment variable values
+    # Set to 'default' if they are found
+    for parameterdef in parameterdefs:
+        if os.environ.get(parameterdef['name'],None) is not None:
+            parameterdef['default'] = os.environ.get(parameterdef['name'])
+
+    # Setup argument parser
+    parser = ArgumentParser(description='Times the startup of the package and the loader', formatter_class=RawDescriptionHelpFormatter)
+
+    # Use the parameterdefs for the ArgumentParser
+    for parameterdef in parameterdefs:
+        switches = parameterdef.pop('switches')
+        if not isinstance(switches, list):
+            switches = [switches]
+
+        # Gotta take it off for add_argument
+        name = parameterdef.pop('name')
+        parameterdef['dest'] = name
+        if 'default' in parameterdef:
+            parameterdef['help'] += '  [default: %s]' % parameterdef['default']
+        parser.add_argument(*switches,**parameterdef)
+
+        # Gotta put it back on for later
+        parameterdef['name'] = name
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = initArgs()
+
+    commands = [command.strip() for command in args.DIMADB_BENCHMARK_COMMANDS.split(',')]
+    try:
+        results = runStartupBenchmark(commands, int(args.DIMADB_BENCHMARK_REPEAT), int(args.DIMADB_BENCHMARK_ROWS))
+    except Exception as e:
+        print '%s:\n%s' % (str(e), traceback.format_exc())
+        return 1
+
+    report = json.dumps({
+        'environment'   : environment(),
+        'results'       : results,
+    }, indent=2, sort_keys=True)
+    if args.DIMADB_BENCHMARK_OUTPUT:
+        with open(args.DIMADB_BENCHMARK_OUTPUT, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print report
+
+    for command in commands:
+        result = results[command]
+        sys.stderr.write('%s: median %.3fs, best %.3fs, imports %s\n' % (command, result['median'], result['best'], ', '.join(result['modules']) or 'nothing heavy'))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.cache - Small in-process caches
+
+Created on  2026-10-18 11:20:17
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import time
+from collections import OrderedDict
+
+
+DEFAULT_CACHE_SIZE = 10000
+
+# Seconds a TTLCache entry lives
+DEFAULT_CACHE_TTL = 60
+
+
+class LRUCache(object):
+    '''
+    Bounded least recently used cache with hit / miss counts.  Not thread safe;
+    each process (or thread) is expected to have its own.
+    '''
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        if maxsize < 1:
+            raise Exception('Cache size must be at least 1, not %s' % maxsize)
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        '''
+        Returns the cached value for key, or default, and counts the hit or miss
+        '''
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''
+        Caches value for key, evicting the least recently used entry if full
+        '''
+        self.data.pop(key, None)
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def invalidate(self):
+        '''
+        Empties the cache but keeps the counts
+        '''
+        self.data.clear()
+
+    def clear(self):
+        '''
+        Empties the cache and resets the counts
+        '''
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        '''
+        Returns a dictionary of hits, misses, hitrate, size and maxsize
+        '''
+        lookups = self.hits + self.misses
+        return {
+            'hits'      : self.hits,
+            'misses'    : self.misses,
+            'hitrate'   : float(self.hits) / lookups if lookups else 0.0,
+            'size'      : len(self.data),
+            'maxsize'   : self.maxsize,
+        }
+
+
+class TTLCache(LRUCache):
+    '''
+    LRUCache whose entries expire ttl seconds after they are put, for values
+    that other processes can change.  An expired entry counts as a miss.
+    '''
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, clock=time.time):
+        LRUCache.__init__(self, maxsize)
+        self.ttl = ttl
+        self.clock = clock
+
+    def get(self, key, default=None):
+        '''
+        Returns the cached value for key, or default if it is missing or
+        expired, and counts the hit or miss
+        '''
+        try:
+            expires, value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires <= self.clock():
+            self.misses += 1
+            return default
+        self.data[key] = (expires, value)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''
+        Caches value for key for ttl seconds
+        '''
+        LRUCache.put(self, key, (self.clock() + self.ttl, value))
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.columnar - Column block parsing of peptide data with NumPy
+
+A block of split lines is transposed into per column sequences and every
+numeric column (typed peptide columns, abundances, ratios and search engine
+metrics) is converted in one go into a float64 NumPy array with NaN for
+empty or unparseable values.  Blocks can be checked or summarized before
+anything is written and are saved with Store.savePeptideBlock.
+
+Created on  2026-10-18 14:02:27
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+from columns import toInt, toFloatOrNone, fingerprintFields
+from records import PeptideRecord
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Peptide column converters that are parsed as numbers
+NUMERIC_CONVERTERS = (toInt, float)
+
+
+def toFloatArray(values):
+    '''
+    Converts a sequence of strings to a float64 array.  Empty strings become
+    NaN.  If anything else does not parse (e.g. n/a) the column is converted
+    value by value and those become NaN too.
+    '''
+    if len(values) == 0:
+        return numpy.empty(0, dtype=numpy.float64)
+    strings = numpy.array(values)
+    strings = numpy.where(strings == '', 'nan', strings)
+    try:
+        return strings.astype(numpy.float64)
+    except ValueError:
+        converted = [toFloatOrNone(v) for v in values]
+        return numpy.array([numpy.nan if v is None else v for v in converted], dtype=numpy.float64)
+
+
+def floatList(array):
+    '''
+    Python floats from a float array with None for NaN
+    '''
+    return [None if v != v else v for v in array.tolist()]
+
+
+def intList(array):
+    '''
+    Python ints from a float array with None for NaN
+    '''
+    return [None if v != v else int(v) for v in array.tolist()]
+
+
+class ColumnBlock(object):
+    '''
+    A block of peptide data lines in columns.
+
+    plan        the ColumnPlan of the file
+    strings     list of the string values of each column, indexed like the header
+    numeric     float64 arrays by column index for the numeric columns in the plan
+    fingerprints    content fingerprint of each line (see columns.fingerprintFields)
+
+    numeric arrays that are already known, e.g. read from a typed column of
+    an Arrow file, can be passed in by column index and are used as they
+    are rather than converted from the strings.
+    '''
+
+    def __init__(self, plan, fieldlists, numeric=None):
+        if numpy is None:
+            raise Exception('numpy is required for columnar parsing')
+        self.plan = plan
+        self.size = len(fieldlists)
+        self.fingerprints = [fingerprintFields(fields) for fields in fieldlists]
+        self.strings = [list(column) for column in zip(*[plan.pad(fields)[:plan.width] for fields in fieldlists])]
+        if not self.strings:
+            self.strings = [[] for header in plan.headers]
+
+        numericindices = set([index for index, column, converter, empty in plan.peptidecolumns if converter in NUMERIC_CONVERTERS])
+        numericindices.update([index for index, name in plan.abundances])
+        numericindices.update([index for index, name in plan.ratios])
+        numericindices.update([index for index, name in plan.matchdata])
+        if numeric is None:
+            numeric = {}
+        self.numeric = dict(
+            (index, numeric[index] if index in numeric else toFloatArray(self.strings[index])) for index in numericindices
+        )
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        '''
+        Pickled blocks, e.g. sent back by splitter parse workers, leave out
+        the strings of the abundance and ratio columns, which are only used
+        through numeric once the block is built.  That halves the pickle.
+        '''
+        state = dict(self.__dict__)
+        dropped = set([index for index, name in self.plan.abundances + self.plan.ratios])
+        state['strings'] = [None if index in dropped else column for index, column in enumerate(self.strings)]
+        return state
+
+    def value(self, row, index):
+        '''
+        String value of a column for a row, or None if the column is missing or empty
+        '''
+        if index is None:
+            return None
+        v = self.strings[index][row]
+        if v == '':
+            return None
+        return v
+
+    def datasetValue(self, row):
+        '''
+        Dataset of a row
+        '''
+        if self.plan.dataset is None:
+            return self.plan.defaultdataset
+        return self.value(row, self.plan.dataset)
+
+    def peptideRows(self, peptide_ids):
+        '''
+        PeptideRecords of the typed peptide table values for the block with the given ids
+        '''
+        constants = self.plan.peptideconstants
+        rows = [
+            PeptideRecord(id=peptide_id, fingerprint=fingerprint, **constants)
+            for peptide_id, fingerprint in zip(peptide_ids, self.fingerprints)
+        ]
+        for index, column, converter, empty in self.plan.peptidecolumns:
+            if converter is toInt:
+                values = intList(self.numeric[index])
+            elif converter is float:
+                values = floatList(self.numeric[index])
+            else:
+                values = [converter(v) if v != '' else None for v in self.strings[index]]
+            for row, v in zip(rows, values):
+                setattr(row, column, empty if v is None else v)
+        return rows
+
+    def summary(self):
+        '''
+        Returns a dictionary of (count, missing, min, max, mean) by header for the numeric columns
+        '''
+        result = {}
+        for index, values in self.numeric.items():
+            present = values[~numpy.isnan(values)]
+            if len(present):
+                stats = (len(values), len(values) - len(present), present.min(), present.max(), present.mean())
+            else:
+                stats = (len(values), len(values), None, None, None)
+            result[self.plan.headers[index]] = stats
+        return result
+
+
+def parseBlock(plan, fieldlists, numeric=None):
+    '''
+    Returns a ColumnBlock for a list of split lines described by plan
+    '''
+    return ColumnBlock(plan, fieldlists, numeric)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.columns - Header level column plans for peptide data files
+
+A ColumnPlan is compiled once from the header line of a file.  It maps
+column indices straight to the tables and fields they feed, so per row work
+is index lookups on the split line instead of building and scanning
+dictionaries keyed by the full header strings.
+
+Created on  2026-10-18 10:03:41
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import hashlib
+
+from records import PeptideRecord
+
+
+def toInt(v):
+    '''
+    int conversion that tolerates values written as floats, e.g. 1.0
+    '''
+    try:
+        return int(v)
+    except ValueError:
+        return int(float(v))
+
+
+def toFloatOrNone(v):
+    '''
+    float conversion that returns None for things like n/a
+    '''
+    try:
+        return float(v)
+    except ValueError:
+        return None
+
+
+def fingerprintFields(fields):
+    '''
+    Content fingerprint of a split line.  Trailing empty fields are ignored so
+    that padded and unpadded lines match.
+    '''
+    return hashlib.sha1('\t'.join(fields).rstrip('\t')).hexdigest()
+
+
+def toBoolean(v):
+    '''
+    Proteome Discoverer writes booleans as TRUE / FALSE
+    '''
+    return v == 'TRUE'
+
+
+# Peptide table columns as (header, column name, converter, value when empty)
+PEPTIDE_COLUMNS = [
+    ('Confidence',                          'confidence',                       str,        None),
+    ('Annotated Sequence',                  'annotated_sequence',               str,        None),
+    ('Modifications',                       'modifications',                    str,        None),
+    ('Modifications in Master Proteins',    'modifications_in_master_proteins', str,        None),
+    ('# Protein Groups',                    'no_protein_groups',                toInt,      None),
+    ('# Proteins',                          'no_proteins',                      toInt,      None),
+    ('# PSMs',                              'no_psms',                          toInt,      None),
+    ('Master Protein Accessions',           'master_protein_accessions',        str,        None),
+    ('Positions in Master Proteins',        'positions_in_master_proteins',     str,        None),
+    ('# Missed Cleavages',                  'no_missed_cleavages',              toInt,      None),
+    ('Theo. MH+ [Da]',                      'theo_mh_da',                       float,      None),
+    ('Contaminant',                         'contaminant',                      toBoolean,  False),
+    ('Off by X',                            'off_by_x',                         toInt,      None),
+    ('Position in Protein',                 'position_in_protein',              toInt,      None),
+    ('dataset',                             'dataset',                          str,        None),
+]
+
+# Header prefix of the TMT channel abundance columns, e.g. Abundances (Grouped): 127N
+ABUNDANCE_PREFIX = 'Abundances (Grouped): '
+
+# Header prefix of the channel ratio columns, e.g. Abundance Ratio: (127N) / (126)
+RATIO_PREFIX = 'Abundance Ratio: '
+
+# Marker for the per search engine metric columns that go to peptide_seq_match_data
+SEARCH_ENGINE_MARKER = '(by Search Engine)'
+
+
+class ColumnPlan(object):
+    '''
+    Column index map for one header line.
+
+    peptidecolumns  list of (index, column name, converter, empty value) for the peptide table
+    abundances      list of (index, channel name)
+    abundancechannels
+                    tuple of the abundance channel names, shared by the plan's AbundanceRecords
+    ratios          list of (index, ratio name), e.g. 127N/126
+    matchdata       list of (index, metric name) for the search engine columns
+    dataset, confidence, sequence, modifications, positions
+                    indices of the columns the child tables and peptide keys are derived from, or None
+    '''
+
+    def __init__(self, headers, dataset=None):
+        self.headers = list(headers)
+        self.width = len(self.headers)
+
+        indices = {}
+        for index, header in enumerate(self.headers):
+            indices.setdefault(header, index)
+
+        # Columns that are missing from the file are constant for every row
+        self.peptidecolumns = []
+        self.peptideconstants = {}
+        for header, column, converter, empty in PEPTIDE_COLUMNS:
+            if header in indices:
+                self.peptidecolumns.append((indices[header], column, converter, empty))
+            else:
+                self.peptideconstants[column] = empty
+        if 'dataset' not in indices:
+            self.peptideconstants['dataset'] = dataset
+
+        self.abundances = []
+        self.ratios = []
+        self.matchdata = []
+        for index, header in enumerate(self.headers):
+            if header.startswith(ABUNDANCE_PREFIX):
+                name = header[len(ABUNDANCE_PREFIX):].split(' ')[0]
+                self.abundances.append((index, name))
+            elif header.startswith(RATIO_PREFIX):
+                name = ''.join([c for c in header[len(RATIO_PREFIX):] if c not in '() '])
+                self.ratios.append((index, name))
+            elif SEARCH_ENGINE_MARKER in header:
+                self.matchdata.append((index, header))
+        self.abundancechannels = tuple(name for index, name in self.abundances)
+
+        self.dataset = indices.get('dataset')
+        self.defaultdataset = dataset
+        self.confidence = indices.get('Confidence')
+        self.sequence = indices.get('Annotated Sequence')
+        self.modifications = indices.get('Modifications')
+        self.positions = indices.get('Positions in Master Proteins')
+
+    def pad(self, fields):
+        '''
+        Short lines are padded with empty values so that every index in the plan is valid
+        '''
+        if len(fields) < self.width:
+            fields = fields + [''] * (self.width - len(fields))
+        return fields
+
+    def value(self, fields, index):
+        '''
+        Value at index, or None if the column is missing or empty
+        '''
+        if index is None:
+            return None
+        v = fields[index]
+        if v == '':
+            return None
+        return v
+
+    def datasetValue(self, fields):
+        '''
+        Dataset of the split line
+        '''
+        if self.dataset is None:
+            return self.defaultdataset
+        return self.value(fields, self.dataset)
+
+    def peptideKey(self, fields):
+        '''
+        (dataset, annotated sequence, modifications) of the split line, which
+        identifies a peptide within a dataset
+        '''
+        return (self.datasetValue(fields), self.value(fields, self.sequence), self.value(fields, self.modifications))
+
+    def peptideRow(self, fields):
+        '''
+        PeptideRecord of the typed peptide table values for one split line
+        '''
+        row = PeptideRecord(**self.peptideconstants)
+        for index, column, converter, empty in self.peptidecolumns:
+            v = fields[index]
+            if v == '':
+                setattr(row, column, empty)
+            else:
+                setattr(row, column, converter(v))
+        return row
+
+
+# Plans for dictionaries of peptide data, keyed by the tuple of keys
+_dictplans = {}
+MAX_DICT_PLANS = 100
+
+
+def planForDict(peptidedata):
+    '''
+    Returns a (ColumnPlan, fields) pair for a peptide data dictionary keyed by header.
+    Plans are cached by key set since every row of a file has the same keys.
+    '''
+    headers = tuple(peptidedata.keys())
+    plan = _dictplans.get(headers)
+    if plan is None:
+        if len(_dictplans) >= MAX_DICT_PLANS:
+            _dictplans.clear()
+        plan = ColumnPlan(headers)
+        _dictplans[headers] = plan
+    return plan, peptidedata.values()
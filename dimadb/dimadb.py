@@ -11,16 +11,131 @@ Created on  2017-03-31 14:52:41
 @license: GPL v2.0
 '''
 import sys, os
-import logging 
+import logging
+from reader import openReader, fileHash, DEFAULT_BATCH_SIZE
+from store import LoadCheckpoint, LOAD_RUNNING, LOAD_COMPLETE, LOAD_FAILED
+from columns import ColumnPlan, fingerprintFields
 
-logging.basicConfig(format='%(asctime)s: %(message)s',level=logging.DEBUG)
+# Configured by the command line tools (see loader.initLogging), not on import
 logger = logging.getLogger()
-logger.setLevel(logging.getLevelName(os.environ.get('DIMADB_LOGLEVEL','DEBUG')))
 
 
-def loadPeptideDataFile(store, filename, dataset=None):
+def loadPeptideDataFile(store, filename, dataset=None, batch_size=DEFAULT_BATCH_SIZE, bulk=False, columnar=False, resume=False, format=None, parse_workers=1):
     '''
-    Load standard peptide data file
+    Load standard peptide data file.  Lines are streamed through the reader
+    stages and written batch_size peptides at a time, so no more than one
+    batch of records is held in memory.  The header is compiled into a
+    ColumnPlan once and every line is handled as a list of fields.
+
+    The file is read with the reader.openReader reader for format, which
+    defaults to the one for the file extension.  Parquet and Arrow files are
+    always loaded columnar, with the numeric columns taken from their typed
+    arrays.  With parse_workers more than 1 (None for one per CPU), tab
+    separated files are split into byte ranges that are parsed by that many
+    processes (see splitter), while this one writes.
+
+    With bulk, the batches are written to staging files and loaded with the
+    database native bulk loader at the end (see Store.beginBulk).
+
+    With columnar, each batch is parsed into a columnar.ColumnBlock, with the
+    numeric columns converted by NumPy, and saved with Store.savePeptideBlock.
+
+    With resume, the load is tracked in a load_job row keyed by dataset and
+    file hash.  Each batch commit also records the byte offset reached, so a
+    load of the same file that was interrupted starts again from there, and
+    a file that was loaded completely is skipped (for Parquet and Arrow
+    files the offset is a row number).  Lines whose content
+    fingerprint is already stored in the dataset are skipped as well, e.g.
+    the leading rows of a file that was re-exported with more data.
+
+    If the Store is instrumented (see Store.instrument), parsing is timed
+    too and progress lines are logged as batches are written.
+
+    Returns the number of peptides loaded.
+    '''
+    if not os.path.exists(filename):
+        raise Exception('File %s does not exist.' % filename)
+
+    if dataset is None:
+        dataset = os.path.basename(filename)
+
+    job_id = None
+    offset = 0
+    if resume:
+        file_hash = fileHash(filename)
+        job = store.findLoadJob(dataset, file_hash)
+        if job is not None and job.status == LOAD_COMPLETE:
+            logger.info('%s was already loaded into %s' % (filename, dataset))
+            return 0
+        if job is not None:
+            job_id = job.id
+            offset = job.byte_offset
+            logger.info('Resuming load of %s at byte %d after %d peptides' % (filename, offset, job.rows_committed))
+            store.updateLoadJob(job_id, status=LOAD_RUNNING)
+        else:
+            job_id = store.createLoadJob(dataset, filename, file_hash, os.path.getsize(filename))
+
+    if bulk:
+        store.beginBulk()
+
+    count = 0
+    instrumentation = store.instrumentation
+    if instrumentation is not None:
+        instrumentation.startProgress(filename, count, offset)
+    try:
+        with openReader(filename, format, parse_workers) as reader:
+            if offset:
+                reader.seek(offset)
+            plan = ColumnPlan(reader.headers, dataset)
+            columnar = columnar or reader.typed
+            # Resumed loads skip stored lines, so they need the lines rather than blocks
+            batches = reader.batches(batch_size, plan if columnar and job_id is None else None)
+            if instrumentation is not None:
+                batches = instrumentation.timedIter('parse', batches)
+            for batch in batches:
+                checkpoint = None
+                if job_id is not None:
+                    batch = store.skipStoredPeptides(plan, batch)
+                    checkpoint = LoadCheckpoint(job_id, reader.position)
+                if columnar:
+                    with store.timer('parseBlock'):
+                        block = reader.block(plan, batch)
+                    count += store.savePeptideBlock(block, checkpoint)
+                else:
+                    count += store.savePeptideFields(plan, batch, checkpoint)
+                if instrumentation is not None:
+                    instrumentation.progress(filename, count, reader.position, reader.size)
+        if bulk:
+            store.endBulk()
+        if instrumentation is not None:
+            instrumentation.progress(filename, count, reader.position, reader.size, final=True)
+        if job_id is not None:
+            values = dict(status=LOAD_COMPLETE, byte_offset=reader.position)
+            if bulk:
+                values['rows_committed'] = count
+            store.updateLoadJob(job_id, **values)
+    except Exception:
+        if bulk:
+            store.abortBulk()
+        if job_id is not None:
+            store.updateLoadJob(job_id, status=LOAD_FAILED)
+        raise
+    return count
+
+
+def updatePeptideDataFile(store, filename, dataset=None, batch_size=DEFAULT_BATCH_SIZE, format=None):
+    '''
+    Brings the stored peptides of a dataset in line with a new export of it,
+    writing only what changed.  Peptides are matched on dataset, annotated
+    sequence and modifications (ColumnPlan.peptideKey) and compared by
+    content fingerprint.  New peptides are inserted, changed ones are
+    replaced along with their child rows, keeping their ids, and peptides
+    of the dataset that are no longer in the file are deleted.
+
+    If the file has a dataset column, each dataset that appears in it is
+    updated.  format is as for loadPeptideDataFile.
+
+    Returns a dictionary of inserted, updated, deleted and unchanged peptide counts.
     '''
     if not os.path.exists(filename):
         raise Exception('File %s does not exist.' % filename)
@@ -28,22 +143,45 @@ def loadPeptideDataFile(store, filename, dataset=None):
     if dataset is None:
         dataset = os.path.basename(filename)
 
-    headers = []
-    with open(filename,'r') as f:
-        peptidedata = {}
-        for line in f:
-            line = line.strip()
-            if line == '':
-                continue
-            if len(headers) == 0:
-                headers = line.split('\t')
-                continue
-
-            peptidedata = dict(zip(headers,line.split('\t')))
-            if 'dataset' not in peptidedata:
-                peptidedata['dataset'] = dataset
-
-            store.savePeptideData(peptidedata)
+    counts = dict.fromkeys(['inserted', 'updated', 'deleted', 'unchanged'], 0)
+
+    # Peptides of each dataset that have not been matched yet
+    unmatched = {}
+    with openReader(filename, format) as reader:
+        plan = ColumnPlan(reader.headers, dataset)
+        if plan.dataset is None:
+            unmatched[dataset] = store.storedPeptides(dataset)
+        for batch in reader.batches(batch_size):
+            inserts = []
+            changes = []
+            changed_ids = []
+            for fields in batch:
+                fields = plan.pad(fields)
+                key = plan.peptideKey(fields)
+                if key[0] not in unmatched:
+                    unmatched[key[0]] = store.storedPeptides(key[0])
+                matches = unmatched[key[0]].get(key)
+                if not matches:
+                    inserts.append(fields)
+                    continue
+                peptide_id, fingerprint = matches.pop(0)
+                if fingerprint == fingerprintFields(fields):
+                    counts['unchanged'] += 1
+                else:
+                    changes.append(fields)
+                    changed_ids.append(peptide_id)
+            counts['inserted'] += store.savePeptideFields(plan, inserts)
+            counts['updated'] += store.savePeptideFields(plan, changes, peptide_ids=changed_ids)
+
+    removed = [
+        peptide_id
+        for stored in unmatched.values()
+        for matches in stored.values()
+        for peptide_id, fingerprint in matches
+    ]
+    store.deletePeptides(removed)
+    counts['deleted'] = len(removed)
+    return counts
 
 
 def main():
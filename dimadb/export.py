@@ -0,0 +1,477 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.export - Columnar export of a dataset for analysis
+
+Writes a dataset as one wide table with a row per peptide: the peptide
+columns, a float column per abundance channel (abundance_<channel>) and
+ratio (ratio_<ratio>, matrix layout only), and list columns of the
+modifications and seq matches, e.g.
+
+    python -m dimadb.export --database dimadb --dataset run42 run42.parquet
+
+The peptides and each child table are streamed in peptide id order from
+server side cursors and merged a peptide at a time, so only chunk_size
+peptides are held in memory.  Each chunk becomes a Parquet row group (or
+an Arrow record batch).  Arrow files can be memory mapped and read without
+copying; see openExport.
+
+Needs pyarrow.
+
+Created on  2026-10-18 19:41:26
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import sys, os, traceback, itertools
+import logging
+
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from sqlalchemy import select, types
+
+from query import streamQuery, datasetIdQuery
+from store import Store, CHANNEL_ABUNDANCE, CHANNEL_RATIO
+from options import connectString
+
+try:
+    import numpy
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+logger = logging.getLogger()
+
+# Export formats.  parquet is compressed and readable by most analysis
+# tools, arrow is the uncompressed Arrow IPC file format, which can be
+# memory mapped and read without copying.
+EXPORT_PARQUET = 'parquet'
+EXPORT_ARROW = 'arrow'
+EXPORT_FORMATS = [EXPORT_PARQUET, EXPORT_ARROW]
+
+# Peptides per row group / record batch
+DEFAULT_EXPORT_CHUNK_SIZE = 10000
+
+# List columns as (column name, child table, child column)
+LIST_COLUMNS = [
+    ('modification_types',  'peptide_modification', 'mod_type'),
+    ('modification_sites',  'peptide_modification', 'loc_str'),
+    ('match_accessions',    'peptide_seq_match',    'accession'),
+    ('match_starts',        'peptide_seq_match',    'start'),
+    ('match_ends',          'peptide_seq_match',    'end'),
+    ('match_confidences',   'peptide_seq_match',    'confidence'),
+]
+
+
+def checkPyarrow():
+    if pyarrow is None:
+        raise Exception('pyarrow is required to export datasets')
+
+
+def exportFormat(path):
+    '''
+    Format for an export file name, from its extension
+    '''
+    if os.path.splitext(path)[1].lower() in ('.arrow', '.feather', '.ipc'):
+        return EXPORT_ARROW
+    return EXPORT_PARQUET
+
+
+def arrowType(column):
+    '''
+    Arrow type for a SQLAlchemy table column
+    '''
+    if isinstance(column.type, types.Boolean):
+        return pyarrow.bool_()
+    if isinstance(column.type, types.Integer):
+        return pyarrow.int64()
+    if isinstance(column.type, types.Float):
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+class GroupedRows(object):
+    '''
+    Rows of a query ordered by peptide_id, taken a peptide at a time.  The
+    peptide ids must be asked for in increasing order.
+    '''
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.groups = itertools.groupby(rows, key=lambda row: row.peptide_id)
+        self.peptide_id = None
+        self.current = []
+        self.advance()
+
+    def advance(self):
+        try:
+            self.peptide_id, current = next(self.groups)
+            self.current = list(current)
+        except StopIteration:
+            self.peptide_id = None
+            self.current = []
+
+    def take(self, peptide_id):
+        '''
+        Rows of peptide_id, an empty list if it has none
+        '''
+        while self.peptide_id is not None and self.peptide_id < peptide_id:
+            self.advance()
+        if self.peptide_id != peptide_id:
+            return []
+        rows = self.current
+        self.advance()
+        return rows
+
+    def close(self):
+        self.rows.close()
+
+
+class DatasetExporter(object):
+    '''
+    Streams a dataset out of a Store into Arrow record batches.  Abundances
+    come from peptide_abundance_vector, which also has the ratios, if the
+    dataset has rows there and from peptide_abundance otherwise, whatever
+    the Store's layout.
+    '''
+
+    def __init__(self, store, dataset, chunk_size=DEFAULT_EXPORT_CHUNK_SIZE):
+        checkPyarrow()
+        self.store = store
+        self.dataset = dataset
+        self.chunk_size = chunk_size
+        self.vectors = self.storedVectors()
+        self.peptidecolumns = list(store.tables['peptide'].columns)
+        self.channels = self.datasetChannels()
+
+        fields = [pyarrow.field(column.name, arrowType(column)) for column in self.peptidecolumns]
+        fields += [pyarrow.field(name, pyarrow.float64()) for channel_id, name in self.channels]
+        for name, tablename, columnname in LIST_COLUMNS:
+            if columnname in ('start', 'end'):
+                fields.append(pyarrow.field(name, pyarrow.list_(pyarrow.int64())))
+            else:
+                fields.append(pyarrow.field(name, pyarrow.list_(pyarrow.string())))
+        self.schema = pyarrow.schema(fields)
+
+    def storedVectors(self):
+        '''
+        True if the dataset's abundances are in peptide_abundance_vector,
+        that is it was loaded with the matrix or both layout
+        '''
+        tables = self.store.tables
+        dataset_id = datasetIdQuery(self.store, self.dataset)
+        connection = self.store.connection
+        for tablename in ('peptide_abundance_vector', 'peptide_abundance'):
+            table = tables[tablename]
+            if connection.execute(select([table.c.peptide_id]).where(table.c.dataset_id == dataset_id).limit(1)).first() is not None:
+                return tablename == 'peptide_abundance_vector'
+        # No abundances at all
+        return False
+
+    def datasetChannels(self):
+        '''
+        (channel id, column name) of the abundance and ratio channels stored
+        for the dataset, abundances first, each kind in name order
+        '''
+        tables = self.store.tables
+        channel = tables['abundance_channel']
+        connection = self.store.connection
+        if self.vectors:
+            vector = tables['peptide_abundance_vector']
+            channel_ids = set()
+            for row in connection.execute(
+                select([vector.c.channel_ids]).where(vector.c.dataset == self.dataset).distinct()
+            ):
+                channel_ids.update(int(channel_id) for channel_id in numpy.frombuffer(row.channel_ids, dtype='<i4'))
+        else:
+            abundance = tables['peptide_abundance']
+            channel_ids = set(row[0] for row in connection.execute(
+                select([abundance.c.channel_id])
+                .where(abundance.c.dataset_id == datasetIdQuery(self.store, self.dataset))
+                .distinct()
+            ))
+        rows = [
+            row for row in connection.execute(select([channel.c.id, channel.c.name, channel.c.kind]))
+            if row.id in channel_ids
+        ]
+        kinds = [CHANNEL_ABUNDANCE, CHANNEL_RATIO]
+        rows.sort(key=lambda row: (kinds.index(row.kind) if row.kind in kinds else len(kinds), row.name))
+        return [(row.id, '%s_%s' % (row.kind, row.name)) for row in rows]
+
+    def childQueries(self):
+        '''
+        Queries for the abundance, modification and seq match rows of the
+        dataset, each ordered by peptide_id
+        '''
+        tables = self.store.tables
+        dataset_id = datasetIdQuery(self.store, self.dataset)
+        modification = tables['peptide_modification']
+        modtype = tables['modification_type']
+        seqmatch = tables['peptide_seq_match']
+        acc = tables['accession']
+
+        if self.vectors:
+            vector = tables['peptide_abundance_vector']
+            abundances = select([vector.c.peptide_id, vector.c.channel_ids, vector.c.vals]) \
+                .where(vector.c.dataset == self.dataset) \
+                .order_by(vector.c.peptide_id)
+        else:
+            abundance = tables['peptide_abundance']
+            abundances = select([abundance.c.peptide_id, abundance.c.channel_id, abundance.c.val]) \
+                .where(abundance.c.dataset_id == dataset_id) \
+                .order_by(abundance.c.peptide_id)
+
+        modifications = select([modification.c.peptide_id, modtype.c.name.label('mod_type'), modification.c.loc_str]) \
+            .select_from(modification.join(modtype, modtype.c.id == modification.c.mod_type_id)) \
+            .where(modification.c.dataset_id == dataset_id) \
+            .order_by(modification.c.peptide_id, modification.c.id)
+
+        seqmatches = select([
+                seqmatch.c.peptide_id,
+                acc.c.name.label('accession'),
+                seqmatch.c.start,
+                seqmatch.c.end,
+                seqmatch.c.confidence,
+            ]) \
+            .select_from(seqmatch.outerjoin(acc, acc.c.id == seqmatch.c.accession_id)) \
+            .where(seqmatch.c.dataset_id == dataset_id) \
+            .order_by(seqmatch.c.peptide_id, seqmatch.c.id)
+
+        return {
+            'abundances'            : abundances,
+            'peptide_modification'  : modifications,
+            'peptide_seq_match'     : seqmatches,
+        }
+
+    def channelValues(self, rows):
+        '''
+        Dictionary of channel id to value for the abundance rows of a peptide.
+        Missing (NaN) values are left out.
+        '''
+        values = {}
+        if self.vectors:
+            for row in rows:
+                ids = numpy.frombuffer(row.channel_ids, dtype='<i4')
+                vals = numpy.frombuffer(row.vals, dtype='<f8')
+                for channel_id, val in zip(ids, vals):
+                    if val == val:
+                        values[int(channel_id)] = float(val)
+        else:
+            for row in rows:
+                values[row.channel_id] = float(row.val)
+        return values
+
+    def batches(self):
+        '''
+        Yields a pyarrow.RecordBatch for every chunk_size peptides
+        '''
+        peptide = self.store.tables['peptide']
+        peptides = streamQuery(
+            self.store,
+            select([peptide]).where(peptide.c.dataset == self.dataset).order_by(peptide.c.id),
+            self.chunk_size,
+        )
+        children = {}
+        try:
+            for name, query in self.childQueries().items():
+                children[name] = GroupedRows(streamQuery(self.store, query, self.chunk_size))
+            chunk = []
+            for row in peptides:
+                chunk.append(row)
+                if len(chunk) == self.chunk_size:
+                    yield self.recordBatch(chunk, children)
+                    chunk = []
+            if chunk:
+                yield self.recordBatch(chunk, children)
+        finally:
+            peptides.close()
+            for grouped in children.values():
+                grouped.close()
+
+    def recordBatch(self, peptides, children):
+        columns = dict((field.name, []) for field in self.schema)
+        for row in peptides:
+            for column in self.peptidecolumns:
+                columns[column.name].append(row[column])
+            values = self.channelValues(children['abundances'].take(row.id))
+            for channel_id, name in self.channels:
+                columns[name].append(values.get(channel_id))
+            rows = {}
+            for tablename in ('peptide_modification', 'peptide_seq_match'):
+                rows[tablename] = children[tablename].take(row.id)
+            for name, tablename, columnname in LIST_COLUMNS:
+                columns[name].append([child[columnname] for child in rows[tablename]])
+        arrays = [pyarrow.array(columns[field.name], type=field.type) for field in self.schema]
+        return pyarrow.RecordBatch.from_arrays(arrays, self.schema.names)
+
+
+def exportDataset(store, dataset, path, format=EXPORT_PARQUET, chunk_size=DEFAULT_EXPORT_CHUNK_SIZE):
+    '''
+    Writes the dataset to path as a format (EXPORT_PARQUET or EXPORT_ARROW)
+    file with a row per peptide.  Returns the number of peptides written.
+    '''
+    if format not in EXPORT_FORMATS:
+        raise Exception('Export format must be one of %s, not %s' % (', '.join(EXPORT_FORMATS), format))
+    exporter = DatasetExporter(store, dataset, chunk_size)
+    count = 0
+    if format == EXPORT_PARQUET:
+        writer = pyarrow.parquet.ParquetWriter(path, exporter.schema)
+        try:
+            for batch in exporter.batches():
+                writer.write_table(pyarrow.Table.from_batches([batch], exporter.schema))
+                count += batch.num_rows
+        finally:
+            writer.close()
+    else:
+        sink = pyarrow.OSFile(path, 'wb')
+        try:
+            writer = pyarrow.RecordBatchFileWriter(sink, exporter.schema)
+            for batch in exporter.batches():
+                writer.write_batch(batch)
+                count += batch.num_rows
+            writer.close()
+        finally:
+            sink.close()
+    logger.info('Exported %d peptides of %s to %s' % (count, dataset, path))
+    return count
+
+
+def openExport(path, format=None):
+    '''
+    Returns the pyarrow.Table of an export file, memory mapped rather than
+    read into memory.  Arrow files are used in place without copying.  The
+    format comes from the file extension if it is not given.
+    '''
+    checkPyarrow()
+    if format is None:
+        format = exportFormat(path)
+    if format == EXPORT_ARROW:
+        return pyarrow.ipc.open_file(pyarrow.memory_map(path, 'r')).read_all()
+    return pyarrow.parquet.read_table(path, memory_map=True)
+
+
+def initArgs():
+    '''
+    Setup arguments with parameterdef, check envs, parse commandline, return args
+    '''
+
+    parameterdefs = [
+        {
+            'name'      : 'DIMADB_LOGLEVEL',
+            'switches'  : ['--loglevel'],
+            'required'  : False,
+            'help'      : 'Log level (e.g. DEBUG, INFO)',
+            'default'   : 'INFO',
+        },
+        {
+            'name'      : 'DIMADB_DRIVER',
+            'switches'  : ['--driver'],
+            'required'  : False,
+            'help'      : 'Database connection driver (e.g. mysql+mysqldb, or sqlite for a database file).  See SQLAlchemy docs.',
+            'default'   : 'mysql+mysqldb',
+        },
+        {
+            'name'      : 'DIMADB_USER',
+            'switches'  : ['--user'],
+            'required'  : False,
+            'help'      : 'Database user',
+        },
+        {
+            'name'      : 'DIMADB_PASSWORD',
+            'switches'  : ['--password'],
+            'required'  : False,
+            'help'      : 'Database password',
+        },
+        {
+            'name'      : 'DIMADB_HOST',
+            'switches'  : ['--host'],
+            'required'  : False,
+            'help'      : 'Database hostname',
+        },
+        {
+            'name'      : 'DIMADB_DATABASE',
+            'switches'  : ['--database'],
+            'required'  : False,
+            'help'      : 'Database name, or the path of the file for SQLite',
+        },
+        {
+            'name'      : 'DIMADB_DATASET',
+            'switches'  : ['--dataset'],
+            'required'  : True,
+            'help'      : 'Dataset to export',
+        },
+        {
+            'name'      : 'DIMADB_EXPORT_FORMAT',
+            'switches'  : ['--format'],
+            'required'  : False,
+            'choices'   : EXPORT_FORMATS,
+            'help'      : 'Output format.  By default arrow for .arrow, .feather and .ipc files and parquet otherwise.',
+        },
+        {
+            'name'      : 'DIMADB_CHUNK_SIZE',
+            'switches'  : ['--chunk-size'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Peptides per row group',
+            'default'   : DEFAULT_EXPORT_CHUNK_SIZE,
+        },
+    ]
+
+    # Check for environment variable values
+    # Set to 'default' if they are found
+    for parameterdef in parameterdefs:
+        if os.environ.get(parameterdef['name'],None) is not None:
+            parameterdef['default'] = os.environ.get(parameterdef['name'])
+            parameterdef['required'] = False
+
+    # Setup argument parser
+    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('OUTPUT',help='Export file')
+
+    # Use the parameterdefs for the ArgumentParser
+    for parameterdef in parameterdefs:
+        switches = parameterdef.pop('switches')
+        if not isinstance(switches, list):
+            switches = [switches]
+
+        # Gotta take it off for add_argument
+        name = parameterdef.pop('name')
+        parameterdef['dest'] = name
+        if 'default' in parameterdef:
+            parameterdef['help'] += '  [default: %s]' % parameterdef['default']
+        parser.add_argument(*switches,**parameterdef)
+
+        # Gotta put it back on for later
+        parameterdef['name'] = name
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = initArgs()
+    logging.basicConfig(format='%(asctime)s: %(message)s')
+    logger.setLevel(logging.getLevelName(args.DIMADB_LOGLEVEL))
+
+    connectstring = connectString(
+        args.DIMADB_DRIVER,
+        args.DIMADB_USER,
+        args.DIMADB_PASSWORD,
+        args.DIMADB_HOST,
+        args.DIMADB_DATABASE,
+    )
+    format = args.DIMADB_EXPORT_FORMAT or exportFormat(args.OUTPUT)
+    try:
+        with Store(connectstring) as store:
+            count = exportDataset(store, args.DIMADB_DATASET, args.OUTPUT, format, int(args.DIMADB_CHUNK_SIZE))
+    except Exception as e:
+        print '%s:\n%s' % (str(e), traceback.format_exc())
+        return 1
+    print 'Exported %d peptides to %s' % (count, args.OUTPUT)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
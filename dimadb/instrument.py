@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.instrument - Counters, timers and progress for loads
+
+An Instrumentation is attached to a Store with Store.instrument.  While it
+is attached the Store times every PEPTIDE_DATA_METHODS (or
+PEPTIDE_BLOCK_METHODS) step and the batch writes, the statements the
+engine sends are counted by kind and table, commits are counted along with
+the tables written in each transaction, and loadPeptideDataFile logs a
+progress line every progress_interval seconds.
+
+Nothing is wrapped or hooked when no Instrumentation is attached, so the
+normal load path pays nothing for it.
+
+Created on  2026-10-18 18:58:33
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import re
+import time
+import logging
+from contextlib import contextmanager
+
+
+logger = logging.getLogger()
+
+# Seconds between progress lines
+DEFAULT_PROGRESS_INTERVAL = 10
+
+# Kind and table of a SQL statement
+STATEMENT_RE = re.compile(r'^\s*(INSERT\s+INTO|UPDATE|DELETE\s+FROM|SELECT|CREATE|DROP|LOAD\s+DATA|COPY)\s*(?:["`]?(\w+))?', re.IGNORECASE)
+
+# Connection.info key for the tables written in the current transaction
+WRITTEN_TABLES = 'dimadb.written'
+
+
+def statementTarget(statement):
+    '''
+    Returns (kind, table) for a SQL statement, e.g. ('insert', 'peptide').
+    The table of a select is not looked for.
+    '''
+    match = STATEMENT_RE.match(statement)
+    if match is None:
+        return 'other', None
+    kind = match.group(1).split()[0].lower()
+    if kind in ('select', 'create', 'drop'):
+        return kind, None
+    return kind, match.group(2)
+
+
+def formatDuration(seconds):
+    '''
+    h:mm:ss
+    '''
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+class NullTimer(object):
+    '''
+    Timer context for when there is no Instrumentation
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Instrumentation(object):
+    '''
+    Counters and cumulative timers, both keyed by name.
+
+    counters    dictionary of counts, e.g. calls.addPeptideModifications,
+                statements.insert.peptide, rows.insert.peptide, commits
+    timers      dictionary of cumulative seconds, e.g. addPeptideModifications
+
+    clock is the time of the progress lines and the report.
+    '''
+
+    def __init__(self, progress_interval=DEFAULT_PROGRESS_INTERVAL, clock=time.time):
+        self.progress_interval = progress_interval
+        self.clock = clock
+        self.counters = {}
+        self.timers = {}
+        self.engine = None
+        self.started = clock()
+        # (start time, rows, offset, last line time) by label.  See startProgress
+        self.lastprogress = {}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name):
+        '''
+        Adds the time spent in the block to the timer name and counts the call
+        '''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timers[name] = self.timers.get(name, 0.0) + time.time() - start
+            self.counters['calls.%s' % name] = self.counters.get('calls.%s' % name, 0) + 1
+
+    def timed(self, name, f):
+        '''
+        Returns f wrapped so that its calls are timed and counted under name
+        '''
+        timers = self.timers
+        counters = self.counters
+        key = 'calls.%s' % name
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                timers[name] = timers.get(name, 0.0) + time.time() - start
+                counters[key] = counters.get(key, 0) + 1
+        return wrapper
+
+    def timedIter(self, name, iterable):
+        '''
+        Yields the items of iterable, timing how long each one takes to produce
+        '''
+        iterator = iter(iterable)
+        while True:
+            with self.timer(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def attach(self, engine):
+        '''
+        Starts counting the statements and commits of engine.  Every
+        connection of the engine in this process is counted.
+        '''
+        # Imported here so that the loader can set up without SQLAlchemy
+        from sqlalchemy import event
+        self.detach()
+        self.engine = engine
+        event.listen(engine, 'before_cursor_execute', self.beforeExecute)
+        event.listen(engine, 'commit', self.commit)
+
+    def detach(self):
+        '''
+        Stops counting statements
+        '''
+        if self.engine is not None:
+            from sqlalchemy import event
+            event.remove(self.engine, 'before_cursor_execute', self.beforeExecute)
+            event.remove(self.engine, 'commit', self.commit)
+            self.engine = None
+
+    def beforeExecute(self, conn, cursor, statement, parameters, context, executemany):
+        kind, table = statementTarget(statement)
+        rows = len(parameters) if executemany else 1
+        if table is None:
+            self.count('statements.%s' % kind)
+            return
+        self.count('statements.%s.%s' % (kind, table))
+        self.count('rows.%s.%s' % (kind, table), rows)
+        conn.info.setdefault(WRITTEN_TABLES, set()).add(table)
+
+    def commit(self, conn):
+        self.count('commits')
+        for table in conn.info.pop(WRITTEN_TABLES, ()):
+            self.count('commits.%s' % table)
+
+    def startProgress(self, label, rows=0, offset=0):
+        '''
+        Starts the clock for the progress lines of label when its load
+        begins, with the rows and byte offset it begins at (a resumed load
+        begins part of the way into its file)
+        '''
+        now = self.clock()
+        self.lastprogress[label] = (now, rows, offset or 0, now)
+
+    def progress(self, label, rows, offset=None, size=None, final=False):
+        '''
+        Logs a progress line for label (e.g. the file name) if
+        progress_interval seconds have passed since the last one, or if
+        final.  The rate is of the rows since startProgress, and the ETA
+        comes from the bytes read since then out of the size bytes of the
+        file.  Without a startProgress the first call starts the clock.
+        '''
+        if label not in self.lastprogress:
+            self.startProgress(label, rows, offset)
+        now = self.clock()
+        start, startrows, startoffset, last = self.lastprogress[label]
+        if not final and (self.progress_interval is None or now - last < self.progress_interval):
+            return
+        self.lastprogress[label] = (start, startrows, startoffset, now)
+        elapsed = now - start
+        rate = (rows - startrows) / elapsed if elapsed > 0 else 0.0
+        line = '%s: %d peptides, %.0f rows/s' % (label, rows, rate)
+        if offset is not None and size:
+            fraction = float(offset) / size
+            line += ', %.1f%%' % (fraction * 100)
+            if 0 < fraction < 1 and offset > startoffset:
+                line += ', ETA %s' % formatDuration(elapsed * (size - offset) / (offset - startoffset))
+        if final:
+            line += ', done in %s' % formatDuration(elapsed)
+        logger.info(line)
+
+    def report(self):
+        '''
+        Dictionary of the counters and timers
+        '''
+        return {
+            'seconds'   : self.clock() - self.started,
+            'counters'  : dict(self.counters),
+            'timers'    : dict(self.timers),
+        }
+
+
+def formatReport(report):
+    '''
+    Lines describing an Instrumentation report, slowest timers first
+    '''
+    lines = []
+    for name, seconds in sorted(report['timers'].items(), key=lambda item: -item[1]):
+        calls = report['counters'].get('calls.%s' % name, 0)
+        lines.append('    %-40s %10.3fs %10d calls' % (name, seconds, calls))
+    for name, count in sorted(report['counters'].items()):
+        if not name.startswith('calls.'):
+            lines.append('    %-40s %10d' % (name, count))
+    return lines
@@ -10,46 +10,284 @@ Created on  2017-03-31 14:52:41
 @copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
 @license: GPL v2.0
 '''
-import sys, os, traceback
+import sys, os, traceback, time, glob
 import logging
+from contextlib import contextmanager
+
+# Only modules that import nothing heavy are imported up front, so that
+# --version, --help and argument errors come back without loading
+# SQLAlchemy.  The Store and friends are imported where they are used.
 from dimadb import __version__ as version
-from dimadb import Store
+from dimadb.options import ABUNDANCE_LAYOUTS, ABUNDANCE_LONG, DEFAULT_POOL_SIZE, DEFAULT_POOL_RECYCLE, SQLITE_INGEST, connectString
+from dimadb.instrument import Instrumentation, formatReport, DEFAULT_PROGRESS_INTERVAL
+from dimadb.reader import INPUT_FORMATS
 
 
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 
 
-logging.basicConfig(format='%(asctime)s: %(message)s',level=logging.DEBUG)
 logger = logging.getLogger()
-logger.setLevel(logging.getLevelName(os.environ.get('DIMADB_LOGLEVEL','DEBUG')))
 
 
-def loadPeptideDataFile(store, filename, dataset=None):
+def initLogging(loglevel):
+    '''
+    Logs dimadb messages at loglevel.  SQLAlchemy's own loggers are kept at
+    WARNING whatever the level, since at INFO and below they log every
+    statement, which slows loads down a lot.  --instrument counts the
+    statements instead.
+    '''
+    logging.basicConfig(format='%(asctime)s: %(message)s')
+    logger.setLevel(logging.getLevelName(loglevel))
+    logging.getLogger('sqlalchemy').setLevel(logging.WARNING)
+
+
+def isTrue(value):
+    '''
+    Flag value that may have come from an environment variable
+    '''
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def expandFiles(patterns):
+    '''
+    Expands the FILE arguments into a list of data files.  Each one may be a
+    file, a directory (all of the files in it are loaded) or a glob pattern,
+    which is handy when the shell cannot expand it (e.g. from cron).
+    '''
+    filenames = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+            matches = [match for match in matches if os.path.isfile(match)]
+        elif os.path.exists(pattern):
+            matches = [pattern]
+        else:
+            matches = sorted(glob.glob(pattern))
+            if len(matches) == 0:
+                raise Exception('File %s does not exist.' % pattern)
+        for match in matches:
+            if match not in filenames:
+                filenames.append(match)
+    return filenames
+
+
+# Number of functions logged from each profile
+PROFILE_LINES = 25
+
+# Store for the current worker process.  Set by initWorker.
+workerstore = None
+
+
+def initWorker(connectstring, storeoptions, seqindex=None):
+    '''
+    Pool initializer.  Each worker process gets its own Store, and so its own
+    engine and connections.  storeoptions are keyword arguments for Store.
+    seqindex is the path of a sequence index that the Store checks seq
+    matches against.  Each worker maps the same file.
+    '''
+    from dimadb.store import Store
+
+    global workerstore
+    workerstore = Store(connectstring, **storeoptions)
+    if seqindex:
+        from dimadb.seqindex import SequenceIndex
+        workerstore.useSequenceIndex(SequenceIndex(seqindex))
+
+
+def loadFile(task):
+    '''
+    Loads one file on the worker Store.  Failures are returned rather than
+    raised so that one bad file does not stop the rest of the run.
+
+    With the update load option the dataset is updated from the file with
+    updatePeptideDataFile, and the result also has the dictionary of changes.
+
+    The run options instrument (with progress_interval) and profile (a
+    directory) attach an Instrumentation to the worker Store, whose report
+    goes in the result, and run the load under cProfile, writing the stats
+    to <profile>/<file name>.prof.
+
+    Returns a dictionary with the filename, peptide count, elapsed seconds and
+    error message (None on success).
+    '''
+    from dimadb.dimadb import loadPeptideDataFile, updatePeptideDataFile
+
+    filename, dataset, loadoptions, runoptions = task
+    result = {
+        'filename'  : filename,
+        'count'     : 0,
+        'seconds'   : 0.0,
+        'error'     : None,
+    }
+    instrumentation = None
+    if runoptions.get('instrument'):
+        instrumentation = Instrumentation(runoptions.get('progress_interval', DEFAULT_PROGRESS_INTERVAL))
+        workerstore.instrument(instrumentation)
+    profiler = None
+    if runoptions.get('profile'):
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.time()
+    try:
+        loadoptions = dict(loadoptions)
+        if loadoptions.pop('update', False):
+            changes = updatePeptideDataFile(workerstore, filename, dataset, loadoptions['batch_size'], loadoptions.get('format'))
+            result['changes'] = changes
+            result['count'] = changes['inserted'] + changes['updated']
+        else:
+            result['count'] = loadPeptideDataFile(workerstore, filename, dataset, **loadoptions)
+    except Exception as e:
+        logger.debug('Load of %s failed:\n%s' % (filename, traceback.format_exc()))
+        result['error'] = str(e)
+    result['seconds'] = time.time() - start
+    if profiler is not None:
+        profiler.disable()
+        result['profile'] = writeProfile(profiler, runoptions['profile'], filename)
+    if instrumentation is not None:
+        workerstore.instrument(None)
+        result['instrumentation'] = instrumentation.report()
+    return result
+
+
+def writeProfile(profiler, directory, filename):
+    '''
+    Dumps the profiler stats for the load of filename into directory and logs
+    the functions with the most cumulative time.  Returns the stats file name.
+    '''
+    import pstats
+    from cStringIO import StringIO
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, '%s.prof' % os.path.basename(filename))
+    profiler.dump_stats(path)
+    out = StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    logger.info('Profile of %s written to %s\n%s' % (filename, path, out.getvalue()))
+    return path
+
+
+def loadFiles(connectstring, filenames, dataset=None, jobs=1, storeoptions=None, loadoptions=None, runoptions=None, seqindex=None, ingest=False):
     '''
-    Load standard peptide data file
+    Loads each of the files, jobs files at a time.  With more than one job the
+    files are spread across a process pool with a Store per worker.
+    storeoptions are keyword arguments for each worker's Store and
+    loadoptions keyword arguments for loadPeptideDataFile (batch_size, bulk,
+    columnar, resume, format, parse_workers) plus update, to update datasets instead
+    (batch_size and format only).  runoptions are the loadFile instrument, progress_interval and
+    profile options.  seqindex is the path of a sequence index (see
+    dimadb.seqindex) to check and fill in seq matches with.
+
+    With ingest the peptide table indexes are dropped for the whole run and
+    built again at the end (see Store.deferIndexes), and SQLite databases
+    are written with the ingest profile (see dimadb.sqlite).
+
+    Returns the list of loadFile results in completion order.
     '''
-    if not os.path.exists(filename):
-        raise Exception('File %s does not exist.' % filename)
+    if storeoptions is None:
+        storeoptions = {}
+    if loadoptions is None:
+        loadoptions = {}
+    if runoptions is None:
+        runoptions = {}
+    tasks = [(filename, dataset, loadoptions, runoptions) for filename in filenames]
+    jobs = max(1, min(jobs, len(tasks)))
+    if ingest:
+        storeoptions = dict(storeoptions, sqlite_profile=SQLITE_INGEST)
+    with deferredIndexes(connectstring, storeoptions, ingest):
+        if jobs == 1:
+            initWorker(connectstring, storeoptions, seqindex)
+            return [loadFile(task) for task in tasks]
 
-    if dataset is None:
-        dataset = os.path.basename(filename)
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs, initWorker, (connectstring, storeoptions, seqindex))
+        try:
+            results = list(pool.imap_unordered(loadFile, tasks))
+        finally:
+            pool.close()
+            pool.join()
+        return results
 
-    headers = []
-    with open(filename,'r') as f:
-        peptidedata = {}
-        for line in f:
-            line = line.strip()
-            if line == '':
-                continue
-            if len(headers) == 0:
-                headers = line.split('\t')
-                continue
 
-            peptidedata = dict(zip(headers,line.split('\t')))
-            if 'dataset' not in peptidedata:
-                peptidedata['dataset'] = dataset
+@contextmanager
+def deferredIndexes(connectstring, storeoptions, defer=True):
+    '''
+    Context that drops the peptide table indexes on entry and builds them
+    again on exit, however it exits.  Does nothing unless defer.
+    '''
+    if not defer:
+        yield
+        return
+    from dimadb.store import Store
 
-            store.savePeptideData(peptidedata)
+    store = Store(connectstring, **storeoptions)
+    try:
+        dropped = store.deferIndexes()
+        logger.info('Deferred %d indexes' % len(dropped))
+        try:
+            yield
+        finally:
+            start = time.time()
+            created = store.createIndexes()
+            logger.info('Built %d indexes in %.1fs' % (len(created), time.time() - start))
+    finally:
+        store.close()
+
+
+def mergeFiles(connectstring, filenames, storeoptions=None, ingest=False):
+    '''
+    Merges each of the dimadb SQLite files into the database (see
+    Store.mergeDatabase).  ingest is as for loadFiles.  Stops at the first
+    failure, since merged files are usually removed afterwards.
+
+    Returns summary lines with the peptide count of each file.
+    '''
+    from dimadb.store import Store
+
+    if storeoptions is None:
+        storeoptions = {}
+    if ingest:
+        storeoptions = dict(storeoptions, sqlite_profile=SQLITE_INGEST)
+    lines = []
+    total = 0
+    with deferredIndexes(connectstring, storeoptions, ingest):
+        store = Store(connectstring, **storeoptions)
+        try:
+            for filename in filenames:
+                start = time.time()
+                counts = store.mergeDatabase(filename)
+                total += counts['peptide']
+                lines.append('%s: %d peptides merged in %.1fs' % (filename, counts['peptide'], time.time() - start))
+        finally:
+            store.close()
+    lines.append('Merged %d peptides from %d files' % (total, len(filenames)))
+    return lines
+
+
+def summarize(results):
+    '''
+    Returns summary lines with peptides per second for each file and overall
+    '''
+    lines = []
+    total = 0
+    failures = 0
+    for result in results:
+        if result['error'] is not None:
+            failures += 1
+            lines.append('%s: FAILED after %.1fs: %s' % (result['filename'], result['seconds'], result['error']))
+            continue
+        rate = result['count'] / result['seconds'] if result['seconds'] > 0 else 0.0
+        total += result['count']
+        lines.append('%s: %d peptides in %.1fs (%.0f rows/s)' % (result['filename'], result['count'], result['seconds'], rate))
+        if 'changes' in result:
+            lines.append('    %(inserted)d inserted, %(updated)d updated, %(deleted)d deleted, %(unchanged)d unchanged' % result['changes'])
+        if 'instrumentation' in result:
+            lines.extend(formatReport(result['instrumentation']))
+        if 'profile' in result:
+            lines.append('    profile: %s' % result['profile'])
+    lines.append('Loaded %d peptides from %d of %d files' % (total, len(results) - failures, len(results)))
+    return lines
 
 
 def initArgs():
@@ -62,14 +300,14 @@ def initArgs():
             'name'      : 'DIMADB_LOGLEVEL',
             'switches'  : ['--loglevel'],
             'required'  : False,
-            'help'      : 'Log level (e.g. DEBUG, INFO)',
-            'default'   : 'ERROR',
+            'help'      : 'Log level (e.g. DEBUG, INFO).  SQLAlchemy only logs warnings.',
+            'default'   : 'INFO',
         },
         {
             'name'      : 'DIMADB_DRIVER',
             'switches'  : ['--driver'],
             'required'  : False,
-            'help'      : 'Database connection driver (e.g. mysql+mysqldb).  See SQLAlchemy docs.',
+            'help'      : 'Database connection driver (e.g. mysql+mysqldb, or sqlite for a database file).  See SQLAlchemy docs.',
             'default'   : 'mysql+mysqldb',
         },
         {
@@ -94,7 +332,31 @@ def initArgs():
             'name'      : 'DIMADB_DATABASE',
             'switches'  : ['--database'],
             'required'  : False,
-            'help'      : 'Database name',
+            'help'      : 'Database name, or the path of the file for SQLite',
+        },
+        {
+            'name'      : 'DIMADB_CREATE',
+            'switches'  : ['--create'],
+            'required'  : False,
+            'action'    : 'store_true',
+            'help'      : 'Create the dimadb tables first if they are not there, e.g. for a new SQLite file',
+            'default'   : False,
+        },
+        {
+            'name'      : 'DIMADB_INGEST',
+            'switches'  : ['--ingest'],
+            'required'  : False,
+            'action'    : 'store_true',
+            'help'      : 'Drop the peptide table indexes for the run and build them again at the end.  SQLite is written with synchronous off, so a crash during the load can corrupt the file.',
+            'default'   : False,
+        },
+        {
+            'name'      : 'DIMADB_MERGE',
+            'switches'  : ['--merge'],
+            'required'  : False,
+            'action'    : 'store_true',
+            'help'      : 'The files are dimadb SQLite files, e.g. from instruments, whose datasets are merged into the database in bulk',
+            'default'   : False,
         },
         {
             'name'      : 'DIMADB_DATASET',
@@ -102,6 +364,121 @@ def initArgs():
             'required'  : False,
             'help'      : '''A name for the current data load.  Can be useful for accessing particular datasets later on.''',
         },
+        {
+            'name'      : 'DIMADB_JOBS',
+            'switches'  : ['--jobs','-j'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of files to load in parallel, each in its own worker process',
+            'default'   : 1,
+        },
+        {
+            'name'      : 'DIMADB_BULK',
+            'switches'  : ['--bulk'],
+            'required'  : False,
+            'action'    : 'store_true',
+            'help'      : 'Stage each file and load it with LOAD DATA LOCAL INFILE (MySQL, needs local_infile=1 in the connect string) or COPY (PostgreSQL)',
+            'default'   : False,
+        },
+        {
+            'name'      : 'DIMADB_ABUNDANCE_LAYOUT',
+            'switches'  : ['--abundance-layout'],
+            'required'  : False,
+            'choices'   : ABUNDANCE_LAYOUTS,
+            'help'      : 'Abundance storage: long (a row per channel), matrix (packed channel and ratio vector per peptide) or both',
+            'default'   : ABUNDANCE_LONG,
+        },
+        {
+            'name'      : 'DIMADB_POOL_SIZE',
+            'switches'  : ['--pool-size'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of pooled database connections kept per process',
+            'default'   : DEFAULT_POOL_SIZE,
+        },
+        {
+            'name'      : 'DIMADB_POOL_RECYCLE',
+            'switches'  : ['--pool-recycle'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Seconds after which a pooled connection is replaced.  Keep it below the server idle timeout.',
+            'default'   : DEFAULT_POOL_RECYCLE,
+        },
+        {
+            'name'      : 'DIMADB_COLUMNAR',
+            'switches'  : ['--columnar'],
+            'required'  : False,
+            'action'    : 'store_true',
+            'help'      : 'Parse each batch into columns and convert the numeric ones with NumPy',
+            'default'   : False,
+        },
+        {
+            'name'      : 'DIMADB_BATCH_SIZE',
+            'switches'  : ['--batch-size'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of peptides parsed and written per transaction.  Bounds the records held in memory.',
+            'default'   : 1000,
+        },
+        {
+            'name'      : 'DIMADB_RESUME',
+            'switches'  : ['--resume'],
+            'required'  : False,
+            'action'    : 'store_true',
+            'help'      : 'Track each file in load_job, pick up interrupted loads from the last committed batch and skip peptides that are already stored',
+            'default'   : False,
+        },
+        {
+            'name'      : 'DIMADB_UPDATE',
+            'switches'  : ['--update'],
+            'required'  : False,
+            'action'    : 'store_true',
+            'help'      : 'Update an existing dataset from the file, writing only the peptides that were added, changed or removed',
+            'default'   : False,
+        },
+        {
+            'name'      : 'DIMADB_FORMAT',
+            'switches'  : ['--format'],
+            'required'  : False,
+            'choices'   : INPUT_FORMATS,
+            'help'      : 'Format of the data files.  By default parquet for .parquet and .pq files, arrow for .arrow, .feather and .ipc files and tsv otherwise.',
+        },
+        {
+            'name'      : 'DIMADB_PARSE_WORKERS',
+            'switches'  : ['--parse-workers'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of processes that parse each tab separated file, in byte ranges, while the loading process writes.  0 for one per CPU.  Cannot be combined with --jobs.',
+            'default'   : 1,
+        },
+        {
+            'name'      : 'DIMADB_SEQUENCE_INDEX',
+            'switches'  : ['--sequence-index'],
+            'required'  : False,
+            'help'      : 'Sequence index built with python -m dimadb.seqindex.  Master protein positions are checked against it and the matches in every other indexed protein are added.',
+        },
+        {
+            'name'      : 'DIMADB_INSTRUMENT',
+            'switches'  : ['--instrument'],
+            'required'  : False,
+            'action'    : 'store_true',
+            'help'      : 'Time each load step, count SQL statements and commits by table and log progress.  The counts are printed with the summary.',
+            'default'   : False,
+        },
+        {
+            'name'      : 'DIMADB_PROGRESS_INTERVAL',
+            'switches'  : ['--progress-interval'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Seconds between progress lines (rows/s, percent done, ETA) with --instrument',
+            'default'   : DEFAULT_PROGRESS_INTERVAL,
+        },
+        {
+            'name'      : 'DIMADB_PROFILE',
+            'switches'  : ['--profile'],
+            'required'  : False,
+            'help'      : 'Run each load under cProfile and write the stats to <file name>.prof in this directory',
+        },
     ]
         
     # Check for environment variable values
@@ -113,7 +490,7 @@ def initArgs():
     # Setup argument parser
     parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
     parser.add_argument('-V', '--version', action='version', version=version)
-    parser.add_argument('FILE',help='Input data file')
+    parser.add_argument('FILE',nargs='+',help='Input data files, directories of data files or glob patterns')
     
     # Use the parameterdefs for the ArgumentParser
     for parameterdef in parameterdefs:
@@ -137,24 +514,79 @@ def initArgs():
 
 def main():
     args = initArgs()
+    initLogging(args.DIMADB_LOGLEVEL)
 
     dataset = None
     if args.DIMADB_DATASET:
         dataset = args.DIMADB_DATASET
 
     try:
-        store = Store('%s://%s:%s@%s/%s' % (
+        connectstring = connectString(
             args.DIMADB_DRIVER, 
             args.DIMADB_USER, 
             args.DIMADB_PASSWORD, 
             args.DIMADB_HOST, 
             args.DIMADB_DATABASE,
-        ))
-        loadPeptideDataFile(store,args.FILE,dataset)
+        )
+        filenames = expandFiles(args.FILE)
+        storeoptions = {
+            'abundancelayout' : args.DIMADB_ABUNDANCE_LAYOUT,
+            'pool_size'       : int(args.DIMADB_POOL_SIZE),
+            'pool_recycle'    : int(args.DIMADB_POOL_RECYCLE),
+        }
+        if isTrue(args.DIMADB_CREATE):
+            from dimadb.store import Store
+            store = Store(connectstring, **storeoptions)
+            store.create()
+            store.close()
+        if isTrue(args.DIMADB_MERGE):
+            for line in mergeFiles(connectstring, filenames, storeoptions, isTrue(args.DIMADB_INGEST)):
+                print line
+            return
+        loadoptions = {
+            'batch_size'    : int(args.DIMADB_BATCH_SIZE),
+            'bulk'          : isTrue(args.DIMADB_BULK),
+            'columnar'      : isTrue(args.DIMADB_COLUMNAR),
+            'resume'        : isTrue(args.DIMADB_RESUME),
+            'format'        : args.DIMADB_FORMAT,
+            'parse_workers' : int(args.DIMADB_PARSE_WORKERS) or None,
+        }
+        if int(args.DIMADB_JOBS) > 1 and loadoptions['parse_workers'] != 1:
+            raise Exception('--parse-workers cannot be combined with --jobs, since job workers cannot start processes of their own')
+        if isTrue(args.DIMADB_UPDATE):
+            for option in ('bulk', 'columnar', 'resume'):
+                if loadoptions[option]:
+                    raise Exception('--update cannot be combined with --%s' % option)
+            loadoptions = {
+                'batch_size'    : loadoptions['batch_size'],
+                'format'        : loadoptions['format'],
+                'update'        : True,
+            }
+        runoptions = {
+            'instrument'        : isTrue(args.DIMADB_INSTRUMENT),
+            'progress_interval' : int(args.DIMADB_PROGRESS_INTERVAL),
+            'profile'           : args.DIMADB_PROFILE,
+        }
+        results = loadFiles(
+            connectstring,
+            filenames,
+            dataset,
+            int(args.DIMADB_JOBS),
+            storeoptions,
+            loadoptions,
+            runoptions,
+            args.DIMADB_SEQUENCE_INDEX,
+            isTrue(args.DIMADB_INGEST),
+        )
 
     except Exception as e:
         print '%s:\n%s' % (str(e), traceback.format_exc())
         return 1
 
+    for line in summarize(results):
+        print line
+    if any(result['error'] is not None for result in results):
+        return 1
+
 if __name__ == '__main__':
     sys.exit(main())
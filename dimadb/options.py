@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.options - Option values, defaults and helpers shared by the Store
+and the command line tools
+
+Nothing here imports anything, so the command line tools can build their
+argument parsers, and answer --version or --help, without loading
+SQLAlchemy.  store re-exports all of them.
+
+Created on  2026-10-18 22:58:10
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+# Abundance storage layouts.  long is a peptide_abundance row per channel,
+# matrix is a peptide_abundance_vector row per peptide with all of the
+# channels and ratios packed into float arrays.
+ABUNDANCE_LONG = 'long'
+ABUNDANCE_MATRIX = 'matrix'
+ABUNDANCE_BOTH = 'both'
+ABUNDANCE_LAYOUTS = [ABUNDANCE_LONG, ABUNDANCE_MATRIX, ABUNDANCE_BOTH]
+
+# Kinds of abundance_channel
+CHANNEL_ABUNDANCE = 'abundance'
+CHANNEL_RATIO = 'ratio'
+
+# Connection pool defaults.  Connections are tested with a ping when they are
+# checked out and replaced after an hour, which keeps MySQL's wait_timeout
+# from handing back dead ones.
+DEFAULT_POOL_SIZE = 5
+DEFAULT_POOL_RECYCLE = 3600
+
+# PRAGMA profiles for SQLite databases.  See dimadb.sqlite
+SQLITE_DEFAULT = 'default'
+SQLITE_INGEST = 'ingest'
+SQLITE_PROFILES = [SQLITE_DEFAULT, SQLITE_INGEST]
+
+
+def connectString(driver, user, password, host, database):
+    '''
+    SQLAlchemy connect string for the command line connection arguments.
+    For SQLite the database is the path of the file and the rest are not used.
+    '''
+    if driver.split('+')[0] == 'sqlite':
+        return '%s:///%s' % (driver, database)
+    return '%s://%s:%s@%s/%s' % (driver, user, password, host, database)
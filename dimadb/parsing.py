@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.parsing - Parsers for the modification and position strings in peptide data
+
+Proteome Discoverer writes modifications like
+
+    2xPhospho [S21; S25]; 1xTMT6plex [N-Term]
+
+and master protein positions like
+
+    P51430 [1-14]; O48549 [1-14]
+
+The same strings turn up over and over across peptides and datasets, so
+parse results are immutable tuples kept in a bounded LRU cache.  The
+caches are shared by the service's writer threads, so they are used under
+a lock.  Parses run outside it.
+
+Created on  2026-10-18 11:20:17
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import re
+import threading
+from collections import namedtuple
+
+from cache import LRUCache
+
+
+# Modification matcher, e.g. 2xPhospho [S21; S25] or TMT6plex [K]
+MODIFICATION_RE = re.compile(r'(?:(\d+)x)?(\S+) \[([^\]]+)\]')
+
+# Location string matcher, e.g. S21 or S3(100)
+LOCATION_RE = re.compile(r'([A-Z])(\d+)')
+
+# Position matcher, e.g. F4JLS6 [1-27]
+POSITION_RE = re.compile(r'([^ ]+) \[(\d+)-(\d+)\]')
+
+# Separator between list items, or the end of the string
+SEPARATOR_RE = re.compile(r'\s*(?:;\s*|$)')
+
+# List item splitter
+SPLIT_RE = re.compile(r'\s*;\s*')
+
+
+# mod_type is lower case.  count is the Nx prefix (1 if there is none).
+# locations is a tuple of ModificationLocation
+Modification = namedtuple('Modification', ['mod_type', 'count', 'locations'])
+
+# loc_base and loc_pos are None for locations like N-Term or K/M
+ModificationLocation = namedtuple('ModificationLocation', ['loc_str', 'loc_base', 'loc_pos'])
+
+SeqPosition = namedtuple('SeqPosition', ['accession', 'start', 'end'])
+
+
+modificationcache = LRUCache()
+positioncache = LRUCache()
+
+# Guards both caches, since an LRUCache is not thread safe
+cachelock = threading.Lock()
+
+
+def parseModificationString(modstr):
+    '''
+    Uncached parse of a modification string into a tuple of Modification.
+    Semicolons inside the location brackets do not split modifications.
+    '''
+    modifications = []
+    modstr = modstr.strip()
+    pos = 0
+    while pos < len(modstr):
+        m = MODIFICATION_RE.match(modstr, pos)
+        if m is None:
+            raise Exception('Modification string makes no sense: %s' % modstr[pos:])
+        count, mod_type, mod_locstr = m.groups()
+
+        # Iterate over what may be more than one location
+        locations = []
+        for mod_loc in SPLIT_RE.split(mod_locstr.strip()):
+            loc_base = None
+            loc_pos = None
+            lm = LOCATION_RE.match(mod_loc)
+            if lm is not None:
+                loc_base = lm.group(1)
+                loc_pos = int(lm.group(2))
+            locations.append(ModificationLocation(mod_loc, loc_base, loc_pos))
+
+        modifications.append(Modification(
+            mod_type.lower(),
+            int(count) if count else 1,
+            tuple(locations),
+        ))
+
+        sep = SEPARATOR_RE.match(modstr, m.end())
+        if sep is None:
+            raise Exception('Modification string makes no sense: %s' % modstr[m.end():])
+        pos = sep.end()
+    return tuple(modifications)
+
+
+def parsePositionString(posstr):
+    '''
+    Uncached parse of a master protein position string into a tuple of SeqPosition
+    '''
+    posstr = posstr.strip()
+    if posstr == '':
+        return ()
+    positions = []
+    for position in SPLIT_RE.split(posstr):
+        m = POSITION_RE.match(position)
+        if m is None:
+            raise Exception('Master protein string does not look right: %s' % position)
+        positions.append(SeqPosition(m.group(1), int(m.group(2)), int(m.group(3))))
+    return tuple(positions)
+
+
+def bareSequence(annotated):
+    '''
+    Upper case residues of an annotated sequence, e.g. AAGEDAK for
+    [K].aAGEDAK.[T].  Sequences without the flanking residues are just
+    upper cased.
+    '''
+    parts = annotated.strip().split('.')
+    if len(parts) == 3:
+        return parts[1].upper()
+    return parts[0].upper()
+
+
+def parseModifications(modstr):
+    '''
+    Cached version of parseModificationString.  None parses to no modifications.
+    '''
+    if modstr is None:
+        return ()
+    with cachelock:
+        result = modificationcache.get(modstr)
+    if result is None:
+        result = parseModificationString(modstr)
+        with cachelock:
+            modificationcache.put(modstr, result)
+    return result
+
+
+def parsePositions(posstr):
+    '''
+    Cached version of parsePositionString.  None parses to no positions.
+    '''
+    if posstr is None:
+        return ()
+    with cachelock:
+        result = positioncache.get(posstr)
+    if result is None:
+        result = parsePositionString(posstr)
+        with cachelock:
+            positioncache.put(posstr, result)
+    return result
+
+
+def parserCacheStats():
+    '''
+    Returns the LRUCache stats of the modification and position caches
+    '''
+    with cachelock:
+        return {
+            'modifications' : modificationcache.stats(),
+            'positions'     : positioncache.stats(),
+        }
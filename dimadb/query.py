@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.query - Read side queries for dimadb
+
+The functions take a Store and are also available as Store methods.  Row
+results are streamed from a server side cursor chunk_size rows at a time,
+so large results are never held in memory all at once.
+
+Created on  2026-10-18 15:10:52
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+from sqlalchemy import select, func, and_, case, true
+
+
+# Rows fetched from the cursor at a time
+DEFAULT_CHUNK_SIZE = 1000
+
+# Peptide confidence values, lowest first
+CONFIDENCE_LEVELS = ['Low', 'Medium', 'High']
+
+
+def streamQuery(store, query, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Yields the rows of query, fetched chunk_size at a time with a server side
+    cursor on a connection of its own.  The connection is released when the
+    generator is exhausted or closed.
+    '''
+    connection = store.engine.connect()
+    try:
+        result = connection.execution_options(stream_results=True).execute(query)
+        try:
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            result.close()
+    finally:
+        connection.close()
+
+
+def datasetIdQuery(store, dataset):
+    '''
+    Scalar subquery for the id of the named dataset, so that child tables
+    can be filtered on their dataset_id without a join to peptide
+    '''
+    table = store.tables['dataset']
+    return select([table.c.id]).where(table.c.name == dataset).as_scalar()
+
+
+def confidencesAtLeast(min_confidence):
+    '''
+    List of confidence values at or above min_confidence
+    '''
+    if min_confidence not in CONFIDENCE_LEVELS:
+        raise Exception('Confidence must be one of %s, not %s' % (', '.join(CONFIDENCE_LEVELS), min_confidence))
+    return CONFIDENCE_LEVELS[CONFIDENCE_LEVELS.index(min_confidence):]
+
+
+def findPeptides(store, dataset=None, accession=None, mod_type=None, min_confidence=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Yields the peptide rows that match all of the given criteria.  accession
+    matches any seq match of the peptide and mod_type any of its modifications.
+    '''
+    peptide = store.tables['peptide']
+    query = select([peptide])
+    if dataset is not None:
+        query = query.where(peptide.c.dataset == dataset)
+    if accession is not None:
+        seqmatch = store.tables['peptide_seq_match']
+        acc = store.tables['accession']
+        query = query.where(peptide.c.id.in_(
+            select([seqmatch.c.peptide_id])
+            .select_from(seqmatch.join(acc, acc.c.id == seqmatch.c.accession_id))
+            .where(acc.c.name == accession)
+        ))
+    if mod_type is not None:
+        modification = store.tables['peptide_modification']
+        modtype = store.tables['modification_type']
+        query = query.where(peptide.c.id.in_(
+            select([modification.c.peptide_id])
+            .select_from(modification.join(modtype, modtype.c.id == modification.c.mod_type_id))
+            .where(modtype.c.name == mod_type.lower())
+        ))
+    if min_confidence is not None:
+        query = query.where(peptide.c.confidence.in_(confidencesAtLeast(min_confidence)))
+    query = query.order_by(peptide.c.id)
+    return streamQuery(store, query, chunk_size)
+
+
+def proteinCoverage(store, accession, dataset=None):
+    '''
+    Returns the coverage of a protein by the peptide seq matches, optionally
+    limited to one dataset, as a dictionary of
+
+        accession   the accession
+        peptides    number of distinct peptides matched
+        intervals   merged (start, end) ranges covered, in order
+        residues    number of residues covered
+    '''
+    seqmatch = store.tables['peptide_seq_match']
+    acc = store.tables['accession']
+
+    source = seqmatch.join(acc, acc.c.id == seqmatch.c.accession_id)
+    criteria = [acc.c.name == accession]
+    if dataset is not None:
+        criteria.append(seqmatch.c.dataset_id == datasetIdQuery(store, dataset))
+    query = select([seqmatch.c.peptide_id, seqmatch.c.start, seqmatch.c.end]) \
+        .select_from(source) \
+        .where(and_(*criteria)) \
+        .order_by(seqmatch.c.start, seqmatch.c.end)
+
+    peptide_ids = set()
+    intervals = []
+    for row in streamQuery(store, query):
+        peptide_ids.add(row.peptide_id)
+        if row.start is None or row.end is None:
+            continue
+        if intervals and row.start <= intervals[-1][1] + 1:
+            if row.end > intervals[-1][1]:
+                intervals[-1] = (intervals[-1][0], row.end)
+        else:
+            intervals.append((row.start, row.end))
+
+    return {
+        'accession' : accession,
+        'peptides'  : len(peptide_ids),
+        'intervals' : intervals,
+        'residues'  : sum(end - start + 1 for start, end in intervals),
+    }
+
+
+def datasetSummary(store, dataset):
+    '''
+    Returns a dictionary of counts for a dataset
+
+        peptides        number of peptides
+        psms            total of # PSMs
+        contaminants    number of contaminant peptides
+        accessions      number of distinct matched accessions
+        modifications   dictionary of modification site counts by mod type
+        confidence      dictionary of peptide counts by confidence
+    '''
+    peptide = store.tables['peptide']
+    seqmatch = store.tables['peptide_seq_match']
+    modification = store.tables['peptide_modification']
+    modtype = store.tables['modification_type']
+    connection = store.connection
+
+    row = connection.execute(
+        select([
+            func.count(peptide.c.id),
+            func.sum(peptide.c.no_psms),
+            func.sum(case([(peptide.c.contaminant == true(), 1)], else_=0)),
+        ]).where(peptide.c.dataset == dataset)
+    ).first()
+    summary = {
+        'dataset'       : dataset,
+        'peptides'      : row[0] or 0,
+        'psms'          : int(row[1] or 0),
+        'contaminants'  : int(row[2] or 0),
+    }
+
+    dataset_id = datasetIdQuery(store, dataset)
+    summary['accessions'] = connection.execute(
+        select([func.count(func.distinct(seqmatch.c.accession_id))])
+        .where(seqmatch.c.dataset_id == dataset_id)
+    ).scalar() or 0
+
+    summary['modifications'] = dict(
+        (row[0], row[1]) for row in connection.execute(
+            select([modtype.c.name, func.count(modification.c.id)])
+            .select_from(modification.join(modtype, modtype.c.id == modification.c.mod_type_id))
+            .where(modification.c.dataset_id == dataset_id)
+            .group_by(modtype.c.name)
+        )
+    )
+
+    summary['confidence'] = dict(
+        (row[0], row[1]) for row in connection.execute(
+            select([peptide.c.confidence, func.count(peptide.c.id)])
+            .where(peptide.c.dataset == dataset)
+            .group_by(peptide.c.confidence)
+        )
+    )
+    return summary
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.reader - Streaming parse stages for peptide data files
+
+The stages are generators that can be chained together, so a file of any
+size is read with only one batch of records in memory at a time.  None of
+them touch the database, so they can be used to pull parsed records out of
+a file on their own, e.g.
+
+    with open(filename,'r') as f:
+        lines = readLines(f)
+        headers = readHeader(lines)
+        for peptidedata in peptideRecords(lines, headers, 'mydataset'):
+            ...
+
+For loading, lines are split and interpreted with a ColumnPlan compiled
+from the header instead, so no dictionary is built per row.
+
+loadPeptideDataFile reads files through a reader object from openReader:
+a TextReader over these stages for the tab separated export (or a
+splitter.ParallelTextReader, which parses it with a pool of processes), or
+an arrowreader.ArrowReader for Parquet and Arrow files.  All of them hand
+out the header and batches of split lines for the same ColumnPlan.
+
+Created on  2026-10-18 09:12:05
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import os
+import hashlib
+
+# Maximum number of parsed records held in memory between the parse and write stages
+DEFAULT_BATCH_SIZE = 1000
+
+# Bytes read at a time by fileHash
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Peptide data file formats
+FORMAT_TSV = 'tsv'
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+INPUT_FORMATS = [FORMAT_TSV, FORMAT_PARQUET, FORMAT_ARROW]
+
+# File extensions of the formats other than tsv
+FORMAT_EXTENSIONS = {
+    '.parquet'  : FORMAT_PARQUET,
+    '.pq'       : FORMAT_PARQUET,
+    '.arrow'    : FORMAT_ARROW,
+    '.feather'  : FORMAT_ARROW,
+    '.ipc'      : FORMAT_ARROW,
+}
+
+
+class OffsetReader(object):
+    '''
+    Iterates over the lines of a file opened in binary mode, keeping the byte
+    offset just past the last line handed out in offset.  Since the stages
+    are pulled one line at a time, when batchRecords yields a batch offset is
+    the end of the last line in the batch, which is where a load can resume.
+    '''
+
+    def __init__(self, f, offset=0):
+        self.f = f
+        self.offset = offset
+
+    def __iter__(self):
+        for line in self.f:
+            self.offset += len(line)
+            yield line
+
+
+def fileHash(filename):
+    '''
+    SHA-1 hex digest of the contents of a file
+    '''
+    sha = hashlib.sha1()
+    with open(filename,'rb') as f:
+        while True:
+            data = f.read(HASH_BLOCK_SIZE)
+            if not data:
+                break
+            sha.update(data)
+    return sha.hexdigest()
+
+
+def readLines(f):
+    '''
+    Yields the non-blank lines of an open file with the line endings removed
+    '''
+    for line in f:
+        line = line.rstrip('\r\n')
+        if line.strip() == '':
+            continue
+        yield line
+
+
+def readHeader(lines):
+    '''
+    Takes the first line from the lines iterator and returns the list of column headers
+    '''
+    for line in lines:
+        return line.split('\t')
+    raise Exception('Peptide data file has no header line')
+
+
+def splitLines(lines):
+    '''
+    Yields the list of tab separated fields for each line.  These are
+    interpreted with a ColumnPlan compiled from the header.
+    '''
+    for line in lines:
+        yield line.split('\t')
+
+
+def peptideRecords(lines, headers, dataset):
+    '''
+    Yields a peptide data dictionary keyed by header for each remaining line.
+    dataset is filled in unless the file has its own dataset column.
+    '''
+    for line in lines:
+        peptidedata = dict(zip(headers,line.split('\t')))
+        if 'dataset' not in peptidedata:
+            peptidedata['dataset'] = dataset
+        yield peptidedata
+
+
+def batchRecords(records, batch_size=DEFAULT_BATCH_SIZE):
+    '''
+    Groups records into lists of at most batch_size records
+    '''
+    if batch_size < 1:
+        raise Exception('Batch size must be at least 1, not %s' % batch_size)
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iterPeptideDataFile(filename, dataset=None):
+    '''
+    Yields peptide data dictionaries from a standard peptide data file.
+    dataset defaults to the file name.
+    '''
+    if not os.path.exists(filename):
+        raise Exception('File %s does not exist.' % filename)
+
+    if dataset is None:
+        dataset = os.path.basename(filename)
+
+    with open(filename,'r') as f:
+        lines = readLines(f)
+        headers = readHeader(lines)
+        for peptidedata in peptideRecords(lines, headers, dataset):
+            yield peptidedata
+
+
+def fileFormat(filename):
+    '''
+    Format of a peptide data file from its extension.  Anything that is not
+    Parquet or Arrow is taken to be the tab separated export.
+    '''
+    return FORMAT_EXTENSIONS.get(os.path.splitext(filename)[1].lower(), FORMAT_TSV)
+
+
+class TextReader(object):
+    '''
+    Reader for the tab separated peptide data export.
+
+    headers     list of column headers
+    size        file size in bytes
+    position    byte offset just past the last line handed out, where a load can resume
+    typed       False, since every value has to be parsed from its string
+    '''
+
+    typed = False
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.size = os.path.getsize(filename)
+        self.f = open(filename,'rb')
+        # readline rather than iteration so that the header end can be told
+        self.headers = readHeader(readLines(iter(self.f.readline, '')))
+        self.source = OffsetReader(self.f, self.f.tell())
+
+    @property
+    def position(self):
+        return self.source.offset
+
+    def seek(self, position):
+        '''
+        Continues from a position saved from an earlier load
+        '''
+        if position > self.f.tell():
+            self.f.seek(position)
+            self.source.offset = position
+
+    def batches(self, batch_size=DEFAULT_BATCH_SIZE, plan=None):
+        '''
+        Yields lists of at most batch_size split lines.  plan is for readers
+        that can build ColumnBlocks as they go, which they then yield instead
+        of the lines, and is not used here.
+        '''
+        return batchRecords(splitLines(readLines(self.source)), batch_size)
+
+    def block(self, plan, batch):
+        '''
+        ColumnBlock for a batch, or for some of its lines
+        '''
+        # Imported here so that numpy is only loaded for columnar loads
+        from columnar import parseBlock
+        return parseBlock(plan, batch)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def openReader(filename, format=None, workers=1):
+    '''
+    Returns a reader for a peptide data file.  format is one of
+    INPUT_FORMATS and defaults to the one for the file extension.  Tab
+    separated files are parsed by a pool of worker processes if workers is
+    more than 1 (or None for one per CPU).
+    '''
+    if not os.path.exists(filename):
+        raise Exception('File %s does not exist.' % filename)
+    if format is None:
+        format = fileFormat(filename)
+    if format == FORMAT_TSV:
+        if workers is None or workers > 1:
+            from splitter import ParallelTextReader
+            return ParallelTextReader(filename, workers)
+        return TextReader(filename)
+    if format in (FORMAT_PARQUET, FORMAT_ARROW):
+        # Imported here so that pyarrow is only loaded for columnar files
+        from arrowreader import ArrowReader
+        return ArrowReader(filename, format)
+    raise Exception('Peptide data file format must be one of %s, not %s' % (', '.join(INPUT_FORMATS), format))
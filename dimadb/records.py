@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.records - Slotted row records for the peptide tables
+
+A PeptideBatch holds one of these for each row instead of a dictionary, so
+that a batch of tens of thousands of peptides is a fraction of the size and
+makes far fewer objects for the garbage collector to track.  The long layout
+abundances of a peptide are held as one AbundanceRecord with an array('d')
+of its channel values, and are only split into AbundanceValueRecords for
+the peptide_abundance rows when the batch is written.
+
+Records can be indexed like the dictionaries they replace, and row()
+returns the dictionary of table columns for the insert.  Slots that are not
+in COLUMNS, like the accession name of a seq match, are the reference data
+names that Store.resolveLookups turns into ids.
+
+Created on  2026-10-18 23:52:09
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import math
+
+
+def packedValues(vals):
+    '''
+    Bytes of an array('d') or a numpy row.  tostring is deprecated in numpy,
+    but the Python 2 array has no tobytes.
+    '''
+    tobytes = getattr(vals, 'tobytes', None)
+    if tobytes is None:
+        return vals.tostring()
+    return tobytes()
+
+
+class Record(object):
+    '''
+    Base of the record classes.  COLUMNS are the slots written to the
+    table.  Each class sets every slot in its own __init__, which is much
+    quicker than a loop over __slots__.
+    '''
+    __slots__ = ()
+    COLUMNS = ()
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        try:
+            setattr(self, name, value)
+        except AttributeError:
+            raise KeyError(name)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def row(self):
+        '''
+        Dictionary of the table columns for an insert
+        '''
+        return dict((name, getattr(self, name)) for name in self.COLUMNS)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.__slots__))
+
+
+class PeptideRecord(Record):
+    '''
+    peptide table row
+    '''
+    __slots__ = (
+        'id',
+        'confidence',
+        'annotated_sequence',
+        'modifications',
+        'modifications_in_master_proteins',
+        'no_protein_groups',
+        'no_proteins',
+        'no_psms',
+        'master_protein_accessions',
+        'positions_in_master_proteins',
+        'no_missed_cleavages',
+        'theo_mh_da',
+        'contaminant',
+        'off_by_x',
+        'position_in_protein',
+        'dataset',
+        'dataset_id',
+        'fingerprint',
+    )
+    COLUMNS = __slots__
+
+    def __init__(self, id=None, confidence=None, annotated_sequence=None, modifications=None,
+                 modifications_in_master_proteins=None, no_protein_groups=None, no_proteins=None,
+                 no_psms=None, master_protein_accessions=None, positions_in_master_proteins=None,
+                 no_missed_cleavages=None, theo_mh_da=None, contaminant=None, off_by_x=None,
+                 position_in_protein=None, dataset=None, dataset_id=None, fingerprint=None):
+        self.id = id
+        self.confidence = confidence
+        self.annotated_sequence = annotated_sequence
+        self.modifications = modifications
+        self.modifications_in_master_proteins = modifications_in_master_proteins
+        self.no_protein_groups = no_protein_groups
+        self.no_proteins = no_proteins
+        self.no_psms = no_psms
+        self.master_protein_accessions = master_protein_accessions
+        self.positions_in_master_proteins = positions_in_master_proteins
+        self.no_missed_cleavages = no_missed_cleavages
+        self.theo_mh_da = theo_mh_da
+        self.contaminant = contaminant
+        self.off_by_x = off_by_x
+        self.position_in_protein = position_in_protein
+        self.dataset = dataset
+        self.dataset_id = dataset_id
+        self.fingerprint = fingerprint
+
+
+class AbundanceRecord(Record):
+    '''
+    The channel abundances of one peptide.  channels is the tuple of channel
+    names, shared by the peptides of a ColumnPlan, and vals the matching
+    array('d') with NaN where the channel is empty.
+    '''
+    __slots__ = ('peptide_id', 'channels', 'vals')
+
+    def __init__(self, peptide_id=None, channels=(), vals=()):
+        self.peptide_id = peptide_id
+        self.channels = channels
+        self.vals = vals
+
+    def values(self):
+        '''
+        AbundanceValueRecords for the channels that have a value.  The
+        peptide_abundance val column is an integer, so values are rounded to
+        the nearest one rather than cut down.  The matrix layout keeps them
+        as they are.
+        '''
+        return [
+            AbundanceValueRecord(peptide_id=self.peptide_id, channel=channel, val=int(round(val)))
+            for channel, val in zip(self.channels, self.vals) if not math.isnan(val)
+        ]
+
+
+class AbundanceValueRecord(Record):
+    '''
+    peptide_abundance row
+    '''
+    __slots__ = ('peptide_id', 'channel', 'channel_id', 'val', 'dataset_id')
+    COLUMNS = ('peptide_id', 'channel_id', 'val', 'dataset_id')
+
+    def __init__(self, peptide_id=None, channel=None, channel_id=None, val=None, dataset_id=None):
+        self.peptide_id = peptide_id
+        self.channel = channel
+        self.channel_id = channel_id
+        self.val = val
+        self.dataset_id = dataset_id
+
+
+class AbundanceVectorRecord(Record):
+    '''
+    peptide_abundance_vector row.  channel_ids are packed, and vals is an
+    array('d') (or a float64 numpy row) in little endian byte order that is
+    packed when the row is written.
+    '''
+    __slots__ = ('peptide_id', 'dataset', 'dataset_id', 'channel_ids', 'vals')
+    COLUMNS = __slots__
+
+    def __init__(self, peptide_id=None, dataset=None, dataset_id=None, channel_ids=None, vals=None):
+        self.peptide_id = peptide_id
+        self.dataset = dataset
+        self.dataset_id = dataset_id
+        self.channel_ids = channel_ids
+        self.vals = vals
+
+    def row(self):
+        return {
+            'peptide_id'    : self.peptide_id,
+            'dataset'       : self.dataset,
+            'dataset_id'    : self.dataset_id,
+            'channel_ids'   : self.channel_ids,
+            'vals'          : packedValues(self.vals),
+        }
+
+
+class SeqMatchRecord(Record):
+    '''
+    peptide_seq_match row.  matchdata is the tuple of (metric, strval, fval)
+    for the peptide's search engine columns, shared by its seq matches, that
+    become the peptide_seq_match_data rows once the id is assigned.
+    '''
+    __slots__ = ('id', 'peptide_id', 'accession', 'accession_id', 'start', 'end', 'confidence', 'algorithm', 'dataset_id', 'matchdata')
+    COLUMNS = ('id', 'peptide_id', 'accession_id', 'start', 'end', 'confidence', 'algorithm', 'dataset_id')
+
+    def __init__(self, id=None, peptide_id=None, accession=None, accession_id=None, start=None, end=None,
+                 confidence=None, algorithm=None, dataset_id=None, matchdata=()):
+        self.id = id
+        self.peptide_id = peptide_id
+        self.accession = accession
+        self.accession_id = accession_id
+        self.start = start
+        self.end = end
+        self.confidence = confidence
+        self.algorithm = algorithm
+        self.dataset_id = dataset_id
+        self.matchdata = matchdata
+
+    def dataRecords(self):
+        '''
+        SeqMatchDataRecords for the matchdata
+        '''
+        return [
+            SeqMatchDataRecord(peptide_seq_match_id=self.id, metric=metric, strval=strval, fval=fval)
+            for metric, strval, fval in self.matchdata
+        ]
+
+
+class SeqMatchDataRecord(Record):
+    '''
+    peptide_seq_match_data row
+    '''
+    __slots__ = ('peptide_seq_match_id', 'metric', 'metric_id', 'strval', 'fval', 'dataset_id')
+    COLUMNS = ('peptide_seq_match_id', 'metric_id', 'strval', 'fval', 'dataset_id')
+
+    def __init__(self, peptide_seq_match_id=None, metric=None, metric_id=None, strval=None, fval=None, dataset_id=None):
+        self.peptide_seq_match_id = peptide_seq_match_id
+        self.metric = metric
+        self.metric_id = metric_id
+        self.strval = strval
+        self.fval = fval
+        self.dataset_id = dataset_id
+
+
+class ModificationRecord(Record):
+    '''
+    peptide_modification row
+    '''
+    __slots__ = ('peptide_id', 'mod_type', 'mod_type_id', 'loc_base', 'loc_pos', 'loc_str', 'dataset_id')
+    COLUMNS = ('peptide_id', 'mod_type_id', 'loc_base', 'loc_pos', 'loc_str', 'dataset_id')
+
+    def __init__(self, peptide_id=None, mod_type=None, mod_type_id=None, loc_base=None, loc_pos=None, loc_str=None, dataset_id=None):
+        self.peptide_id = peptide_id
+        self.mod_type = mod_type
+        self.mod_type_id = mod_type_id
+        self.loc_base = loc_base
+        self.loc_pos = loc_pos
+        self.loc_str = loc_str
+        self.dataset_id = dataset_id
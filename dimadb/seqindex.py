@@ -0,0 +1,555 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.seqindex - Protein sequence index for peptide to protein mapping
+
+A SequenceIndex maps accessions to protein sequences and finds every
+protein that a peptide occurs in.  It is built from a UniProt XML file,
+read an entry at a time with iterparse, and written to a single file.  The
+file is memory mapped when it is opened, so even an index of a whole
+proteome takes no time to load and its pages are shared by every process
+that uses it.
+
+The file holds
+
+    residues        the sequence of every protein, each followed by a newline
+    accessions      sorted primary and secondary accessions with the protein
+                    of each
+    k-mers          the sorted codes (5 bits per residue) of every k residue
+                    stretch of the residues, with the positions of each
+
+A peptide is looked up through its rarest k-mer, and each candidate
+position is checked against the residues.  Peptides shorter than k are
+found with a scan.
+
+    python -m dimadb.seqindex uniprot_sprot.xml sprot.seqidx
+
+A Store checks and fills in the seq matches of the peptides it loads
+against an index given to Store.useSequenceIndex (see checkPositions).
+
+Needs numpy.
+
+Created on  2026-10-18 22:05:41
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import sys, os, traceback
+import mmap
+import struct
+import logging
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from parsing import SeqPosition, bareSequence
+from cache import LRUCache
+
+
+logger = logging.getLogger()
+
+UNIPROT_NS = '{http://uniprot.org/uniprot}'
+UNIPROT_ENTRY = UNIPROT_NS + 'entry'
+UNIPROT_ACCESSION = UNIPROT_NS + 'accession'
+UNIPROT_SEQUENCE = UNIPROT_NS + 'sequence'
+
+# Residues per k-mer.  Codes are 5 bits per residue in an int32.
+DEFAULT_KMER_SIZE = 5
+MAX_KMER_SIZE = 6
+
+# Peptides whose occurrences are cached
+DEFAULT_FIND_CACHE_SIZE = 10000
+
+INDEX_MAGIC = 'DIMASEQ1'
+
+# Sections of an index file in file order.  Each one starts on an 8 byte
+# boundary and the header has its offset and item count.
+SECTION_NAMES = [
+    'residues',         # uint8
+    'proteinstarts',    # int64 residue offset of each protein, and the end
+    'names',            # uint8 sorted accessions run together
+    'nameoffsets',      # int64 offset of each accession in names, and the end
+    'nameproteins',     # int32 protein of each accession
+    'primary',          # int32 accession number of each protein's primary accession
+    'kmers',            # int32 sorted distinct k-mer codes
+    'kmerstarts',       # int64 first posting of each k-mer, and the end
+    'postings',         # uint32 (or int64 for big indexes) residue offsets
+]
+
+# Magic, k-mer size, bytes per posting, then offset and count of each section
+HEADER = struct.Struct('<8sII' + 'QQ' * len(SECTION_NAMES))
+
+
+def checkNumpy():
+    if numpy is None:
+        raise Exception('numpy is required for sequence indexes')
+
+
+def uniprotEntries(filename):
+    '''
+    Yields (accessions, sequence) for each entry of a UniProt XML file, with
+    the primary accession first.  Entries are cleared once they are read, so
+    the document is never held in memory.
+    '''
+    root = None
+    for event, elem in ElementTree.iterparse(filename, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event != 'end' or elem.tag != UNIPROT_ENTRY:
+            continue
+        accessions = [str(accession.text.strip()) for accession in elem.findall(UNIPROT_ACCESSION) if accession.text]
+        sequence = elem.find(UNIPROT_SEQUENCE)
+        if accessions and sequence is not None and sequence.text:
+            yield accessions, str(''.join(sequence.text.split()).upper())
+        root.clear()
+
+
+def residueValues(letters):
+    '''
+    Residue values of a uint8 array: 1 to 26 for A to Z and 0 for anything else
+    '''
+    values = letters.astype(numpy.int32) - 64
+    values[(values < 1) | (values > 26)] = 0
+    return values
+
+
+def kmerCodes(values, k):
+    '''
+    Returns (codes, positions) of the k residue stretches of residueValues
+    that are all residues
+    '''
+    n = len(values) - k + 1
+    if n <= 0:
+        return numpy.zeros(0, numpy.int32), numpy.zeros(0, numpy.int64)
+    codes = numpy.zeros(n, numpy.int32)
+    valid = numpy.ones(n, bool)
+    for i in range(k):
+        window = values[i:i + n]
+        codes <<= 5
+        codes |= window
+        valid &= window != 0
+    positions = numpy.flatnonzero(valid)
+    return codes[positions], positions
+
+
+def alignFile(f):
+    '''
+    Pads f to an 8 byte boundary and returns the offset
+    '''
+    offset = f.tell()
+    padding = -offset % 8
+    f.write('\0' * padding)
+    return offset + padding
+
+
+def buildSequenceIndex(xmlfile, path, kmer_size=DEFAULT_KMER_SIZE):
+    '''
+    Writes a sequence index of the entries of a UniProt XML file to path.
+    Entries whose primary accession has already been seen are skipped.
+    The residues are written as the entries are read and the k-mers are
+    counted from the written file.  Returns the number of proteins.
+    '''
+    checkNumpy()
+    if not 1 <= kmer_size <= MAX_KMER_SIZE:
+        raise Exception('K-mer size must be from 1 to %d, not %s' % (MAX_KMER_SIZE, kmer_size))
+
+    tmppath = '%s.tmp' % path
+    try:
+        with open(tmppath, 'w+b') as f:
+            f.write('\0' * HEADER.size)
+            sections = {}
+
+            names = {}
+            primary = []
+            starts = []
+            offset = alignFile(f)
+            size = 0
+            for accessions, sequence in uniprotEntries(xmlfile):
+                if accessions[0] in names:
+                    logger.debug('Skipping repeated entry %s' % accessions[0])
+                    continue
+                protein = len(starts)
+                for accession in accessions:
+                    names.setdefault(accession, protein)
+                primary.append(accessions[0])
+                starts.append(size)
+                f.write(sequence)
+                f.write('\n')
+                size += len(sequence) + 1
+            starts.append(size)
+            sections['residues'] = (offset, size)
+
+            f.flush()
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                values = residueValues(numpy.frombuffer(buf, numpy.uint8, size, offset))
+            finally:
+                buf.close()
+            codes, positions = kmerCodes(values, kmer_size)
+            del values
+            order = numpy.argsort(codes, kind='mergesort')
+            codes = codes[order]
+            postings = positions[order].astype('<u4' if size < 2 ** 32 else '<i8')
+            del positions, order
+            kmers, kmerstarts = numpy.unique(codes, return_index=True)
+            kmerstarts = numpy.append(kmerstarts, len(codes))
+            del codes
+
+            sortednames = sorted(names)
+            namenumbers = dict((name, i) for i, name in enumerate(sortednames))
+            nameoffsets = numpy.cumsum([0] + [len(name) for name in sortednames])
+            arrays = [
+                ('proteinstarts',   numpy.array(starts, '<i8')),
+                ('names',           ''.join(sortednames)),
+                ('nameoffsets',     nameoffsets.astype('<i8')),
+                ('nameproteins',    numpy.array([names[name] for name in sortednames], '<i4')),
+                ('primary',         numpy.array([namenumbers[name] for name in primary], '<i4')),
+                ('kmers',           kmers.astype('<i4')),
+                ('kmerstarts',      kmerstarts.astype('<i8')),
+                ('postings',        postings),
+            ]
+            for name, array in arrays:
+                offset = alignFile(f)
+                if isinstance(array, str):
+                    f.write(array)
+                else:
+                    f.write(array.tostring())
+                sections[name] = (offset, len(array))
+
+            values = []
+            for name in SECTION_NAMES:
+                values.extend(sections[name])
+            f.seek(0)
+            f.write(HEADER.pack(INDEX_MAGIC, kmer_size, postings.itemsize, *values))
+        os.rename(tmppath, path)
+    except Exception:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+    logger.info('Indexed %d proteins (%d residues, %d accessions) from %s' % (len(primary), size - len(primary), len(names), xmlfile))
+    return len(primary)
+
+
+class SequenceIndex(object):
+    '''
+    Memory mapped protein sequence index written by buildSequenceIndex.
+    Positions are 1 based and inclusive, like the ones in the Positions in
+    Master Proteins column.
+
+    kmer_size   residues per k-mer
+    '''
+
+    def __init__(self, path, cache_size=DEFAULT_FIND_CACHE_SIZE):
+        checkNumpy()
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        values = HEADER.unpack_from(self.buf, 0) if len(self.buf) >= HEADER.size else None
+        if values is None or values[0] != INDEX_MAGIC:
+            self.buf.close()
+            raise Exception('%s is not a sequence index' % path)
+        self.kmer_size = values[1]
+        sections = dict(zip(SECTION_NAMES, zip(values[3::2], values[4::2])))
+        self.residuesoffset, self.residuecount = sections['residues']
+        self.namesoffset = sections['names'][0]
+
+        def section(name, dtype):
+            offset, count = sections[name]
+            if count == 0:
+                return numpy.zeros(0, dtype)
+            return numpy.frombuffer(self.buf, dtype, count, offset)
+
+        self.proteinstarts = section('proteinstarts', '<i8')
+        self.nameoffsets = section('nameoffsets', '<i8')
+        self.nameproteins = section('nameproteins', '<i4')
+        self.primary = section('primary', '<i4')
+        self.kmers = section('kmers', '<i4')
+        self.kmerstarts = section('kmerstarts', '<i8')
+        self.postings = section('postings', '<u4' if values[2] == 4 else '<i8')
+
+        # Occurrences by peptide sequence
+        self.findcache = LRUCache(cache_size)
+
+    def __len__(self):
+        return len(self.primary)
+
+    def __contains__(self, accession):
+        return self.protein(accession) is not None
+
+    def name(self, number):
+        '''
+        Accession number in sorted order
+        '''
+        return self.buf[self.namesoffset + self.nameoffsets[number]:self.namesoffset + self.nameoffsets[number + 1]]
+
+    def protein(self, accession):
+        '''
+        Number of the protein with a primary or secondary accession, or None
+        '''
+        lo, hi = 0, len(self.nameproteins)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < accession:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.nameproteins) and self.name(lo) == accession:
+            return int(self.nameproteins[lo])
+        return None
+
+    def accession(self, protein):
+        '''
+        Primary accession of a protein number
+        '''
+        return self.name(self.primary[protein])
+
+    def proteinSequence(self, protein):
+        start = self.residuesoffset + self.proteinstarts[protein]
+        end = self.residuesoffset + self.proteinstarts[protein + 1] - 1
+        return self.buf[start:end]
+
+    def sequence(self, accession):
+        '''
+        Sequence of the protein with an accession, or None
+        '''
+        protein = self.protein(accession)
+        if protein is None:
+            return None
+        return self.proteinSequence(protein)
+
+    def residueOffsets(self, peptide):
+        '''
+        Offsets in the residues where a bare peptide sequence starts
+        '''
+        k = self.kmer_size
+        if len(peptide) < k:
+            return self.scan(peptide)
+        codes, offsets = kmerCodes(residueValues(numpy.frombuffer(peptide, numpy.uint8)), k)
+        if len(codes) < len(peptide) - k + 1:
+            # Not all residues
+            return []
+        slots = numpy.searchsorted(self.kmers, codes)
+        if (slots >= len(self.kmers)).any() or (self.kmers[numpy.minimum(slots, len(self.kmers) - 1)] != codes).any():
+            return []
+        counts = self.kmerstarts[slots + 1] - self.kmerstarts[slots]
+        rarest = int(numpy.argmin(counts))
+        slot, shift = slots[rarest], int(offsets[rarest])
+
+        found = []
+        length = len(peptide)
+        for posting in self.postings[self.kmerstarts[slot]:self.kmerstarts[slot + 1]]:
+            start = int(posting) - shift
+            if start < 0:
+                continue
+            begin = self.residuesoffset + start
+            if self.buf[begin:begin + length] == peptide:
+                found.append(start)
+        found.sort()
+        return found
+
+    def scan(self, peptide):
+        '''
+        residueOffsets by searching all of the residues, for short peptides
+        '''
+        if not peptide:
+            return []
+        end = self.residuesoffset + self.residuecount
+        found = []
+        start = self.buf.find(peptide, self.residuesoffset, end)
+        while start >= 0:
+            found.append(start - self.residuesoffset)
+            start = self.buf.find(peptide, start + 1, end)
+        return found
+
+    def occurrences(self, peptide):
+        '''
+        Tuple of (protein number, start, end) for every occurrence of a bare
+        peptide sequence, in protein order
+        '''
+        result = self.findcache.get(peptide)
+        if result is None:
+            offsets = self.residueOffsets(str(peptide))
+            proteins = numpy.searchsorted(self.proteinstarts, offsets, 'right') - 1
+            result = tuple(
+                (int(protein), int(offset - self.proteinstarts[protein]) + 1, int(offset - self.proteinstarts[protein]) + len(peptide))
+                for offset, protein in zip(offsets, proteins)
+            )
+            self.findcache.put(peptide, result)
+        return result
+
+    def find(self, peptide):
+        '''
+        Tuple of SeqPosition, with the primary accession, for every
+        occurrence of a bare peptide sequence in protein order
+        '''
+        return tuple(SeqPosition(self.accession(protein), start, end) for protein, start, end in self.occurrences(peptide))
+
+    def checkPositions(self, peptide, positions):
+        '''
+        Checks the SeqPositions of a bare peptide sequence, e.g. parsed from
+        the Positions in Master Proteins column, and adds the occurrences in
+        every other protein.  Returns a list of (SeqPosition, fromindex).
+
+        Positions that the index confirms, or that are in proteins it does
+        not have, are kept with fromindex False.  Wrong ones are dropped.
+        The other occurrences are added, with the primary accession, with
+        fromindex True.
+        '''
+        occurrences = self.occurrences(peptide)
+        confirmed = set()
+        result = []
+        for position in positions:
+            protein = self.protein(position.accession)
+            if protein is None:
+                result.append((position, False))
+            elif (protein, position.start, position.end) in occurrences:
+                confirmed.add((protein, position.start, position.end))
+                result.append((position, False))
+        for occurrence in occurrences:
+            if occurrence not in confirmed:
+                protein, start, end = occurrence
+                result.append((SeqPosition(self.accession(protein), start, end), True))
+        return result
+
+    def coverage(self, accession, peptides):
+        '''
+        Coverage of a protein by a list of peptide sequences, annotated or
+        bare, worked out from the index alone.  Returns None if the protein
+        is not in the index, or a dictionary of
+
+            accession   the accession
+            peptides    number of distinct sequences found in the protein
+            intervals   merged (start, end) ranges covered, in order
+            residues    number of residues covered
+            length      number of residues in the protein
+            fraction    residues / length
+        '''
+        protein = self.protein(accession)
+        if protein is None:
+            return None
+        sequence = self.proteinSequence(protein)
+        matched = 0
+        ranges = []
+        for peptide in set(bareSequence(peptide) for peptide in peptides):
+            start = sequence.find(peptide) if peptide else -1
+            if start >= 0:
+                matched += 1
+            while start >= 0:
+                ranges.append((start + 1, start + len(peptide)))
+                start = sequence.find(peptide, start + 1)
+
+        intervals = []
+        for start, end in sorted(ranges):
+            if intervals and start <= intervals[-1][1] + 1:
+                if end > intervals[-1][1]:
+                    intervals[-1] = (intervals[-1][0], end)
+            else:
+                intervals.append((start, end))
+        residues = sum(end - start + 1 for start, end in intervals)
+        return {
+            'accession' : accession,
+            'peptides'  : matched,
+            'intervals' : intervals,
+            'residues'  : residues,
+            'length'    : len(sequence),
+            'fraction'  : float(residues) / len(sequence) if sequence else 0.0,
+        }
+
+    def close(self):
+        '''
+        Unmaps the file.  The index cannot be used after this.
+        '''
+        for name in ('proteinstarts', 'nameoffsets', 'nameproteins', 'primary', 'kmers', 'kmerstarts', 'postings'):
+            setattr(self, name, None)
+        self.findcache.clear()
+        if self.buf is not None:
+            self.buf.close()
+            self.buf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def initArgs():
+    '''
+    Setup arguments with parameterdef, check envs, parse commandline, return args
+    '''
+
+    parameterdefs = [
+        {
+            'name'      : 'DIMADB_LOGLEVEL',
+            'switches'  : ['--loglevel'],
+            'required'  : False,
+            'help'      : 'Log level (e.g. DEBUG, INFO)',
+            'default'   : 'INFO',
+        },
+        {
+            'name'      : 'DIMADB_KMER_SIZE',
+            'switches'  : ['--kmer-size'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Residues per indexed k-mer, at most %d.  Peptides shorter than this are found with a scan.' % MAX_KMER_SIZE,
+            'default'   : DEFAULT_KMER_SIZE,
+        },
+    ]
+
+    # Check for environment variable values
+    # Set to 'default' if they are found
+    for parameterdef in parameterdefs:
+        if os.environ.get(parameterdef['name'],None) is not None:
+            parameterdef['default'] = os.environ.get(parameterdef['name'])
+            parameterdef['required'] = False
+
+    # Setup argument parser
+    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('XML',help='UniProt XML file')
+    parser.add_argument('OUTPUT',help='Sequence index file')
+
+    # Use the parameterdefs for the ArgumentParser
+    for parameterdef in parameterdefs:
+        switches = parameterdef.pop('switches')
+        if not isinstance(switches, list):
+            switches = [switches]
+
+        # Gotta take it off for add_argument
+        name = parameterdef.pop('name')
+        parameterdef['dest'] = name
+        if 'default' in parameterdef:
+            parameterdef['help'] += '  [default: %s]' % parameterdef['default']
+        parser.add_argument(*switches,**parameterdef)
+
+        # Gotta put it back on for later
+        parameterdef['name'] = name
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = initArgs()
+    logging.basicConfig(format='%(asctime)s: %(message)s')
+    logger.setLevel(logging.getLevelName(args.DIMADB_LOGLEVEL))
+
+    try:
+        count = buildSequenceIndex(args.XML, args.OUTPUT, int(args.DIMADB_KMER_SIZE))
+    except Exception as e:
+        print '%s:\n%s' % (str(e), traceback.format_exc())
+        return 1
+    print 'Indexed %d proteins in %s' % (count, args.OUTPUT)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
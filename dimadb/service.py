@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.service - Ingestion service for peptide data uploads
+
+Peptide data files are POSTed to /datasets/<dataset> over HTTP, on a TCP
+port or a Unix socket, e.g.
+
+    curl --data-binary @peptides.txt http://localhost:8642/datasets/run42
+
+The request body is parsed with the reader stages as it arrives and each
+batch of split lines is put on a bounded queue that a pool of writer
+threads, each with its own Store, drains with Store.savePeptideFields.
+When the writers fall behind the queue fills up, the request thread blocks
+and stops reading the socket, so clients are slowed down instead of the
+service buffering their uploads.
+
+The response is a JSON object with the dataset, the peptides and batches
+written and the error, if any.  GET /status returns the queue and writer
+counters.
+
+Created on  2026-10-18 16:47:12
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import sys, os, traceback, json, threading, urllib
+import logging
+import BaseHTTPServer
+import SocketServer
+import Queue
+
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from store import Store
+from options import connectString
+from reader import readLines, readHeader, splitLines, batchRecords, DEFAULT_BATCH_SIZE
+from columns import ColumnPlan
+
+
+logger = logging.getLogger()
+
+# Number of writer threads
+DEFAULT_WRITERS = 2
+
+# Maximum number of batches waiting for a writer
+DEFAULT_QUEUE_SIZE = 8
+
+DATASET_PATH = '/datasets/'
+
+
+class Upload(object):
+    '''
+    Progress of one upload.  Batches are counted as they are queued and as
+    they are written, so that the request thread can wait for the last one.
+    '''
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.finished = threading.Condition()
+        self.pending = 0
+        self.batches = 0
+        self.count = 0
+        self.error = None
+
+    def queued(self):
+        with self.finished:
+            self.pending += 1
+            self.batches += 1
+
+    def written(self, count, error=None):
+        with self.finished:
+            self.pending -= 1
+            self.count += count
+            if error is not None and self.error is None:
+                self.error = error
+            self.finished.notify_all()
+
+    def wait(self):
+        '''
+        Waits until every queued batch has been written or has failed
+        '''
+        with self.finished:
+            while self.pending > 0:
+                self.finished.wait()
+
+    def result(self):
+        return {
+            'dataset'   : self.dataset,
+            'peptides'  : self.count,
+            'batches'   : self.batches,
+            'error'     : self.error,
+        }
+
+
+class IngestService(object):
+    '''
+    Bounded queue of peptide batches and the writer threads that save them.
+
+    connectstring   database for the writer Stores
+    writers         number of writer threads, each with its own Store and connection
+    queue_size      maximum number of batches waiting for a writer
+    batch_size      peptides per batch, and so per transaction
+    storeoptions    keyword arguments for each writer's Store
+    '''
+
+    def __init__(self, connectstring, writers=DEFAULT_WRITERS, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE, storeoptions=None):
+        if writers < 1:
+            raise Exception('Number of writers must be at least 1, not %s' % writers)
+        self.connectstring = connectstring
+        self.writers = writers
+        self.batch_size = batch_size
+        self.storeoptions = storeoptions or {}
+        self.queue = Queue.Queue(queue_size)
+        self.threads = []
+        self.lock = threading.Lock()
+        self.stats = {
+            'uploads'   : 0,
+            'active'    : 0,
+            'failed'    : 0,
+            'batches'   : 0,
+            'peptides'  : 0,
+        }
+
+    def start(self):
+        '''
+        Starts the writer threads.  Their Stores are created before this returns.
+        '''
+        ready = []
+        for i in range(self.writers):
+            started = threading.Event()
+            thread = threading.Thread(target=self.write, args=(started,), name='dimadb-writer-%d' % i)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+            ready.append(started)
+        for started in ready:
+            started.wait()
+
+    def stop(self):
+        '''
+        Lets the writers finish the queued batches and stops them
+        '''
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def write(self, started):
+        '''
+        Writer thread.  Saves batches from the queue until it gets None.
+        '''
+        store = Store(self.connectstring, **self.storeoptions)
+        started.set()
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    break
+                upload, plan, batch = task
+                if upload.error is not None:
+                    # Not worth writing the rest of a failed upload
+                    upload.written(0)
+                    continue
+                try:
+                    count = store.savePeptideFields(plan, batch)
+                except Exception as e:
+                    logger.debug('Write to %s failed:\n%s' % (upload.dataset, traceback.format_exc()))
+                    upload.written(0, str(e))
+                    continue
+                with self.lock:
+                    self.stats['batches'] += 1
+                    self.stats['peptides'] += count
+                upload.written(count)
+            finally:
+                self.queue.task_done()
+        store.close()
+
+    def ingest(self, lines, dataset):
+        '''
+        Parses the lines of a peptide data file and queues them in batches for
+        the writers.  Blocks while the queue is full.  Returns the Upload once
+        every batch has been written.
+        '''
+        upload = Upload(dataset)
+        with self.lock:
+            self.stats['uploads'] += 1
+            self.stats['active'] += 1
+        try:
+            try:
+                headers = readHeader(lines)
+                plan = ColumnPlan(headers, dataset)
+                for batch in batchRecords(splitLines(lines), self.batch_size):
+                    if upload.error is not None:
+                        break
+                    upload.queued()
+                    self.queue.put((upload, plan, batch))
+            except Exception as e:
+                upload.error = str(e)
+            upload.wait()
+        finally:
+            with self.lock:
+                self.stats['active'] -= 1
+                if upload.error is not None:
+                    self.stats['failed'] += 1
+        return upload
+
+    def status(self):
+        '''
+        Dictionary of the service counters and queue length
+        '''
+        with self.lock:
+            status = dict(self.stats)
+        status['queued'] = self.queue.qsize()
+        status['writers'] = len(self.threads)
+        return status
+
+
+def bodyLines(rfile, length):
+    '''
+    Yields the lines of a request body of length bytes as they are read
+    '''
+    remaining = length
+    while remaining > 0:
+        line = rfile.readline(remaining)
+        if not line:
+            raise Exception('Upload ended after %d of %d bytes' % (length - remaining, length))
+        remaining -= len(line)
+        yield line
+
+
+class IngestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    POST /datasets/<dataset> loads the request body into dataset.  GET /status
+    returns the service counters.
+    '''
+
+    def sendJson(self, code, value):
+        body = json.dumps(value)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/status':
+            return self.sendJson(404, {'error' : 'Not found: %s' % self.path})
+        self.sendJson(200, self.server.service.status())
+
+    def do_POST(self):
+        if not self.path.startswith(DATASET_PATH) or len(self.path) == len(DATASET_PATH):
+            return self.sendJson(404, {'error' : 'Uploads go to %s<dataset>' % DATASET_PATH})
+        dataset = urllib.unquote(self.path[len(DATASET_PATH):])
+        length = self.headers.getheader('Content-Length')
+        if length is None:
+            return self.sendJson(411, {'error' : 'Content-Length is required'})
+
+        upload = self.server.service.ingest(readLines(bodyLines(self.rfile, int(length))), dataset)
+        result = upload.result()
+        if upload.error is not None:
+            logger.error('Upload to %s failed after %d peptides: %s' % (dataset, upload.count, upload.error))
+            return self.sendJson(400 if upload.count == 0 else 500, result)
+        logger.info('Loaded %d peptides into %s' % (upload.count, dataset))
+        self.sendJson(200, result)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        if not self.client_address:
+            return self.server.server_address
+        return BaseHTTPServer.BaseHTTPRequestHandler.address_string(self)
+
+    def log_message(self, format, *args):
+        logger.debug('%s %s' % (self.address_string(), format % args))
+
+
+class IngestServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    Threaded HTTP server on a TCP address for an IngestService
+    '''
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        BaseHTTPServer.HTTPServer.__init__(self, address, IngestHandler)
+        self.service = service
+
+
+class UnixIngestServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    '''
+    Threaded HTTP server on a Unix socket for an IngestService
+    '''
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        if os.path.exists(path):
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, IngestHandler)
+        self.service = service
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def initArgs():
+    '''
+    Setup arguments with parameterdef, check envs, parse commandline, return args
+    '''
+
+    parameterdefs = [
+        {
+            'name'      : 'DIMADB_LOGLEVEL',
+            'switches'  : ['--loglevel'],
+            'required'  : False,
+            'help'      : 'Log level (e.g. DEBUG, INFO)',
+            'default'   : 'INFO',
+        },
+        {
+            'name'      : 'DIMADB_DRIVER',
+            'switches'  : ['--driver'],
+            'required'  : False,
+            'help'      : 'Database connection driver (e.g. mysql+mysqldb, or sqlite for a database file).  See SQLAlchemy docs.',
+            'default'   : 'mysql+mysqldb',
+        },
+        {
+            'name'      : 'DIMADB_USER',
+            'switches'  : ['--user'],
+            'required'  : False,
+            'help'      : 'Database user',
+        },
+        {
+            'name'      : 'DIMADB_PASSWORD',
+            'switches'  : ['--password'],
+            'required'  : False,
+            'help'      : 'Database password',
+        },
+        {
+            'name'      : 'DIMADB_HOST',
+            'switches'  : ['--host'],
+            'required'  : False,
+            'help'      : 'Database hostname',
+        },
+        {
+            'name'      : 'DIMADB_DATABASE',
+            'switches'  : ['--database'],
+            'required'  : False,
+            'help'      : 'Database name, or the path of the file for SQLite',
+        },
+        {
+            'name'      : 'DIMADB_LISTEN',
+            'switches'  : ['--listen'],
+            'required'  : False,
+            'help'      : 'Address to listen on',
+            'default'   : '127.0.0.1',
+        },
+        {
+            'name'      : 'DIMADB_PORT',
+            'switches'  : ['--port'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Port to listen on',
+            'default'   : 8642,
+        },
+        {
+            'name'      : 'DIMADB_SOCKET',
+            'switches'  : ['--socket'],
+            'required'  : False,
+            'help'      : 'Listen on this Unix socket instead of a TCP port',
+        },
+        {
+            'name'      : 'DIMADB_WRITERS',
+            'switches'  : ['--writers'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of database writer threads, each with its own connection',
+            'default'   : DEFAULT_WRITERS,
+        },
+        {
+            'name'      : 'DIMADB_QUEUE_SIZE',
+            'switches'  : ['--queue-size'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of parsed batches that can wait for a writer before uploads are held back',
+            'default'   : DEFAULT_QUEUE_SIZE,
+        },
+        {
+            'name'      : 'DIMADB_BATCH_SIZE',
+            'switches'  : ['--batch-size'],
+            'required'  : False,
+            'type'      : int,
+            'help'      : 'Number of peptides parsed and written per transaction',
+            'default'   : DEFAULT_BATCH_SIZE,
+        },
+    ]
+
+    # Check for environment variable values
+    # Set to 'default' if they are found
+    for parameterdef in parameterdefs:
+        if os.environ.get(parameterdef['name'],None) is not None:
+            parameterdef['default'] = os.environ.get(parameterdef['name'])
+
+    # Setup argument parser
+    parser = ArgumentParser(description='Serves peptide data uploads to dimadb', formatter_class=RawDescriptionHelpFormatter)
+
+    # Use the parameterdefs for the ArgumentParser
+    for parameterdef in parameterdefs:
+        switches = parameterdef.pop('switches')
+        if not isinstance(switches, list):
+            switches = [switches]
+
+        # Gotta take it off for add_argument
+        name = parameterdef.pop('name')
+        parameterdef['dest'] = name
+        if 'default' in parameterdef:
+            parameterdef['help'] += '  [default: %s]' % parameterdef['default']
+        parser.add_argument(*switches,**parameterdef)
+
+        # Gotta put it back on for later
+        parameterdef['name'] = name
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = initArgs()
+    logging.basicConfig(format='%(asctime)s: %(message)s')
+    logger.setLevel(logging.getLevelName(args.DIMADB_LOGLEVEL))
+
+    connectstring = connectString(
+        args.DIMADB_DRIVER,
+        args.DIMADB_USER,
+        args.DIMADB_PASSWORD,
+        args.DIMADB_HOST,
+        args.DIMADB_DATABASE,
+    )
+    service = IngestService(
+        connectstring,
+        int(args.DIMADB_WRITERS),
+        int(args.DIMADB_QUEUE_SIZE),
+        int(args.DIMADB_BATCH_SIZE),
+    )
+    try:
+        service.start()
+        if args.DIMADB_SOCKET:
+            server = UnixIngestServer(args.DIMADB_SOCKET, service)
+        else:
+            server = IngestServer((args.DIMADB_LISTEN, int(args.DIMADB_PORT)), service)
+    except Exception as e:
+        print '%s:\n%s' % (str(e), traceback.format_exc())
+        return 1
+
+    logger.info('Listening on %s' % (server.server_address,))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.splitter - Parallel parsing of large tab separated peptide files
+
+A ParallelTextReader memory maps the file and cuts everything after the
+header into byte ranges that end on a newline.  Each range is copied out
+of the map in one slice and split in place instead of being read a line
+at a time.
+
+For the columnar path the ranges are parsed into ColumnBlocks by a pool of
+worker processes that are started with the file name and the ColumnPlan,
+so only the range bounds go out with each task.  The NumPy conversion and
+the line fingerprints, most of the parse time, are spread over the
+workers, and pickled blocks are compact (see ColumnBlock.__getstate__).
+Results come back in file order with at most workers * RANGES_PER_WORKER
+ranges in flight, so a fast pool cannot run ahead of the writer and fill
+up memory.  The writer is still the single loading process.
+
+Plain split lines are not worth sending between processes: pickling and
+unpickling a list of fields costs several times what splitting it does, so
+without a plan the ranges are split in the reading process.
+
+The pool workers are child processes, so a ParallelTextReader cannot be
+used inside another pool's worker, e.g. loader.py with --jobs.
+
+Created on  2026-10-18 20:57:14
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import mmap
+import multiprocessing
+from collections import deque
+
+from reader import TextReader, DEFAULT_BATCH_SIZE
+from columnar import parseBlock, ColumnBlock
+
+
+# Bytes parsed per task
+DEFAULT_RANGE_SIZE = 8 * 1024 * 1024
+
+# Ranges queued or being parsed for each worker
+RANGES_PER_WORKER = 2
+
+
+def newlineRanges(buf, start, end, range_size=DEFAULT_RANGE_SIZE):
+    '''
+    Returns (start, end) byte ranges covering start to end of buf, each about
+    range_size bytes and ending just past a newline (or at end)
+    '''
+    if range_size < 1:
+        raise Exception('Range size must be at least 1, not %s' % range_size)
+    ranges = []
+    while start < end:
+        stop = start + range_size
+        if stop >= end:
+            stop = end
+        else:
+            newline = buf.find('\n', stop - 1, end)
+            stop = end if newline < 0 else newline + 1
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+# File name and ColumnPlan of a pool worker.  Set by initParser.
+parserfile = None
+parserplan = None
+
+
+def initParser(filename, plan):
+    global parserfile, parserplan
+    parserfile = filename
+    parserplan = plan
+
+
+def splitRange(buf, start, end, batch_size):
+    '''
+    Splits the start to end byte range of buf into batches of at most
+    batch_size split lines, skipping blank lines.  Yields (end offset, split
+    lines) for each batch.
+    '''
+    batch = []
+    offset = start
+    for line in buf[start:end].split('\n'):
+        offset += len(line) + 1
+        line = line.rstrip('\r')
+        if line.strip() == '':
+            continue
+        batch.append(line.split('\t'))
+        if len(batch) >= batch_size:
+            yield min(offset, end), batch
+            batch = []
+    if batch:
+        yield end, batch
+
+
+def parseRange(task):
+    '''
+    Parses a byte range of the worker's file into ColumnBlocks.  Returns a
+    list of (end offset, ColumnBlock) for each batch.
+    '''
+    start, end, batch_size = task
+    with open(parserfile,'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return [(offset, parseBlock(parserplan, lines)) for offset, lines in splitRange(buf, start, end, batch_size)]
+        finally:
+            buf.close()
+
+
+class ParallelTextReader(TextReader):
+    '''
+    TextReader that parses the file with a pool of worker processes.  See
+    TextReader for the attributes.
+    '''
+
+    def __init__(self, filename, workers=None, range_size=DEFAULT_RANGE_SIZE):
+        TextReader.__init__(self, filename)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = max(1, workers)
+        self.range_size = range_size
+        self.start = self.source.offset
+
+    @property
+    def position(self):
+        return self.source.offset
+
+    def seek(self, position):
+        if position > self.start:
+            self.start = position
+            self.source.offset = position
+
+    def map(self):
+        return mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def ranges(self):
+        '''
+        Byte ranges of the rest of the file
+        '''
+        if self.start >= self.size:
+            return []
+        buf = self.map()
+        try:
+            return newlineRanges(buf, self.start, self.size, self.range_size)
+        finally:
+            buf.close()
+
+    def batches(self, batch_size=DEFAULT_BATCH_SIZE, plan=None):
+        '''
+        Yields lists of at most batch_size split lines in file order.
+        Batches do not span ranges.  If plan is given the workers parse the
+        ranges and the ColumnBlocks they build are yielded instead of the
+        lines.  Otherwise the ranges are split here.
+        '''
+        if batch_size < 1:
+            raise Exception('Batch size must be at least 1, not %s' % batch_size)
+        ranges = deque(self.ranges())
+        if not ranges:
+            return
+        if plan is None or self.workers == 1:
+            buf = self.map()
+            try:
+                for start, end in ranges:
+                    for offset, lines in splitRange(buf, start, end, batch_size):
+                        self.source.offset = offset
+                        yield lines
+            finally:
+                buf.close()
+            return
+
+        pool = multiprocessing.Pool(min(self.workers, len(ranges)), initParser, (self.filename, plan))
+        pending = deque()
+        try:
+            while ranges or pending:
+                while ranges and len(pending) < self.workers * RANGES_PER_WORKER:
+                    start, end = ranges.popleft()
+                    pending.append(pool.apply_async(parseRange, ((start, end, batch_size),)))
+                for offset, block in pending.popleft().get():
+                    self.source.offset = offset
+                    yield block
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def block(self, plan, batch):
+        '''
+        ColumnBlock for a batch, which the workers may already have built
+        '''
+        if isinstance(batch, ColumnBlock):
+            return batch
+        return parseBlock(plan, batch)
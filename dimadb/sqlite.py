@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.sqlite - Embedded SQLite profile
+
+SQLite needs no database server, so an instrument can keep a dimadb file of
+its own and have it merged into the central database later with
+mergeDatabase.  Every SQLite engine the Store makes sets the PRAGMAs of a
+profile on each new connection through an engine connect event.
+
+default
+    WAL journal, so that readers do not block the loader and the other way
+    around, NORMAL sync, which is safe with WAL, a 64MB page cache,
+    temporary tables in memory and a 30 second busy timeout, so that loader
+    processes wait for each other's write locks rather than failing.
+
+ingest
+    As default, with synchronous OFF and a 256MB page cache.  Commits do not
+    wait for the disk, so an operating system crash or power cut during the
+    load can corrupt the file.  Use it for loads that can be run again.
+
+Created on  2026-10-19 00:21:48
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+import sys
+import logging
+from array import array
+
+from sqlalchemy import event, select, func
+
+from options import SQLITE_DEFAULT, SQLITE_INGEST, SQLITE_PROFILES, CHANNEL_ABUNDANCE
+
+logger = logging.getLogger()
+
+# (PRAGMA, value) set on every connection, by profile
+SQLITE_PRAGMAS = {
+    SQLITE_DEFAULT : [
+        ('journal_mode',    'WAL'),
+        ('synchronous',     'NORMAL'),
+        ('cache_size',      -65536),
+        ('temp_store',      'MEMORY'),
+        ('busy_timeout',    30000),
+    ],
+    SQLITE_INGEST : [
+        ('journal_mode',    'WAL'),
+        ('synchronous',     'OFF'),
+        ('cache_size',      -262144),
+        ('temp_store',      'MEMORY'),
+        ('busy_timeout',    30000),
+    ],
+}
+
+# Rows read from the merged file at a time
+MERGE_CHUNK_SIZE = 10000
+
+# Reference data id columns of the peptide tables and the table the names are in
+MERGE_LOOKUPS = [
+    ('channel_id',      'abundance_channel'),
+    ('accession_id',    'accession'),
+    ('metric_id',       'metric'),
+    ('mod_type_id',     'modification_type'),
+]
+
+
+def setPragmas(dbapiconnection, pragmas):
+    '''
+    Runs PRAGMA name = value on a DBAPI connection for each of pragmas
+    '''
+    cursor = dbapiconnection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+    finally:
+        cursor.close()
+
+
+def useProfile(engine, profile=SQLITE_DEFAULT):
+    '''
+    Sets the PRAGMAs of profile, one of SQLITE_PROFILES, on every new
+    connection of a SQLite engine
+    '''
+    if profile not in SQLITE_PROFILES:
+        raise Exception('SQLite profile must be one of %s, not %s' % (', '.join(SQLITE_PROFILES), profile))
+    pragmas = SQLITE_PRAGMAS[profile]
+
+    def connect(dbapiconnection, record):
+        setPragmas(dbapiconnection, pragmas)
+
+    event.listen(engine, 'connect', connect)
+
+
+def pragmaValues(connection, names):
+    '''
+    Dictionary of the current value of each of the named PRAGMAs on a connection
+    '''
+    return dict((name, connection.execute('PRAGMA %s' % name).scalar()) for name in names)
+
+
+def referenceIdMap(store, source, tablename):
+    '''
+    Dictionary of the ids of a reference data table in the source Store to
+    the ids of the same names in store, which are created if they are new
+    '''
+    table = source.tables[tablename]
+    rows = source.connection.execute(select([table])).fetchall()
+    if tablename == 'abundance_channel':
+        # Channels keep their kind
+        ids = {}
+        for kind in set(row.kind for row in rows):
+            ids.update(store.lookupIds(tablename, [row.name for row in rows if row.kind == kind], {'kind' : kind or CHANNEL_ABUNDANCE}))
+    else:
+        ids = store.lookupIds(tablename, [row.name for row in rows])
+    return dict((row.id, ids[row.name]) for row in rows)
+
+
+def channelIdMap(channelmap):
+    '''
+    Function that remaps the packed channel_ids of a peptide_abundance_vector
+    row (little endian int32 abundance_channel ids) with channelmap, a
+    dictionary of source to store channel ids.  The peptides of a file share
+    a few distinct packings, so each is only remapped once.
+    '''
+    packings = {}
+
+    def remap(packed):
+        packed = bytes(packed)
+        result = packings.get(packed)
+        if result is None:
+            channel_ids = array('i')
+            channel_ids.fromstring(packed)
+            if sys.byteorder == 'big':
+                channel_ids.byteswap()
+            channel_ids = array('i', [channelmap[channel_id] for channel_id in channel_ids])
+            if sys.byteorder == 'big':
+                channel_ids.byteswap()
+            result = channel_ids.tostring()
+            packings[packed] = result
+        return result
+
+    return remap
+
+
+def idOffset(store, source, tablename):
+    '''
+    Allocates a block of ids in store for the rows of a Store allocated table
+    in the source Store.  Returns the number to add to each source id.
+    '''
+    table = source.tables[tablename]
+    low, high = source.connection.execute(select([func.min(table.c.id), func.max(table.c.id)])).first()
+    if low is None:
+        return 0
+    return store.allocateIds(tablename, high - low + 1) - low
+
+
+def mergeDatabase(store, path, stagingdir=None, chunk_size=MERGE_CHUNK_SIZE):
+    '''
+    Copies the active datasets of the dimadb SQLite file at path into store
+    with the bulk loader (see Store.beginBulk).  Datasets, reference data
+    and ids are remapped to the ones in store: the Store allocated ids are
+    moved to a block allocated in store, and the names of the datasets and
+    reference data are looked up or created.  A dataset that is already in
+    store is an error, and nothing is merged.  The merged datasets have no
+    summary rows yet, so their summaries are built when they are first read.
+
+    Returns a dictionary of row counts by table name.
+    '''
+    # Imported here since store imports this module
+    from store import Store, PEPTIDE_TABLES, DATASET_ACTIVE
+
+    # Without a profile, which would change the file's journal mode, and
+    # query only, so that the file is only read.  SQLite opens a file that
+    # cannot be written read only.
+    source = Store('sqlite:///%s' % path, sqlite_profile=None)
+    try:
+        source.connection.execute('PRAGMA query_only = ON')
+        datasets = [row for row in source.listDatasets() if row.status == DATASET_ACTIVE]
+        existing = [row.name for row in datasets if store.datasetId(row.name) is not None]
+        if existing:
+            raise Exception('Datasets %s from %s are already in the database' % (', '.join(existing), path))
+        if not datasets:
+            return dict((tablename, 0) for tablename in PEPTIDE_TABLES)
+
+        datasetids = store.lookupIds('dataset', [row.name for row in datasets])
+        try:
+            mappings = {
+                'dataset_id' : dict((row.id, datasetids[row.name]) for row in datasets).get,
+            }
+            idmaps = {}
+            for column, tablename in MERGE_LOOKUPS:
+                idmaps[tablename] = referenceIdMap(store, source, tablename)
+                mappings[column] = idmaps[tablename].get
+            # The matrix layout's channel ids are packed in a binary column
+            mappings['channel_ids'] = channelIdMap(idmaps['abundance_channel'])
+            for column, tablename in (('peptide_id', 'peptide'), ('peptide_seq_match_id', 'peptide_seq_match')):
+                offset = idOffset(store, source, tablename)
+                mappings[column] = lambda v, offset=offset: v + offset
+
+            store.beginBulk(stagingdir)
+            try:
+                for tablename in PEPTIDE_TABLES:
+                    table = source.tables[tablename]
+                    columns = [column.name for column in table.columns]
+                    remap = [(column, mappings[column]) for column in columns if column in mappings]
+                    if tablename == 'peptide':
+                        remap.append(('id', mappings['peptide_id']))
+                    elif tablename == 'peptide_seq_match':
+                        remap.append(('id', mappings['peptide_seq_match_id']))
+                    result = source.connection.execute(
+                        select([table]).where(table.c.dataset_id.in_([row.id for row in datasets]))
+                    )
+                    while True:
+                        rows = result.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        rows = [dict(zip(columns, row)) for row in rows]
+                        for row in rows:
+                            for column, mapping in remap:
+                                row[column] = mapping(row[column])
+                        store.bulk.writeRows(tablename, rows)
+                counts = store.endBulk()
+            except Exception:
+                store.abortBulk()
+                raise
+        except Exception:
+            # Take out the dataset rows made for the merge
+            for row in datasets:
+                store.dropDataset(row.name)
+            raise
+        logger.info('Merged %d peptides in %d datasets from %s' % (counts['peptide'], len(datasets), path))
+        return counts
+    finally:
+        source.close()
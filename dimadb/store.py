@@ -9,268 +9,1522 @@ Created on  2017-03-31 12:26:37
 @copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
 @license: GPL v2.0
 '''
-import re
+import sys, os
+import copy
+import datetime
+import threading
+from array import array
+from collections import namedtuple
 
 from sqlalchemy.engine import create_engine
-from sqlalchemy import MetaData, Column, Table, types, ForeignKey
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine.url import make_url
+from sqlalchemy import MetaData, Column, Table, types, ForeignKey, Index, select, func, inspect
+from sqlalchemy.exc import IntegrityError
+
+from options import ABUNDANCE_LONG, ABUNDANCE_MATRIX, ABUNDANCE_BOTH, ABUNDANCE_LAYOUTS, \
+    CHANNEL_ABUNDANCE, CHANNEL_RATIO, DEFAULT_POOL_SIZE, DEFAULT_POOL_RECYCLE, \
+    SQLITE_DEFAULT, SQLITE_INGEST, SQLITE_PROFILES
+from columns import planForDict, toFloatOrNone, fingerprintFields
+from reader import DEFAULT_BATCH_SIZE
+from parsing import parseModifications, parsePositions, bareSequence
+from bulk import BulkStager, bulkLoad
+from cache import LRUCache, TTLCache
+from records import AbundanceRecord, AbundanceVectorRecord, SeqMatchRecord, ModificationRecord
+from columnar import floatList
+from instrument import NULL_TIMER
+from sqlite import useProfile, mergeDatabase
+import query
+import summary
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # List of functions on the Store class that process peptide data.  Order is important.
-# Run by the savePeptideData function
+# Each one adds the rows for a single split line of peptide data to a PeptideBatch.
+# Run by the savePeptideFields function
 PEPTIDE_DATA_METHODS = [
-    'storePeptideAbundances',
-    'storePeptideSeqMatches',
-    'storePeptideModifications',
+    'addPeptideAbundances',
+    'addPeptideAbundanceVector',
+    'addPeptideSeqMatches',
+    'addPeptideModifications',
+]
+
+# Block versions of PEPTIDE_DATA_METHODS.  Each one adds the rows for a whole
+# ColumnBlock to a PeptideBatch.  Run by the savePeptideBlock function
+PEPTIDE_BLOCK_METHODS = [
+    'addBlockAbundances',
+    'addBlockAbundanceVectors',
+    'addBlockSeqMatches',
+    'addBlockModifications',
+]
+
+# Matrix returned by Store.getAbundanceMatrix.  peptide_ids is a numpy array
+# of the row peptide ids, channels a list of the column channel names and
+# values a float numpy array (peptides x channels) with NaN where missing.
+AbundanceMatrix = namedtuple('AbundanceMatrix', ['peptide_ids', 'channels', 'values'])
+
+
+# peptide_seq_match algorithm of the matches that came from a sequence
+# index (see Store.useSequenceIndex) rather than the Positions in Master
+# Proteins column
+SEQINDEX_ALGORITHM = 'sequence index'
+
+# dataset status values.  The rows of an archived dataset have been exported
+# (to dataset.archive) and removed.
+DATASET_ACTIVE = 'active'
+DATASET_ARCHIVED = 'archived'
+
+# load_job status values
+LOAD_RUNNING = 'running'
+LOAD_COMPLETE = 'complete'
+LOAD_FAILED = 'failed'
+
+# Position to record in the load_job row when a batch is committed.  byte_offset
+# is the end of the last line of the batch in the data file.
+LoadCheckpoint = namedtuple('LoadCheckpoint', ['job_id', 'byte_offset'])
+
+# Maximum number of values in one IN list, which keeps SQLite under its bound parameter limit
+MAX_IN_VALUES = 500
+
+
+# Name columns of the batch rows that are replaced by reference data ids in
+# batchRows, as (table name, name key, id column, reference table, insert defaults)
+LOOKUPS = [
+    ('peptide_abundance',       'channel',      'channel_id',       'abundance_channel',    {'kind' : CHANNEL_ABUNDANCE}),
+    ('peptide_seq_match',       'accession',    'accession_id',     'accession',            {}),
+    ('peptide_seq_match_data',  'metric',       'metric_id',        'metric',               {}),
+    ('peptide_modification',    'mod_type',     'mod_type_id',      'modification_type',    {}),
+]
+
+# Peptide data tables in foreign key order
+PEPTIDE_TABLES = [
+    'peptide',
+    'peptide_abundance',
+    'peptide_seq_match',
+    'peptide_seq_match_data',
+    'peptide_modification',
+    'peptide_abundance_vector',
+]
+
+# Summary tables in foreign key order.  See dimadb.summary
+SUMMARY_TABLES = [
+    'dataset_summary',
+    'protein_summary',
+    'channel_summary',
+    'protein_channel_summary',
 ]
 
+# Tables whose ids are allocated by the Store (see allocateIds) rather than the database
+CLIENT_ID_TABLES = [
+    'peptide',
+    'peptide_seq_match',
+]
+
+
+# Schema shared by every Store.  The tables only describe the database, so
+# they are defined once here rather than for each Store.
+metadata = MetaData()
+
+TABLES = {}
+
+# One row per dataset.  Every peptide data row carries the dataset_id of its
+# peptide, so a dataset can be scanned or deleted through its own range of
+# the dataset_id indexes without joining back to peptide.
+TABLES['dataset'] = Table(
+    'dataset',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('name',                          types.String(200), nullable=False, unique=True),
+    Column('status',                        types.String(20), nullable=False, default=DATASET_ACTIVE),
+    Column('created',                       types.DateTime, default=datetime.datetime.now),
+    Column('archive',                       types.String(1000)),
+    Column('archived',                      types.DateTime),
+)
+
+TABLES['peptide'] = Table(
+    'peptide',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('confidence',                    types.String(10)),
+    Column('annotated_sequence',            types.String(100)),
+    Column('modifications',                 types.String(1000)),
+    Column('modifications_in_master_proteins',  types.String(1000)),
+    Column('no_protein_groups',             types.Integer),
+    Column('no_proteins',                   types.Integer),
+    Column('no_psms',                       types.Integer),
+    Column('master_protein_accessions',         types.String(100)),
+    Column('positions_in_master_proteins',      types.String(1000)),
+    Column('no_missed_cleavages',           types.Integer),
+    Column('theo_mh_da',                    types.Float),
+    Column('contaminant',                   types.Boolean, nullable=False, default=False),
+    Column('off_by_x',                      types.Integer, nullable=True),
+    Column('position_in_protein',           types.Integer, nullable=True),
+    Column('dataset',                       types.String(200), nullable=False),
+    Column('dataset_id',                    types.Integer, ForeignKey('dataset.id')),
+    Column('fingerprint',                   types.String(40)),
+    Index('ix_peptide_dataset_confidence', 'dataset', 'confidence'),
+    Index('ix_peptide_dataset_id', 'dataset_id'),
+    Index('ix_peptide_dataset_fingerprint', 'dataset', 'fingerprint'),
+)
+
+# Reference data.  Names that repeat in millions of child rows are
+# stored once and referred to by small integer keys (see lookupIds).
+TABLES['accession'] = Table(
+    'accession',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('name',                          types.String(100), nullable=False, unique=True),
+)
+
+TABLES['modification_type'] = Table(
+    'modification_type',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('name',                          types.String(50), nullable=False, unique=True),
+)
+
+# Search engine metric column names for peptide_seq_match_data
+TABLES['metric'] = Table(
+    'metric',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('name',                          types.String(100), nullable=False, unique=True),
+)
+
+# Abundance and ratio channel names for peptide_abundance and peptide_abundance_vector
+TABLES['abundance_channel'] = Table(
+    'abundance_channel',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('name',                          types.String(50), nullable=False, unique=True),
+    Column('kind',                          types.String(10), nullable=False),
+)
+
+TABLES['peptide_modification'] = Table(
+    'peptide_modification',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('peptide_id',                    types.Integer, ForeignKey('peptide.id'),nullable=False),
+    Column('mod_type_id',                   types.Integer, ForeignKey('modification_type.id'), nullable=False),
+    Column('loc_base',                      types.String(1)),
+    Column('loc_pos',                       types.Integer),
+    Column('loc_str',                       types.String(50), nullable=False),
+    Column('dataset_id',                    types.Integer, ForeignKey('dataset.id')),
+    Index('ix_peptide_modification_peptide', 'peptide_id'),
+    Index('ix_peptide_modification_dataset', 'dataset_id'),
+    Index('ix_peptide_modification_type_peptide', 'mod_type_id', 'peptide_id'),
+)
+
+TABLES['peptide_seq_match'] = Table(
+    'peptide_seq_match',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('confidence',                    types.String(10)),
+    Column('algorithm',                     types.String(100)),
+    Column('peptide_id',                    types.Integer, ForeignKey('peptide.id'), nullable=False),
+    Column('accession_id',                  types.Integer, ForeignKey('accession.id')),
+    Column('start',                         types.Integer),
+    Column('end',                           types.Integer),
+    Column('dataset_id',                    types.Integer, ForeignKey('dataset.id')),
+    Index('ix_peptide_seq_match_peptide', 'peptide_id'),
+    Index('ix_peptide_seq_match_dataset', 'dataset_id'),
+    Index('ix_peptide_seq_match_accession_range', 'accession_id', 'start', 'end', 'peptide_id'),
+)
+
+TABLES['peptide_seq_match_data'] = Table(
+    'peptide_seq_match_data',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('peptide_seq_match_id',          types.Integer, ForeignKey('peptide_seq_match.id'), nullable=False),
+    Column('metric_id',                     types.Integer, ForeignKey('metric.id'), nullable=False),
+    Column('strval',                        types.String(100), nullable=False),
+    Column('fval',                          types.Float),
+    Column('dataset_id',                    types.Integer, ForeignKey('dataset.id')),
+    Index('ix_peptide_seq_match_data_seq_match', 'peptide_seq_match_id'),
+    Index('ix_peptide_seq_match_data_dataset', 'dataset_id'),
+    Index('ix_peptide_seq_match_data_metric', 'metric_id'),
+)
+# A row per channel with a value.  val is the abundance rounded to a whole
+# number (see AbundanceRecord.values); peptide_abundance_vector keeps them as is.
+TABLES['peptide_abundance'] = Table(
+    'peptide_abundance',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('peptide_id',                    types.Integer, ForeignKey('peptide.id'), nullable=False),
+    Column('channel_id',                    types.Integer, ForeignKey('abundance_channel.id'), nullable=False),
+    Column('val',                           types.Integer, nullable=False),            
+    Column('dataset_id',                    types.Integer, ForeignKey('dataset.id')),
+    Index('ix_peptide_abundance_peptide', 'peptide_id'),
+    Index('ix_peptide_abundance_dataset', 'dataset_id'),
+    Index('ix_peptide_abundance_channel', 'channel_id'),
+)
+
+# All of the channel values of a peptide.  channel_ids and vals are
+# packed little endian int32 and float64 arrays of the same length.
+# Missing values are NaN.
+TABLES['peptide_abundance_vector'] = Table(
+    'peptide_abundance_vector',
+    metadata,
+    Column('peptide_id',                    types.Integer, ForeignKey('peptide.id'), primary_key=True, autoincrement=False),
+    Column('dataset',                       types.String(200), nullable=False, index=True),
+    Column('dataset_id',                    types.Integer, ForeignKey('dataset.id'), index=True),
+    Column('channel_ids',                   types.LargeBinary, nullable=False),
+    Column('vals',                          types.LargeBinary, nullable=False),
+)
+
+# Aggregates of each dataset, and of each protein in it, for Store.summary.
+# writeBatch adds the counts of every batch it writes in the same
+# transaction.  Deleting or replacing peptides sets stale instead, and a
+# stale (or missing) dataset_summary row has all of the dataset's summary
+# rows rebuilt from the peptide tables when it is next read.  Phospho
+# sites are the phospho peptide_modification rows, and the protein counts
+# are over the distinct peptides with a seq match in the protein.
+TABLES['dataset_summary'] = Table(
+    'dataset_summary',
+    metadata,
+    Column('dataset_id',                    types.Integer, ForeignKey('dataset.id'), primary_key=True, autoincrement=False),
+    Column('peptides',                      types.Integer, nullable=False, default=0),
+    Column('psms',                          types.Integer, nullable=False, default=0),
+    Column('contaminants',                  types.Integer, nullable=False, default=0),
+    Column('phospho_sites',                 types.Integer, nullable=False, default=0),
+    Column('stale',                         types.Boolean, nullable=False, default=False),
+)
+
+TABLES['protein_summary'] = Table(
+    'protein_summary',
+    metadata,
+    Column('dataset_id',                    types.Integer, ForeignKey('dataset.id'), primary_key=True, autoincrement=False),
+    Column('accession_id',                  types.Integer, ForeignKey('accession.id'), primary_key=True, autoincrement=False),
+    Column('peptides',                      types.Integer, nullable=False, default=0),
+    Column('psms',                          types.Integer, nullable=False, default=0),
+    Column('phospho_sites',                 types.Integer, nullable=False, default=0),
+    Index('ix_protein_summary_accession', 'accession_id'),
+)
+
+# Sums of the peptide_abundance values by channel, over the dataset and over
+# each protein.  abundances is the number of values summed.
+TABLES['channel_summary'] = Table(
+    'channel_summary',
+    metadata,
+    Column('dataset_id',                    types.Integer, ForeignKey('dataset.id'), primary_key=True, autoincrement=False),
+    Column('channel_id',                    types.Integer, ForeignKey('abundance_channel.id'), primary_key=True, autoincrement=False),
+    Column('total',                         types.Float, nullable=False, default=0),
+    Column('abundances',                    types.Integer, nullable=False, default=0),
+)
+
+TABLES['protein_channel_summary'] = Table(
+    'protein_channel_summary',
+    metadata,
+    Column('dataset_id',                    types.Integer, ForeignKey('dataset.id'), primary_key=True, autoincrement=False),
+    Column('accession_id',                  types.Integer, ForeignKey('accession.id'), primary_key=True, autoincrement=False),
+    Column('channel_id',                    types.Integer, ForeignKey('abundance_channel.id'), primary_key=True, autoincrement=False),
+    Column('total',                         types.Float, nullable=False, default=0),
+    Column('abundances',                    types.Integer, nullable=False, default=0),
+)
+
+# Next free primary key for tables whose ids are assigned by the client
+# so that whole batches can be inserted without a lastrowid per row
+TABLES['id_sequence'] = Table(
+    'id_sequence',
+    metadata,
+    Column('name',                          types.String(50), primary_key=True, autoincrement=False),
+    Column('next_id',                       types.Integer, nullable=False),
+)
+
+# One row per data file load.  byte_offset and rows_committed are
+# updated in the same transaction as each batch, so a load that dies
+# can pick up from the last batch that made it in.  For Parquet and Arrow
+# files byte_offset is the number of rows read.
+TABLES['load_job'] = Table(
+    'load_job',
+    metadata,
+    Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
+    Column('dataset',                       types.String(200), nullable=False),
+    Column('filename',                      types.String(1000), nullable=False),
+    Column('file_hash',                     types.String(40), nullable=False),
+    Column('file_size',                     types.BigInteger),
+    Column('byte_offset',                   types.BigInteger, nullable=False, default=0),
+    Column('rows_committed',                types.Integer, nullable=False, default=0),
+    Column('status',                        types.String(20), nullable=False),
+    Column('started',                       types.DateTime),
+    Column('updated',                       types.DateTime),
+    Index('ix_load_job_dataset_hash', 'dataset', 'file_hash'),
+)
+
+
+# Engines by (process id, connect string, pool settings).  See getEngine
+_engines = {}
+_engineslock = threading.Lock()
+
+
+def isMemoryDatabase(connectstring):
+    '''
+    True for an in memory SQLite database, which lives and dies with its engine
+    '''
+    url = make_url(connectstring)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def createEngine(connectstring, options, sqlite_profile):
+    '''
+    create_engine, with the PRAGMAs of sqlite_profile for SQLite unless it is None
+    '''
+    engine = create_engine(connectstring, **options)
+    if engine.dialect.name == 'sqlite' and sqlite_profile is not None:
+        useProfile(engine, sqlite_profile)
+    return engine
+
+
+def getEngine(connectstring, pool_size=DEFAULT_POOL_SIZE, pool_recycle=DEFAULT_POOL_RECYCLE, pool_pre_ping=True, sqlite_profile=SQLITE_DEFAULT):
+    '''
+    Returns the shared engine, and so connection pool, for a connect string
+    and pool settings, creating it on first use.  Engines are not shared
+    across processes, since pooled connections do not survive a fork.  In
+    memory SQLite databases get an engine of their own every time, since
+    sharing one would share the database.
+
+    SQLite does not pool connections, so only pool_pre_ping applies to it.
+    Its connections get the PRAGMAs of sqlite_profile, one of
+    SQLITE_PROFILES (see dimadb.sqlite), which other databases ignore.  With
+    None they are left as they are, as for a file that is only read.
+    '''
+    if sqlite_profile is not None and sqlite_profile not in SQLITE_PROFILES:
+        raise Exception('SQLite profile must be one of %s, not %s' % (', '.join(SQLITE_PROFILES), sqlite_profile))
+    options = {'pool_pre_ping' : pool_pre_ping}
+    if make_url(connectstring).get_backend_name() != 'sqlite':
+        options['pool_size'] = pool_size
+        options['pool_recycle'] = pool_recycle
+    if isMemoryDatabase(connectstring):
+        return createEngine(connectstring, options, sqlite_profile)
+
+    key = (os.getpid(), connectstring, pool_size, pool_recycle, pool_pre_ping, sqlite_profile)
+    with _engineslock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = createEngine(connectstring, options, sqlite_profile)
+            _engines[key] = engine
+    return engine
+
+
+def disposeEngines():
+    '''
+    Closes the pooled connections of every shared engine and forgets them
+    '''
+    with _engineslock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+class PeptideBatch(object):
+    '''
+    Accumulates records (see dimadb.records) for the peptide tables so that
+    they can be written with multi-row inserts.  Abundances are held as one
+    AbundanceRecord per peptide, and seq matches carry their match data,
+    until writeBatch turns them into rows.
+    '''
+
+    def __init__(self):
+        self.peptides = []
+        self.abundances = []
+        self.seqmatches = []
+        self.modifications = []
+        self.abundancevectors = []
+
+    def __len__(self):
+        return len(self.peptides)
+
 
 class Store(object):
     '''
     Class that manages interactions with the database
     '''
 
-    def __init__(self,connectstring=None):
+    def __init__(self,connectstring=None,abundancelayout=ABUNDANCE_LONG,pool_size=DEFAULT_POOL_SIZE,pool_recycle=DEFAULT_POOL_RECYCLE,pool_pre_ping=True,sqlite_profile=SQLITE_DEFAULT):
         '''
-        Create the engine and connection.  Define the jobreport table
+        Get the shared engine for connectstring (see getEngine).  The schema
+        is the module level metadata and TABLES.
+
+        abundancelayout is one of ABUNDANCE_LAYOUTS and sets which abundance
+        tables are written.  pool_size, pool_recycle and pool_pre_ping
+        configure the engine's connection pool.  sqlite_profile is the
+        SQLITE_PROFILES PRAGMA set for SQLite databases, or None for none.
         '''
+        if abundancelayout not in ABUNDANCE_LAYOUTS:
+            raise Exception('Abundance layout must be one of %s, not %s' % (', '.join(ABUNDANCE_LAYOUTS), abundancelayout))
+        self.abundancelayout = abundancelayout
 
         if connectstring is None:
             connectstring = '%s//%s:%s@%s'
 
-        # configure Session class with desired options
-        self.engine = create_engine(connectstring)
-        Session = sessionmaker(bind=self.engine)
+        self.engine = getEngine(connectstring, pool_size, pool_recycle, pool_pre_ping, sqlite_profile)
+        self.metadata = metadata
+        self.tables = TABLES
 
-        self.session = Session()
-        self.metadata = MetaData()
-        
-        self.tables = {}
-        self.tables['peptide'] = Table(
-            'peptide', 
-            self.metadata, 
-            Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
-            Column('confidence',                    types.String(10)),
-            Column('annotated_sequence',            types.String(100)),
-            Column('modifications',                 types.String(1000)),
-            Column('modifications_in_master_proteins',  types.String(1000)),
-            Column('no_protein_groups',             types.Integer),
-            Column('no_proteins',                   types.Integer),
-            Column('no_psms',                       types.Integer),
-            Column('master_protein_accessions',         types.String(100)),
-            Column('positions_in_master_proteins',      types.String(1000)),
-            Column('no_missed_cleavages',           types.Integer),
-            Column('theo_mh_da',                    types.Float),
-            Column('contaminant',                   types.Boolean, nullable=False, default=False),
-            Column('off_by_x',                      types.Integer, nullable=True),
-            Column('position_in_protein',           types.Integer, nullable=True),
-            Column('dataset',                       types.String(200), nullable=False)
-        )
+        # Checked out from the pool on first use and returned by close
+        self._connection = None
 
-        self.tables['peptide_modification'] = Table(
-            'peptide_modification',
-            self.metadata,
-            Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
-            Column('peptide_id',                    types.Integer, ForeignKey('peptide.id'),nullable=False),
-            Column('mod_type',                      types.String(50), nullable=False),
-            Column('loc_base',                      types.String(1)),
-            Column('loc_pos',                       types.Integer),
-            Column('loc_str',                       types.String(50), nullable=False),
-        )
+        # Instrumentation while instrumented.  See instrument
+        self.instrumentation = None
 
-        self.tables['peptide_seq_match'] = Table(
-            'peptide_seq_match',
-            self.metadata,
-            Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
-            Column('confidence',                    types.String(10)),
-            Column('algorithm',                     types.String(100)),
-            Column('peptide_id',                    types.Integer, ForeignKey('peptide.id'), nullable=False),
-            Column('seq_id',                        types.String(100)),
-            Column('start',                         types.Integer),
-            Column('end',                           types.Integer),
-        )
+        # BulkStager while in bulk mode
+        self.bulk = None
 
-        self.tables['peptide_seq_match_data'] = Table(
-            'peptide_seq_match_data',
-            self.metadata,
-            Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
-            Column('peptide_seq_match_id',          types.Integer, ForeignKey('peptide_seq_match.id'), nullable=False),
-            Column('name',                          types.String(100), nullable=False),
-            Column('strval',                        types.String(100), nullable=False),
-            Column('fval',                          types.Float),
-        )
-        self.tables['peptide_abundance'] = Table(
-            'peptide_abundance',
-            self.metadata,
-            Column('id',                            types.Integer, primary_key=True, autoincrement='auto'),
-            Column('peptide_id',                    types.Integer, ForeignKey('peptide.id'), nullable=False),
-            Column('name',                          types.String(10), nullable=False),
-            Column('val',                           types.Integer, nullable=False),            
-        )
+        # Reference data ids by table name and then name.  Each table is
+        # warmed from the database on first use.
+        self.lookupids = {}
+
+        # Packed channel ids by ColumnPlan
+        self.planchannels = LRUCache(100)
+
+        # SequenceIndex that seq matches are checked against.  See useSequenceIndex
+        self.seqindex = None
+
+        # summary results by (dataset, accession).  Emptied by this Store's
+        # writes, and expired after a while for the writes of other processes.
+        self.summarycache = TTLCache(summary.SUMMARY_CACHE_SIZE, summary.SUMMARY_CACHE_TTL)
+
+        # SummaryDeltas of the staged batches while in bulk mode
+        self.bulkdeltas = None
+
+    @property
+    def connection(self):
+        '''
+        The Store's connection.  Every statement runs on it, and each unit of
+        work (a batch, an id allocation, a reference data insert) is one
+        explicit transaction.
+        '''
+        if self._connection is None:
+            self._connection = self.engine.connect()
+        return self._connection
+
+    def close(self):
+        '''
+        Returns the connection to the engine pool.  The Store can still be
+        used, it just checks out a connection again.
+        '''
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
 
-        self.metadata.bind = self.engine
-        self.connection = self.engine.connect()
+    def __exit__(self, *exc):
+        self.close()
+
+    def instrument(self,instrumentation):
+        '''
+        Attaches an instrument.Instrumentation, which times the load steps and
+        counts the statements of the Store's engine, or detaches it if
+        instrumentation is None
+        '''
+        if self.instrumentation is not None:
+            self.instrumentation.detach()
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach(self.engine)
+
+    def timer(self,name):
+        '''
+        Context that adds its time to the named timer when instrumented
+        '''
+        if self.instrumentation is None:
+            return NULL_TIMER
+        return self.instrumentation.timer(name)
+
+    def stepMethods(self,methodnames):
+        '''
+        The named methods, wrapped in timers when instrumented
+        '''
+        methods = [getattr(self,methodname) for methodname in methodnames]
+        if self.instrumentation is not None:
+            methods = [self.instrumentation.timed(name, f) for name, f in zip(methodnames, methods)]
+        return methods
 
     def create(self):
         '''
         Actually creates the database tables.  Be careful
         '''
-        self.metadata.create_all(checkfirst=True)
+        self.metadata.create_all(self.connection, checkfirst=True)
         
     def drop(self):
         '''
         Drop the database table
         '''
-        self.metadata.drop_all(checkfirst=True)
+        self.metadata.drop_all(self.connection, checkfirst=True)
+
+    def deferIndexes(self):
+        '''
+        Drops the secondary indexes of the peptide tables, so that a large
+        load does not keep them up to date row by row.  createIndexes builds
+        them again once the load is done.  MySQL will not drop an index that
+        backs a foreign key, so those are kept there.
+
+        Returns the names of the indexes dropped.
+        '''
+        inspector = inspect(self.connection)
+        dropped = []
+        with self.connection.begin():
+            for tablename in PEPTIDE_TABLES:
+                existing = set(index['name'] for index in inspector.get_indexes(tablename))
+                for index in sorted(self.tables[tablename].indexes, key=lambda index: index.name):
+                    if index.name not in existing:
+                        continue
+                    if self.engine.dialect.name == 'mysql' and list(index.columns)[0].foreign_keys:
+                        continue
+                    index.drop(self.connection)
+                    dropped.append(index.name)
+        return dropped
+
+    def createIndexes(self):
+        '''
+        Creates every index of the schema that is missing from the database,
+        such as the ones dropped by deferIndexes.  Returns their names.
+        '''
+        inspector = inspect(self.connection)
+        created = []
+        with self.connection.begin():
+            for table in self.metadata.sorted_tables:
+                existing = set(index['name'] for index in inspector.get_indexes(table.name))
+                for index in sorted(table.indexes, key=lambda index: index.name):
+                    if index.name not in existing:
+                        index.create(self.connection)
+                        created.append(index.name)
+        return created
+
+    def mergeDatabase(self,path,stagingdir=None):
+        '''
+        Merges the datasets of a dimadb SQLite file, such as one kept by an
+        instrument, into this database in bulk.  See sqlite.mergeDatabase.
+        Returns a dictionary of row counts by table name.
+        '''
+        return mergeDatabase(self, path, stagingdir)
+
+    def allocateIds(self,tablename,count):
+        '''
+        Reserve a contiguous range of count primary keys for tablename and
+        return the first one.  The id_sequence row is bumped in its own short
+        transaction so that concurrent writers get disjoint ranges without
+        holding the lock for the whole batch.  A range that ends up unused
+        just leaves a gap.
+        '''
+        seq = self.tables['id_sequence']
+        table = self.tables[tablename]
+        while True:
+            try:
+                with self.connection.begin():
+                    rs = self.connection.execute(
+                        seq.update().where(seq.c.name == tablename).values(next_id=seq.c.next_id + count)
+                    )
+                    if rs.rowcount == 0:
+                        # First allocation for this table; start after anything already there
+                        maxid = self.connection.execute(select([func.max(table.c.id)])).scalar()
+                        start = (maxid or 0) + 1
+                        self.connection.execute(seq.insert(), name=tablename, next_id=start + count)
+                        return start
+                    next_id = self.connection.execute(
+                        select([seq.c.next_id]).where(seq.c.name == tablename)
+                    ).scalar()
+                    return next_id - count
+            except IntegrityError:
+                # Another writer seeded the sequence first.  Try again.
+                continue
 
     def savePeptideData(self,peptidedata):
         '''
         Takes a dictionary of peptide data and saves it to the db.
         Right now this is the proteomics search output from Juerg.
 
-        Iterates through all of the functions in the PEPTIDE_DATA_METHODS list.
+        Single peptide version of savePeptideDataBatch.
         '''
+        self.savePeptideDataBatch([peptidedata])
 
-        peptide_id = self.storePeptide(peptidedata)
+    def savePeptideDataBatch(self,rows,batch_size=DEFAULT_BATCH_SIZE):
+        '''
+        Takes an iterable of peptide data dictionaries and saves them to the db
+        batch_size peptides at a time.  Ids are allocated for the whole batch
+        up front, then every table is written with a single multi-row insert in
+        one transaction per batch.
 
-        for methodname in PEPTIDE_DATA_METHODS:
-            f = getattr(self,methodname)
-            f(peptide_id, peptidedata)
+        Returns the number of peptides saved.
+        '''
+        count = 0
+        chunk = []
+        for peptidedata in rows:
+            chunk.append(peptidedata)
+            if len(chunk) >= batch_size:
+                count += self.savePeptideChunk(chunk)
+                chunk = []
+        if chunk:
+            count += self.savePeptideChunk(chunk)
+        return count
 
-    def storePeptide(self,peptidedata):
+    def savePeptideChunk(self,chunk):
         '''
-        Takes the dictionary of peptide data and makes a peptide record from it
-        '''
-        # Clean out the empties so that None can be null
-        pdata = dict((k,v) for k,v in peptidedata.iteritems() if v != '')
-
-        i = self.tables['peptide'].insert()
-        rs = i.execute(
-            confidence=pdata.get('Confidence'),
-            annotated_sequence=pdata.get('Annotated Sequence'),
-            modifications=pdata.get('Modifications'),
-            modifications_in_master_proteins=pdata.get('Modifications in Master Proteins'),
-            no_protein_groups=pdata.get('# Protein Groups'),
-            no_proteins=pdata.get('# Proteins'),
-            no_psms=pdata.get('# PSMs'),
-            master_protein_accessions=pdata.get('Master Protein Accessions'),
-            positions_in_master_proteins=pdata.get('Positions in Master Proteins'),
-            no_missed_cleavages=pdata.get('# Missed Cleavages'),
-            theo_mh_da=pdata.get('Theo. MH+ [Da]'),
-            contaminant=pdata.get('Contaminant') == 'TRUE',
-            off_by_x=pdata.get('Off by X'),
-            position_in_protein=pdata.get('Position in Protein'),
-        )
-        self.session.commit()
-        return rs.lastrowid
+        Saves a list of peptide data dictionaries as one batch.  Each dictionary
+        is mapped through the ColumnPlan for its keys.
+        '''
+        plans = {}
+        for peptidedata in chunk:
+            plan, fields = planForDict(peptidedata)
+            plans.setdefault(id(plan), (plan, []))[1].append(fields)
+        count = 0
+        for plan, fieldlists in plans.values():
+            count += self.savePeptideFields(plan, fieldlists)
+        return count
 
-    def storePeptideAbundances(self,peptide_id,peptidedata):
+    def savePeptideFields(self,plan,chunk,checkpoint=None,peptide_ids=None):
         '''
-        Takes the dictionary of peptide data and makes an abundance record from it
-        '''
-        pdata = dict((k,v) for k,v in peptidedata.iteritems() if v != '')
-        headerre = re.compile(r'Abundances \(Grouped\): ([^ ]+)')
-        for k,v in pdata.iteritems():
-            m = headerre.match(k)
-            if m:
-                name = m.group(1)
-                val = int(v)
-                i = self.tables['peptide_abundance'].insert()
-                i.execute(
-                    peptide_id=peptide_id,
-                    name=name,
-                    val=val,
-                )
-        self.session.commit()
+        Builds a PeptideBatch from a list of split lines described by plan and writes it.
+        If checkpoint (a LoadCheckpoint) is given the load_job row is updated
+        in the same transaction.
 
-    def storePeptideSeqMatches(self,peptide_id,peptidedata):
+        If peptide_ids are given, the lines replace those existing peptides,
+        one id per line, instead of being added as new ones.
+
+        Iterates through all of the functions in the PEPTIDE_DATA_METHODS list
+        for each line.
         '''
-        Take the dictionary of peptide data and makes seq match records
+        if not chunk:
+            self.checkpointLoadJob(checkpoint, 0)
+            return 0
+        replace = peptide_ids is not None
+        if not replace:
+            peptide_id = self.allocateIds('peptide',len(chunk))
+            peptide_ids = range(peptide_id, peptide_id + len(chunk))
+        methods = self.stepMethods(['addPeptide'] + PEPTIDE_DATA_METHODS)
+        batch = PeptideBatch()
+        for peptide_id, fields in zip(peptide_ids, chunk):
+            fields = plan.pad(fields)
+            for f in methods:
+                f(batch, peptide_id, plan, fields)
+        self.writeBatch(batch, checkpoint, replace)
+        return len(batch)
+
+    def savePeptideBlock(self,block,checkpoint=None):
         '''
-        pdata = dict((k,v) for k,v in peptidedata.iteritems() if v != '')
-        masterstr = pdata.get('Positions in Master Proteins')
-        confidence = pdata.get('Confidence')
+        Builds a PeptideBatch from a columnar.ColumnBlock and writes it.
+        Numeric values come from the block's arrays rather than being
+        converted one at a time.  checkpoint is as for savePeptideFields.
 
-        # Capture additional data for peptide_seq_match_data
-        matchdata = []
-        for k,v in pdata.iteritems():
-            if '(by Search Engine)' in k:
-                d = {
-                    'name' : k,
-                    'strval' : v,
-                }
-                try:
-                    fval = float(v)
-                    d['fval'] = fval
-                except ValueError:
-                    pass
-                matchdata.append(d)
-
-        posre = re.compile(r'([^ ]+) \[(\d+)-(\d+)\]')
-        if masterstr is not None and masterstr.strip() != '':
-            mastermatches = re.split(r'\s*;\s*',masterstr)
-            for mastermatch in mastermatches:
-                m = posre.match(mastermatch)
-                if m is None:
-                    raise Exception('Master protein string does not look right: %s' % mastermatch)
-                acc = m.group(1)
-                start = int(m.group(2))
-                end = int(m.group(3))
-                i = self.tables['peptide_seq_match'].insert()
-                rs = i.execute(
+        Iterates through all of the functions in the PEPTIDE_BLOCK_METHODS list.
+        '''
+        if len(block) == 0:
+            self.checkpointLoadJob(checkpoint, 0)
+            return 0
+        peptide_id = self.allocateIds('peptide',len(block))
+        peptide_ids = range(peptide_id, peptide_id + len(block))
+        batch = PeptideBatch()
+        with self.timer('peptideRows'):
+            batch.peptides = block.peptideRows(peptide_ids)
+        for f in self.stepMethods(PEPTIDE_BLOCK_METHODS):
+            f(batch, peptide_ids, block)
+        self.writeBatch(batch, checkpoint)
+        return len(batch)
+
+    def addBlockAbundances(self,batch,peptide_ids,block):
+        '''
+        Adds an AbundanceRecord of the channel abundances of each peptide in
+        the block to the batch when the long layout is on
+        '''
+        plan = block.plan
+        if self.abundancelayout == ABUNDANCE_MATRIX or not plan.abundances:
+            return
+        matrix = numpy.column_stack([block.numeric[index] for index, name in plan.abundances])
+        for row, peptide_id in enumerate(peptide_ids):
+            batch.abundances.append(AbundanceRecord(
+                peptide_id=peptide_id,
+                channels=plan.abundancechannels,
+                vals=matrix[row],
+            ))
+
+    def addBlockAbundanceVectors(self,batch,peptide_ids,block):
+        '''
+        Adds a peptide_abundance_vector row for each peptide in the block to
+        the batch when the matrix layout is on
+        '''
+        if self.abundancelayout == ABUNDANCE_LONG:
+            return
+        channel_ids, indices = self.planChannels(block.plan)
+        if not indices:
+            return
+        matrix = numpy.column_stack([block.numeric[index] for index in indices]).astype('<f8')
+        for row, peptide_id in enumerate(peptide_ids):
+            batch.abundancevectors.append(AbundanceVectorRecord(
+                peptide_id=peptide_id,
+                dataset=block.datasetValue(row),
+                channel_ids=channel_ids,
+                vals=matrix[row],
+            ))
+
+    def addBlockSeqMatches(self,batch,peptide_ids,block):
+        '''
+        Adds seq match rows, with their peptide_seq_match_data rows, for the
+        block to the batch
+        '''
+        plan = block.plan
+        metrics = [(name, block.strings[index], floatList(block.numeric[index])) for index, name in plan.matchdata]
+        for row, peptide_id in enumerate(peptide_ids):
+            matches = self.seqMatchPositions(block.value(row, plan.sequence), block.value(row, plan.positions))
+            if not matches:
+                continue
+            confidence = block.value(row, plan.confidence)
+            matchdata = tuple([
+                (name, strvals[row], fvals[row])
+                for name, strvals, fvals in metrics if strvals[row] != ''
+            ])
+            for position, algorithm in matches:
+                batch.seqmatches.append(SeqMatchRecord(
                     peptide_id=peptide_id,
-                    seq_id=acc,
-                    start=start,
-                    end=end,
+                    accession=position.accession,
+                    start=position.start,
+                    end=position.end,
                     confidence=confidence,
-                )
-                peptide_seq_match_id = rs.lastrowid
-                self.session.commit()
+                    algorithm=algorithm,
+                    matchdata=matchdata,
+                ))
 
-                i = self.tables['peptide_seq_match_data'].insert()
-                for d in matchdata:
-                    d['peptide_seq_match_id'] = peptide_seq_match_id
-                    i.execute(**d)
+    def addBlockModifications(self,batch,peptide_ids,block):
+        '''
+        Adds peptide modification rows for the block to the batch
+        '''
+        for row, peptide_id in enumerate(peptide_ids):
+            for modification in parseModifications(block.value(row, block.plan.modifications)):
+                for location in modification.locations:
+                    batch.modifications.append(ModificationRecord(
+                        peptide_id=peptide_id,
+                        mod_type=modification.mod_type,
+                        loc_base=location.loc_base,
+                        loc_pos=location.loc_pos,
+                        loc_str=location.loc_str,
+                    ))
 
-                self.session.commit()
+    def batchRows(self,batch):
+        '''
+        Splits the abundances into peptide_abundance records, assigns seq
+        match ids, resolves reference data names and datasets to ids and
+        returns the batch as a list of (table name, records) with parent
+        tables first so that foreign keys are satisfied.
+        '''
+        abundances = []
+        for record in batch.abundances:
+            abundances.extend(record.values())
+        seqmatchdata = []
+        if batch.seqmatches:
+            peptide_seq_match_id = self.allocateIds('peptide_seq_match',len(batch.seqmatches))
+            for record in batch.seqmatches:
+                record.id = peptide_seq_match_id
+                seqmatchdata.extend(record.dataRecords())
+                peptide_seq_match_id += 1
 
-    def storePeptideModifications(self,peptide_id,peptidedata):
+        inserts = [
+            ('peptide',                 batch.peptides),
+            ('peptide_abundance',       abundances),
+            ('peptide_seq_match',       batch.seqmatches),
+            ('peptide_seq_match_data',  seqmatchdata),
+            ('peptide_modification',    batch.modifications),
+            ('peptide_abundance_vector', batch.abundancevectors),
+        ]
+        self.resolveLookups(inserts)
+        self.assignDatasetIds(inserts)
+        return inserts
+
+    def assignDatasetIds(self,inserts):
         '''
-        Take the dictionary of peptide data and make peptide modification records
+        Sets the dataset_id of every row in a list of (table name, rows).
+        Peptides get the id of their dataset, which is created if it is new,
+        and child rows the one of their peptide.
         '''
-        # Clean out the empties so that None can be null
-        pdata = dict((k,v) for k,v in peptidedata.iteritems() if v != '')
+        rowsbytable = dict(inserts)
+        peptides = rowsbytable.get('peptide', [])
+        names = set(row['dataset'] for row in peptides)
+        # Datasets can be dropped by other Stores, so their cached ids are not trusted
+        for name in names:
+            self.lookupids.get('dataset', {}).pop(name, None)
+        datasetids = self.lookupIds('dataset', names)
+        bypeptide = {}
+        for row in peptides:
+            row['dataset_id'] = bypeptide[row['id']] = datasetids[row['dataset']]
 
-        modifications = re.split('r\s*;\s*',pdata.get('Modifications',''))
+        childtables = ['peptide_abundance', 'peptide_seq_match', 'peptide_modification', 'peptide_abundance_vector']
+        missing = set(
+            row['peptide_id'] for tablename in childtables for row in rowsbytable.get(tablename, [])
+            if row['peptide_id'] not in bypeptide
+        )
+        if missing:
+            bypeptide.update(self.peptideDatasetIds(missing))
+        for tablename in childtables:
+            for row in rowsbytable.get(tablename, []):
+                row['dataset_id'] = bypeptide[row['peptide_id']]
 
-        # Modification string matcher, e.g. 2xPhospho [S21; S25] or TMT6plex [K]
-        modre = re.compile(r'\d*x*([^\s]+) \[([^\]]+)\]')
+        byseqmatch = dict((row['id'], row['dataset_id']) for row in rowsbytable.get('peptide_seq_match', []))
+        for row in rowsbytable.get('peptide_seq_match_data', []):
+            row['dataset_id'] = byseqmatch[row['peptide_seq_match_id']]
 
-        # Location string matcher, e.g. S21
-        modlocre = re.compile(r'([A-Z])(\d+)')
+    def peptideDatasetIds(self,peptide_ids):
+        '''
+        Dictionary of the dataset_id of stored peptides by peptide id
+        '''
+        peptide = self.tables['peptide']
+        peptide_ids = list(peptide_ids)
+        result = {}
+        for i in range(0, len(peptide_ids), MAX_IN_VALUES):
+            query = select([peptide.c.id, peptide.c.dataset_id]).where(peptide.c.id.in_(peptide_ids[i:i + MAX_IN_VALUES]))
+            for row in self.connection.execute(query):
+                result[row.id] = row.dataset_id
+        return result
 
-        for modstr in modifications:
-            m = modre.match(modstr)
-            if m is None:
-                raise Exception('Modification string makes no sense: %s' % modstr)
+    def writeBatch(self,batch,checkpoint=None,replace=False):
+        '''
+        Writes all of the rows in the batch, one executemany per table, in a
+        single transaction, along with the checkpoint if there is one.  In bulk
+        mode the rows go to the staging files instead and nothing is
+        checkpointed, since nothing is committed until endBulk.
 
-            mod_type = m.group(1).lower()
-            mod_locstr = m.group(2)
-            mod_locs = re.split(r'\s*;\s*',mod_locstr)
+        With replace, the peptides of the batch already exist and they and
+        their child rows are deleted first, so the peptides keep their ids.
 
-            # Iterate over what may be more than one location
-            for mod_loc in mod_locs:
-                loc_base = None
-                loc_pos = None
-                m = modlocre.match(mod_loc)
-                if m is not None:
-                    loc_base = m.group(1)
-                    loc_pos = m.group(2)
-                i = self.tables['peptide_modification'].insert()
-                i.execute(
+        The counts of the batch are added to the summary tables in the same
+        transaction.  Replacing makes the datasets stale instead (see
+        dimadb.summary).
+        '''
+        if self.bulk is not None and replace:
+            raise Exception('Peptides cannot be replaced in bulk mode')
+        with self.timer('batchRows'):
+            inserts = self.batchRows(batch)
+        with self.timer('summaries'):
+            deltas = summary.batchDeltas(inserts, replace)
+        if self.bulk is not None:
+            with self.timer('stageBatch'):
+                for tablename, records in inserts:
+                    if records:
+                        self.bulk.writeRows(tablename, [record.row() for record in records])
+            self.bulkdeltas.update(deltas)
+            return
+
+        with self.timer('summaries'):
+            summary.ensureSummaryRows(self, deltas)
+        with self.timer('writeBatch'), self.connection.begin():
+            if replace:
+                self.deletePeptideRows([record.id for record in batch.peptides])
+            for tablename, records in inserts:
+                if records:
+                    self.connection.execute(self.tables[tablename].insert(), [record.row() for record in records])
+            summary.addDeltas(self, deltas)
+            self.checkpointLoadJob(checkpoint, len(batch))
+        self.summarycache.invalidate()
+
+    def findLoadJob(self,dataset,file_hash):
+        '''
+        Returns the most recent load_job row for a file with this hash in
+        dataset, or None
+        '''
+        job = self.tables['load_job']
+        return self.connection.execute(
+            select([job])
+            .where(job.c.dataset == dataset)
+            .where(job.c.file_hash == file_hash)
+            .order_by(job.c.id.desc())
+        ).first()
+
+    def createLoadJob(self,dataset,filename,file_hash,file_size=None):
+        '''
+        Inserts a running load_job row at offset 0 and returns its id
+        '''
+        now = datetime.datetime.now()
+        rs = self.connection.execute(
+            self.tables['load_job'].insert(),
+            dataset=dataset,
+            filename=filename,
+            file_hash=file_hash,
+            file_size=file_size,
+            byte_offset=0,
+            rows_committed=0,
+            status=LOAD_RUNNING,
+            started=now,
+            updated=now,
+        )
+        return rs.inserted_primary_key[0]
+
+    def updateLoadJob(self,job_id,**values):
+        '''
+        Sets column values (e.g. status) of a load_job row
+        '''
+        job = self.tables['load_job']
+        values['updated'] = datetime.datetime.now()
+        self.connection.execute(job.update().where(job.c.id == job_id).values(**values))
+
+    def checkpointLoadJob(self,checkpoint,count):
+        '''
+        Moves the load_job row of checkpoint to its byte offset and adds count
+        to the rows committed.  Does nothing if checkpoint is None.  Called
+        inside the batch transaction by writeBatch.
+        '''
+        if checkpoint is None or self.bulk is not None:
+            return
+        job = self.tables['load_job']
+        self.connection.execute(
+            job.update().where(job.c.id == checkpoint.job_id).values(
+                byte_offset=checkpoint.byte_offset,
+                rows_committed=job.c.rows_committed + count,
+                updated=datetime.datetime.now(),
+            )
+        )
+
+    def storedFingerprints(self,dataset,fingerprints):
+        '''
+        Returns the set of fingerprints that are already stored for peptides in dataset
+        '''
+        peptide = self.tables['peptide']
+        fingerprints = list(fingerprints)
+        stored = set()
+        for i in range(0, len(fingerprints), MAX_IN_VALUES):
+            query = select([peptide.c.fingerprint]) \
+                .where(peptide.c.dataset == dataset) \
+                .where(peptide.c.fingerprint.in_(fingerprints[i:i + MAX_IN_VALUES]))
+            stored.update(row.fingerprint for row in self.connection.execute(query))
+        return stored
+
+    def skipStoredPeptides(self,plan,chunk):
+        '''
+        Returns the split lines of chunk that are not already stored, going by
+        the content fingerprint of each line within its dataset.  chunk
+        itself is returned if none of them are.
+        '''
+        keys = [(plan.datasetValue(plan.pad(fields)), fingerprintFields(fields)) for fields in chunk]
+        bydataset = {}
+        for dataset, fingerprint in keys:
+            bydataset.setdefault(dataset, set()).add(fingerprint)
+        stored = set()
+        for dataset, fingerprints in bydataset.items():
+            stored.update((dataset, fingerprint) for fingerprint in self.storedFingerprints(dataset, fingerprints))
+        if not stored:
+            return chunk
+        return [fields for fields, key in zip(chunk, keys) if key not in stored]
+
+    def deletePeptideRows(self,peptide_ids):
+        '''
+        Deletes peptides and all of their child rows, children first, and
+        marks their datasets' summaries stale.  Runs in the caller's
+        transaction.
+        '''
+        peptide_ids = list(peptide_ids)
+        seqmatch = self.tables['peptide_seq_match']
+        for i in range(0, len(peptide_ids), MAX_IN_VALUES):
+            ids = peptide_ids[i:i + MAX_IN_VALUES]
+            summary.markStale(self, ids)
+            for tablename in reversed(PEPTIDE_TABLES):
+                table = self.tables[tablename]
+                if tablename == 'peptide':
+                    criterion = table.c.id.in_(ids)
+                elif tablename == 'peptide_seq_match_data':
+                    criterion = table.c.peptide_seq_match_id.in_(
+                        select([seqmatch.c.id]).where(seqmatch.c.peptide_id.in_(ids))
+                    )
+                else:
+                    criterion = table.c.peptide_id.in_(ids)
+                self.connection.execute(table.delete().where(criterion))
+
+    def deletePeptides(self,peptide_ids):
+        '''
+        Deletes peptides and all of their child rows in one transaction
+        '''
+        with self.connection.begin():
+            self.deletePeptideRows(peptide_ids)
+        self.summarycache.invalidate()
+
+    def datasetId(self,name):
+        '''
+        Returns the id of the named dataset, or None if there is no such dataset
+        '''
+        dataset = self.tables['dataset']
+        return self.connection.execute(select([dataset.c.id]).where(dataset.c.name == name)).scalar()
+
+    def listDatasets(self):
+        '''
+        Returns the dataset rows in name order
+        '''
+        dataset = self.tables['dataset']
+        return self.connection.execute(select([dataset]).order_by(dataset.c.name)).fetchall()
+
+    def deleteDatasetRows(self,dataset_id):
+        '''
+        Deletes the peptides of a dataset and all of their child rows, children
+        first, and its summary rows, through the dataset_id indexes.  Runs in
+        the caller's transaction.  Returns the number of peptides deleted.
+        '''
+        summary.deleteSummaryRows(self, dataset_id)
+        count = 0
+        for tablename in reversed(PEPTIDE_TABLES):
+            table = self.tables[tablename]
+            result = self.connection.execute(table.delete().where(table.c.dataset_id == dataset_id))
+            if tablename == 'peptide':
+                count = result.rowcount
+        return count
+
+    def dropDataset(self,name):
+        '''
+        Deletes a dataset, its peptides with all of their child rows and its
+        load_job rows in one transaction.  Returns the number of peptides deleted.
+        '''
+        dataset_id = self.datasetId(name)
+        if dataset_id is None:
+            raise Exception('There is no dataset %s' % name)
+        dataset = self.tables['dataset']
+        loadjob = self.tables['load_job']
+        with self.connection.begin():
+            count = self.deleteDatasetRows(dataset_id)
+            self.connection.execute(loadjob.delete().where(loadjob.c.dataset == name))
+            self.connection.execute(dataset.delete().where(dataset.c.id == dataset_id))
+        self.lookupids.get('dataset', {}).pop(name, None)
+        self.summarycache.invalidate()
+        return count
+
+    def archiveDataset(self,name,path,format='parquet'):
+        '''
+        Exports a dataset to a Parquet or Arrow file (see exportDataset) and
+        then deletes its peptides.  The dataset row stays, marked archived
+        with the path of the file.  Returns the number of peptides archived.
+        '''
+        dataset_id = self.datasetId(name)
+        if dataset_id is None:
+            raise Exception('There is no dataset %s' % name)
+        count = self.exportDataset(name, path, format)
+        dataset = self.tables['dataset']
+        with self.connection.begin():
+            self.deleteDatasetRows(dataset_id)
+            self.connection.execute(
+                dataset.update().where(dataset.c.id == dataset_id),
+                status=DATASET_ARCHIVED,
+                archive=path,
+                archived=datetime.datetime.now(),
+            )
+        self.summarycache.invalidate()
+        return count
+
+    def storedPeptides(self,dataset):
+        '''
+        Returns the peptides of dataset as a dictionary of lists of
+        (id, fingerprint) in id order, keyed like ColumnPlan.peptideKey
+        '''
+        peptide = self.tables['peptide']
+        stored = {}
+        for row in self.connection.execute(
+            select([peptide.c.id, peptide.c.annotated_sequence, peptide.c.modifications, peptide.c.fingerprint])
+            .where(peptide.c.dataset == dataset)
+            .order_by(peptide.c.id)
+        ):
+            key = (dataset, row.annotated_sequence, row.modifications)
+            stored.setdefault(key, []).append((row.id, row.fingerprint))
+        return stored
+
+    def beginBulk(self,stagingdir=None):
+        '''
+        Switches the Store into bulk mode.  Batches are written to staging files
+        (in a temporary directory under stagingdir) until endBulk loads them.
+        Ids are still allocated from id_sequence, so the foreign keys in the
+        staging files are already wired up.
+        '''
+        if self.bulk is not None:
+            raise Exception('Store is already in bulk mode')
+        columns = {}
+        binarycolumns = {}
+        for tablename in PEPTIDE_TABLES:
+            table = self.tables[tablename]
+            columns[tablename] = [
+                c.name for c in table.columns
+                if not (c.primary_key and c.autoincrement is not False and tablename not in CLIENT_ID_TABLES)
+            ]
+            binarycolumns[tablename] = set(c.name for c in table.columns if isinstance(c.type, types.LargeBinary))
+        self.bulk = BulkStager(columns, stagingdir, binarycolumns)
+        self.bulkdeltas = summary.SummaryDeltas()
+
+    def endBulk(self):
+        '''
+        Loads the staging files with the database native bulk loader in one
+        transaction, along with the summary counts of the staged batches,
+        removes them and leaves bulk mode.
+
+        Returns a dictionary of row counts by table name.
+        '''
+        if self.bulk is None:
+            raise Exception('Store is not in bulk mode')
+        bulk = self.bulk
+        deltas = self.bulkdeltas
+        self.bulk = None
+        self.bulkdeltas = None
+        try:
+            bulk.close()
+            with self.timer('summaries'):
+                summary.ensureSummaryRows(self, deltas)
+            with self.timer('bulkLoad'), self.connection.begin():
+                for tablename in PEPTIDE_TABLES:
+                    if bulk.counts[tablename]:
+                        bulkLoad(
+                            self.connection,
+                            self.tables[tablename],
+                            bulk.columns[tablename],
+                            bulk.paths[tablename],
+                            bulk.binarycolumns[tablename],
+                        )
+                summary.addDeltas(self, deltas)
+            self.summarycache.invalidate()
+            return dict(bulk.counts)
+        finally:
+            bulk.cleanup()
+
+    def abortBulk(self):
+        '''
+        Throws away the staging files and leaves bulk mode
+        '''
+        if self.bulk is not None:
+            self.bulk.cleanup()
+            self.bulk = None
+            self.bulkdeltas = None
+
+    def addPeptide(self,batch,peptide_id,plan,fields):
+        '''
+        Adds a peptide row for the split line to the batch
+        '''
+        record = plan.peptideRow(fields)
+        record.id = peptide_id
+        record.fingerprint = fingerprintFields(fields)
+        batch.peptides.append(record)
+
+    def addPeptideAbundances(self,batch,peptide_id,plan,fields):
+        '''
+        Adds an AbundanceRecord of the channel abundances of the split line to
+        the batch when the long layout is on
+        '''
+        if self.abundancelayout == ABUNDANCE_MATRIX or not plan.abundances:
+            return
+        vals = array('d')
+        for index, name in plan.abundances:
+            v = fields[index]
+            vals.append(float(v) if v != '' else float('nan'))
+        batch.abundances.append(AbundanceRecord(
+            peptide_id=peptide_id,
+            channels=plan.abundancechannels,
+            vals=vals,
+        ))
+
+    def warmLookups(self,tablename):
+        '''
+        Loads every row of a reference data table into the id cache
+        '''
+        table = self.tables[tablename]
+        ids = self.lookupids.setdefault(tablename, {})
+        for row in self.connection.execute(select([table.c.name, table.c.id])):
+            ids[row.name] = row.id
+
+    def lookupIds(self,tablename,names,defaults=None):
+        '''
+        Returns a dictionary of reference data ids for names, creating the
+        missing ones with defaults for any other columns.  Known names come
+        from the cache.  Unknown names are fetched, then the rest are inserted
+        in one statement.  If a concurrent loader inserted one first the
+        insert fails and the ids are fetched again one at a time.
+        '''
+        if tablename not in self.lookupids:
+            self.warmLookups(tablename)
+        ids = self.lookupids[tablename]
+        result = {}
+        missing = set()
+        for name in names:
+            lookup_id = ids.get(name)
+            if lookup_id is None:
+                missing.add(name)
+            else:
+                result[name] = lookup_id
+        if not missing:
+            return result
+
+        table = self.tables[tablename]
+        query = select([table.c.name, table.c.id]).where(table.c.name.in_(list(missing)))
+        for row in self.connection.execute(query):
+            ids[row.name] = row.id
+        inserts = [dict(defaults or {}, name=name) for name in missing if name not in ids]
+        if inserts:
+            try:
+                with self.connection.begin():
+                    self.connection.execute(table.insert(), inserts)
+            except IntegrityError:
+                for insert in inserts:
+                    try:
+                        with self.connection.begin():
+                            self.connection.execute(table.insert(), insert)
+                    except IntegrityError:
+                        pass
+            for row in self.connection.execute(query):
+                ids[row.name] = row.id
+
+        for name in missing:
+            result[name] = ids[name]
+        return result
+
+    def resolveLookups(self,inserts):
+        '''
+        Sets the reference data ids of the records in a list of (table name,
+        records) from their names, per LOOKUPS
+        '''
+        rowsbytable = dict(inserts)
+        for tablename, namekey, idcolumn, lookuptable, defaults in LOOKUPS:
+            rows = rowsbytable.get(tablename)
+            if not rows:
+                continue
+            ids = self.lookupIds(lookuptable, set(row[namekey] for row in rows), defaults)
+            for row in rows:
+                row[idcolumn] = ids[row[namekey]]
+
+    def planChannels(self,plan):
+        '''
+        Returns the packed channel_ids for the abundance and ratio columns of plan
+        and the matching list of column indices
+        '''
+        result = self.planchannels.get(plan)
+        if result is None:
+            channel_ids = array('i')
+            indices = []
+            for kind, columns in ((CHANNEL_ABUNDANCE, plan.abundances), (CHANNEL_RATIO, plan.ratios)):
+                ids = self.lookupIds('abundance_channel', [name for index, name in columns], {'kind' : kind})
+                for index, name in columns:
+                    channel_ids.append(ids[name])
+                    indices.append(index)
+            if sys.byteorder == 'big':
+                channel_ids.byteswap()
+            result = (channel_ids.tostring(), indices)
+            self.planchannels.put(plan, result)
+        return result
+
+    def addPeptideAbundanceVector(self,batch,peptide_id,plan,fields):
+        '''
+        Adds a peptide_abundance_vector row with all of the abundance and ratio
+        channels of the split line to the batch when the matrix layout is on
+        '''
+        if self.abundancelayout == ABUNDANCE_LONG:
+            return
+        channel_ids, indices = self.planChannels(plan)
+        if not indices:
+            return
+        vals = array('d')
+        for index in indices:
+            v = fields[index]
+            vals.append(float(v) if v != '' else float('nan'))
+        if sys.byteorder == 'big':
+            vals.byteswap()
+        batch.abundancevectors.append(AbundanceVectorRecord(
+            peptide_id=peptide_id,
+            dataset=plan.datasetValue(fields),
+            channel_ids=channel_ids,
+            vals=vals,
+        ))
+
+    def findPeptides(self,dataset=None,accession=None,mod_type=None,min_confidence=None,chunk_size=query.DEFAULT_CHUNK_SIZE):
+        '''
+        Yields the peptide rows that match all of the given criteria.  See query.findPeptides
+        '''
+        return query.findPeptides(self, dataset, accession, mod_type, min_confidence, chunk_size)
+
+    def proteinCoverage(self,accession,dataset=None):
+        '''
+        Returns the peptide coverage of a protein.  See query.proteinCoverage
+        '''
+        return query.proteinCoverage(self, accession, dataset)
+
+    def datasetSummary(self,dataset):
+        '''
+        Returns peptide, PSM, accession and modification counts for a dataset.  See query.datasetSummary
+        '''
+        return query.datasetSummary(self, dataset)
+
+    def summary(self,dataset=None,accession=None):
+        '''
+        Returns the summary of a dataset, a protein or a protein in a dataset
+        from the summary tables.  See summary.summary.  Results are cached for
+        SUMMARY_CACHE_TTL seconds, so the writes of other processes can take
+        that long to show.
+        '''
+        key = (dataset, accession)
+        result = self.summarycache.get(key)
+        if result is None:
+            result = summary.summary(self, dataset, accession)
+            self.summarycache.put(key, result)
+        # Callers get a copy they can change
+        return copy.deepcopy(result)
+
+    def refreshSummaries(self,dataset=None):
+        '''
+        Rebuilds the summaries of the stale datasets, or just of dataset if it
+        is stale, rather than on the next read.  See summary.refreshSummaries.
+        Returns the ids of the datasets rebuilt.
+        '''
+        dataset_id = None
+        if dataset is not None:
+            dataset_id = self.datasetId(dataset)
+            if dataset_id is None:
+                raise Exception('There is no dataset %s' % dataset)
+        dataset_ids = summary.refreshSummaries(self, dataset_id)
+        self.summarycache.invalidate()
+        return dataset_ids
+
+    def exportDataset(self,dataset,path,format='parquet',chunk_size=None):
+        '''
+        Writes the dataset to a Parquet or Arrow file with a row per peptide.
+        See export.exportDataset.  Needs pyarrow.
+        '''
+        # Imported here so that pyarrow is only loaded for exports
+        from export import exportDataset, DEFAULT_EXPORT_CHUNK_SIZE
+        return exportDataset(self, dataset, path, format, chunk_size or DEFAULT_EXPORT_CHUNK_SIZE)
+
+    def getAbundanceMatrix(self,dataset,kind=CHANNEL_ABUNDANCE):
+        '''
+        Returns an AbundanceMatrix of the kind (CHANNEL_ABUNDANCE or
+        CHANNEL_RATIO) channels of every peptide in dataset, read from
+        peptide_abundance_vector in one query.  Columns are in the order the
+        channels first appear.  Needs numpy.
+        '''
+        if numpy is None:
+            raise Exception('numpy is required for getAbundanceMatrix')
+
+        channel = self.tables['abundance_channel']
+        vector = self.tables['peptide_abundance_vector']
+        channelnames = dict(
+            (row.id, row.name) for row in self.connection.execute(
+                select([channel.c.id, channel.c.name]).where(channel.c.kind == kind)
+            )
+        )
+
+        peptide_ids = []
+        rowvalues = []
+        columns = {}
+        channels = []
+        query = select([vector.c.peptide_id, vector.c.channel_ids, vector.c.vals]) \
+            .where(vector.c.dataset == dataset) \
+            .order_by(vector.c.peptide_id)
+        for row in self.connection.execute(query):
+            ids = numpy.frombuffer(row.channel_ids, dtype='<i4')
+            vals = numpy.frombuffer(row.vals, dtype='<f8')
+            keep = [i for i, channel_id in enumerate(ids) if channel_id in channelnames]
+            positions = []
+            for i in keep:
+                channel_id = ids[i]
+                if channel_id not in columns:
+                    columns[channel_id] = len(channels)
+                    channels.append(channelnames[channel_id])
+                positions.append(columns[channel_id])
+            peptide_ids.append(row.peptide_id)
+            rowvalues.append((positions, vals[keep]))
+
+        values = numpy.empty((len(peptide_ids), len(channels)))
+        values.fill(numpy.nan)
+        for i, (positions, vals) in enumerate(rowvalues):
+            values[i, positions] = vals
+        return AbundanceMatrix(numpy.array(peptide_ids), channels, values)
+
+    def useSequenceIndex(self,seqindex):
+        '''
+        Checks the seq matches of the peptides added from now on against a
+        SequenceIndex (see dimadb.seqindex), which also adds the matches in
+        every other protein the peptide occurs in.  None goes back to the
+        Positions in Master Proteins column alone.
+        '''
+        self.seqindex = seqindex
+
+    def seqMatchPositions(self,sequence,masterstr):
+        '''
+        List of (SeqPosition, algorithm) for the seq match rows of a peptide.
+        Without a sequence index these are the master protein positions, with
+        no algorithm.  With one, see SequenceIndex.checkPositions; the
+        matches that come from the index have SEQINDEX_ALGORITHM.
+        '''
+        positions = parsePositions(masterstr)
+        if self.seqindex is None or sequence is None:
+            return [(position, None) for position in positions]
+        return [
+            (position, SEQINDEX_ALGORITHM if fromindex else None)
+            for position, fromindex in self.seqindex.checkPositions(bareSequence(sequence), positions)
+        ]
+
+    def addPeptideSeqMatches(self,batch,peptide_id,plan,fields):
+        '''
+        Adds seq match rows, with their peptide_seq_match_data rows, for the
+        split line to the batch
+        '''
+        matches = self.seqMatchPositions(plan.value(fields, plan.sequence), plan.value(fields, plan.positions))
+        if not matches:
+            return
+        confidence = plan.value(fields, plan.confidence)
+
+        # Capture additional data for peptide_seq_match_data
+        matchdata = tuple([
+            (name, fields[index], toFloatOrNone(fields[index]))
+            for index, name in plan.matchdata if fields[index] != ''
+        ])
+
+        for position, algorithm in matches:
+            batch.seqmatches.append(SeqMatchRecord(
+                peptide_id=peptide_id,
+                accession=position.accession,
+                start=position.start,
+                end=position.end,
+                confidence=confidence,
+                algorithm=algorithm,
+                matchdata=matchdata,
+            ))
+
+    def addPeptideModifications(self,batch,peptide_id,plan,fields):
+        '''
+        Adds peptide modification rows for the split line to the batch
+        '''
+        for modification in parseModifications(plan.value(fields, plan.modifications)):
+            # One row for each location of what may be a multiple modification
+            for location in modification.locations:
+                batch.modifications.append(ModificationRecord(
                     peptide_id=peptide_id,
-                    mod_type=mod_type,
-                    loc_base=loc_base,
-                    loc_pos=loc_pos,
-                    loc_str=mod_loc,
-                )
-        self.session.commit()
+                    mod_type=modification.mod_type,
+                    loc_base=location.loc_base,
+                    loc_pos=location.loc_pos,
+                    loc_str=location.loc_str,
+                ))
+
+    def storePeptide(self,peptidedata):
+        '''
+        Takes the dictionary of peptide data and makes a peptide record from it.
+        Returns the new peptide id.
+        '''
+        plan, fields = planForDict(peptidedata)
+        peptide_id = self.allocateIds('peptide',1)
+        batch = PeptideBatch()
+        self.addPeptide(batch, peptide_id, plan, fields)
+        self.writeBatch(batch)
+        return peptide_id
+
+    def storePeptideAbundances(self,peptide_id,peptidedata):
+        '''
+        Takes the dictionary of peptide data and makes abundance records from it
+        '''
+        plan, fields = planForDict(peptidedata)
+        batch = PeptideBatch()
+        self.addPeptideAbundances(batch, peptide_id, plan, fields)
+        self.writeBatch(batch)
+
+    def storePeptideSeqMatches(self,peptide_id,peptidedata):
+        '''
+        Take the dictionary of peptide data and makes seq match records
+        '''
+        plan, fields = planForDict(peptidedata)
+        batch = PeptideBatch()
+        self.addPeptideSeqMatches(batch, peptide_id, plan, fields)
+        self.writeBatch(batch)
+
+    def storePeptideModifications(self,peptide_id,peptidedata):
+        '''
+        Take the dictionary of peptide data and make peptide modification records
+        '''
+        plan, fields = planForDict(peptidedata)
+        batch = PeptideBatch()
+        self.addPeptideModifications(batch, peptide_id, plan, fields)
+        self.writeBatch(batch)
@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+
+'''
+dimadb.summary - Dataset and protein summaries for dashboards
+
+The summary tables (SUMMARY_TABLES in store) hold the peptide, PSM and
+phospho site counts and the summed channel abundances of each dataset and
+of each protein in it, so that a dashboard reads a handful of rows rather
+than scanning the peptide tables.  writeBatch adds the counts of every
+batch it writes (batchDeltas, ensureSummaryRows and addDeltas) in the
+batch's own transaction.  Deleting or replacing peptides marks the dataset
+stale, and stale datasets, like datasets loaded before there were summary
+tables, are rebuilt from the peptide tables (refreshSummary) when they are
+next read.
+
+The functions take a Store and summary is also available as Store.summary,
+which keeps the results in a TTLCache.
+
+Created on  2026-10-19 01:12:30
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+from sqlalchemy import select, func, and_, or_, case, true, literal, bindparam, types
+from sqlalchemy.exc import IntegrityError
+
+
+# modification_type of the phospho sites
+PHOSPHO_MOD_TYPE = 'phospho'
+
+# Size and entry lifetime in seconds of the Store's summary cache
+SUMMARY_CACHE_SIZE = 1000
+SUMMARY_CACHE_TTL = 60
+
+# Counted columns of each summary table.  Their primary key columns are the rest.
+SUMMARY_COLUMNS = {
+    'dataset_summary'           : ['peptides', 'psms', 'contaminants', 'phospho_sites'],
+    'protein_summary'           : ['peptides', 'psms', 'phospho_sites'],
+    'channel_summary'           : ['total', 'abundances'],
+    'protein_channel_summary'   : ['total', 'abundances'],
+}
+
+
+class SummaryDeltas(object):
+    '''
+    Counts to add to the summary tables.  tables maps each table name to a
+    dictionary of primary key tuple to the list of its SUMMARY_COLUMNS
+    counts.  stale is the set of dataset ids whose summaries have to be
+    rebuilt instead.
+    '''
+
+    def __init__(self):
+        self.tables = dict((tablename, {}) for tablename in SUMMARY_COLUMNS)
+        self.stale = set()
+
+    def add(self, tablename, key, counts):
+        current = self.tables[tablename].get(key)
+        if current is None:
+            self.tables[tablename][key] = list(counts)
+        else:
+            for i, count in enumerate(counts):
+                current[i] += count
+
+    def update(self, other):
+        '''
+        Adds the counts of another SummaryDeltas
+        '''
+        for tablename, keyed in other.tables.items():
+            for key, counts in keyed.items():
+                self.add(tablename, key, counts)
+        self.stale.update(other.stale)
+
+    def __len__(self):
+        return sum(len(keyed) for keyed in self.tables.values()) + len(self.stale)
+
+
+def batchDeltas(inserts, replace=False):
+    '''
+    Returns the SummaryDeltas of a list of (table name, records) from
+    Store.batchRows.  Replaced peptides, and child rows of peptides that
+    are not in the batch, make their datasets stale, since what they
+    replace or add to is not known here.
+    '''
+    rowsbytable = dict(inserts)
+    deltas = SummaryDeltas()
+    peptides = dict((record.id, record) for record in rowsbytable.get('peptide', []))
+    if replace:
+        deltas.stale.update(record.dataset_id for record in peptides.values())
+        return deltas
+
+    for record in peptides.values():
+        deltas.add('dataset_summary', (record.dataset_id,), (1, record.no_psms or 0, 1 if record.contaminant else 0, 0))
+
+    phospho = {}
+    for record in rowsbytable.get('peptide_modification', []):
+        if record.mod_type != PHOSPHO_MOD_TYPE:
+            continue
+        if record.peptide_id not in peptides:
+            deltas.stale.add(record.dataset_id)
+            continue
+        phospho[record.peptide_id] = phospho.get(record.peptide_id, 0) + 1
+        deltas.add('dataset_summary', (record.dataset_id,), (0, 0, 0, 1))
+
+    channels = {}
+    for record in rowsbytable.get('peptide_abundance', []):
+        if record.peptide_id not in peptides:
+            deltas.stale.add(record.dataset_id)
+            continue
+        channels.setdefault(record.peptide_id, []).append((record.channel_id, record.val))
+        deltas.add('channel_summary', (record.dataset_id, record.channel_id), (record.val, 1))
+
+    # A peptide counts once for a protein however many times it matches it
+    proteins = set()
+    for record in rowsbytable.get('peptide_seq_match', []):
+        if record.peptide_id not in peptides:
+            deltas.stale.add(record.dataset_id)
+            continue
+        proteins.add((record.dataset_id, record.accession_id, record.peptide_id))
+    for dataset_id, accession_id, peptide_id in proteins:
+        record = peptides[peptide_id]
+        deltas.add('protein_summary', (dataset_id, accession_id), (1, record.no_psms or 0, phospho.get(peptide_id, 0)))
+        for channel_id, val in channels.get(peptide_id, ()):
+            deltas.add('protein_channel_summary', (dataset_id, accession_id, channel_id), (val, 1))
+
+    # Stale datasets are rebuilt whole, so their counts are not needed
+    if deltas.stale:
+        for keyed in deltas.tables.values():
+            for key in [key for key in keyed if key[0] in deltas.stale]:
+                del keyed[key]
+    return deltas
+
+
+def ensureSummaryRows(store, deltas):
+    '''
+    Inserts zero rows for the keys of deltas that are not in the summary
+    tables yet, each table in a transaction of its own, so that addDeltas
+    only has to update.  As with Store.lookupIds, if a concurrent loader
+    inserted one first the rows are inserted again one at a time.
+
+    A dataset_summary row is inserted stale if the dataset already has
+    peptides, as one merged by mergeDatabase or loaded before there were
+    summary tables does, since the counts would only be those of the rows
+    added from now on.
+    '''
+    # Imported here since store imports this module
+    from store import MAX_IN_VALUES
+
+    connection = store.connection
+    for tablename in ['dataset_summary', 'protein_summary', 'channel_summary', 'protein_channel_summary']:
+        keys = set(deltas.tables[tablename])
+        if tablename == 'dataset_summary':
+            keys.update((dataset_id,) for dataset_id in deltas.stale)
+        if not keys:
+            continue
+        table = store.tables[tablename]
+        keycolumns = list(table.primary_key.columns)
+        existing = set()
+        for dataset_id in set(key[0] for key in keys):
+            query = select(keycolumns).where(table.c.dataset_id == dataset_id)
+            if len(keycolumns) == 1:
+                existing.update(tuple(row) for row in connection.execute(query))
+                continue
+            # Only the rows of the batch's proteins or channels
+            values = sorted(set(key[1] for key in keys if key[0] == dataset_id))
+            for i in range(0, len(values), MAX_IN_VALUES):
+                existing.update(tuple(row) for row in connection.execute(query.where(keycolumns[1].in_(values[i:i + MAX_IN_VALUES]))))
+        inserts = [dict(zip([column.name for column in keycolumns], key)) for key in keys if key not in existing]
+        if not inserts:
+            continue
+        if tablename == 'dataset_summary':
+            peptide = store.tables['peptide']
+            for insert in inserts:
+                stored = connection.execute(
+                    select([peptide.c.id]).where(peptide.c.dataset_id == insert['dataset_id']).limit(1)
+                ).first()
+                insert['stale'] = stored is not None
+        try:
+            with connection.begin():
+                connection.execute(table.insert(), inserts)
+        except IntegrityError:
+            for insert in inserts:
+                try:
+                    with connection.begin():
+                        connection.execute(table.insert(), insert)
+                except IntegrityError:
+                    pass
+
+
+def addDeltas(store, deltas):
+    '''
+    Adds the counts of deltas to the summary rows, one executemany per
+    table, and marks the stale datasets.  Runs in the caller's transaction,
+    after ensureSummaryRows.  If some rows were not there to update, because
+    their dataset was rebuilt in the meantime, the dataset is marked stale.
+    '''
+    connection = store.connection
+    stale = set(deltas.stale)
+    for tablename, keyed in deltas.tables.items():
+        if not keyed:
+            continue
+        table = store.tables[tablename]
+        keynames = [column.name for column in table.primary_key.columns]
+        columns = SUMMARY_COLUMNS[tablename]
+        statement = table.update() \
+            .where(and_(*[table.c[name] == bindparam('key_%s' % name) for name in keynames])) \
+            .values(dict((table.c[column], table.c[column] + bindparam('add_%s' % column)) for column in columns))
+        params = []
+        for key, counts in keyed.items():
+            param = dict(('key_%s' % name, value) for name, value in zip(keynames, key))
+            param.update(('add_%s' % column, count) for column, count in zip(columns, counts))
+            params.append(param)
+        result = connection.execute(statement, params)
+        if connection.dialect.supports_sane_multi_rowcount and result.rowcount != len(params):
+            stale.update(key[0] for key in keyed)
+    if stale:
+        summary = store.tables['dataset_summary']
+        connection.execute(summary.update().where(summary.c.dataset_id.in_(sorted(stale))).values(stale=True))
+
+
+def markStale(store, peptide_ids):
+    '''
+    Marks the datasets of stored peptides stale.  Runs in the caller's
+    transaction, before the peptides are deleted.
+    '''
+    summary = store.tables['dataset_summary']
+    peptide = store.tables['peptide']
+    store.connection.execute(
+        summary.update()
+        .where(summary.c.dataset_id.in_(select([peptide.c.dataset_id]).where(peptide.c.id.in_(peptide_ids))))
+        .values(stale=True)
+    )
+
+
+def deleteSummaryRows(store, dataset_id):
+    '''
+    Deletes the summary rows of a dataset.  Runs in the caller's transaction.
+    '''
+    for tablename in ['protein_channel_summary', 'channel_summary', 'protein_summary', 'dataset_summary']:
+        table = store.tables[tablename]
+        store.connection.execute(table.delete().where(table.c.dataset_id == dataset_id))
+
+
+def refreshSummary(store, dataset_id):
+    '''
+    Rebuilds the summary rows of a dataset from the peptide tables in one
+    transaction, through the dataset_id indexes
+    '''
+    connection = store.connection
+    peptide = store.tables['peptide']
+    seqmatch = store.tables['peptide_seq_match']
+    modification = store.tables['peptide_modification']
+    modtype = store.tables['modification_type']
+    abundance = store.tables['peptide_abundance']
+    dataset = literal(dataset_id, types.Integer)
+
+    phospho = select([modification.c.peptide_id, func.count(modification.c.id).label('sites')]) \
+        .select_from(modification.join(modtype, modtype.c.id == modification.c.mod_type_id)) \
+        .where(and_(modification.c.dataset_id == dataset_id, modtype.c.name == PHOSPHO_MOD_TYPE)) \
+        .group_by(modification.c.peptide_id) \
+        .alias('phospho')
+    proteins = select([seqmatch.c.accession_id, seqmatch.c.peptide_id]) \
+        .where(seqmatch.c.dataset_id == dataset_id) \
+        .distinct() \
+        .alias('proteins')
+
+    with connection.begin():
+        deleteSummaryRows(store, dataset_id)
+
+        row = connection.execute(
+            select([
+                func.count(peptide.c.id),
+                func.sum(peptide.c.no_psms),
+                func.sum(case([(peptide.c.contaminant == true(), 1)], else_=0)),
+            ]).where(peptide.c.dataset_id == dataset_id)
+        ).first()
+        sites = connection.execute(select([func.sum(phospho.c.sites)])).scalar()
+        connection.execute(store.tables['dataset_summary'].insert(), {
+            'dataset_id'    : dataset_id,
+            'peptides'      : row[0] or 0,
+            'psms'          : int(row[1] or 0),
+            'contaminants'  : int(row[2] or 0),
+            'phospho_sites' : int(sites or 0),
+            'stale'         : False,
+        })
+
+        table = store.tables['protein_summary']
+        connection.execute(table.insert().from_select(
+            ['dataset_id', 'accession_id', 'peptides', 'psms', 'phospho_sites'],
+            select([
+                dataset,
+                proteins.c.accession_id,
+                func.count(proteins.c.peptide_id),
+                func.coalesce(func.sum(peptide.c.no_psms), 0),
+                func.coalesce(func.sum(phospho.c.sites), 0),
+            ])
+            .select_from(
+                proteins.join(peptide, peptide.c.id == proteins.c.peptide_id)
+                .outerjoin(phospho, phospho.c.peptide_id == proteins.c.peptide_id)
+            )
+            .group_by(proteins.c.accession_id)
+        ))
+
+        table = store.tables['channel_summary']
+        connection.execute(table.insert().from_select(
+            ['dataset_id', 'channel_id', 'total', 'abundances'],
+            select([dataset, abundance.c.channel_id, func.sum(abundance.c.val), func.count(abundance.c.id)])
+            .where(abundance.c.dataset_id == dataset_id)
+            .group_by(abundance.c.channel_id)
+        ))
+
+        table = store.tables['protein_channel_summary']
+        connection.execute(table.insert().from_select(
+            ['dataset_id', 'accession_id', 'channel_id', 'total', 'abundances'],
+            select([dataset, proteins.c.accession_id, abundance.c.channel_id, func.sum(abundance.c.val), func.count(abundance.c.id)])
+            .select_from(proteins.join(abundance, abundance.c.peptide_id == proteins.c.peptide_id))
+            .group_by(proteins.c.accession_id, abundance.c.channel_id)
+        ))
+
+
+def refreshSummaries(store, dataset_id=None):
+    '''
+    Rebuilds the summaries of the active datasets that are stale or have
+    none, or just of dataset_id if it is one of them.  Returns the ids of
+    the datasets rebuilt.
+    '''
+    # Imported here since store imports this module
+    from store import DATASET_ACTIVE
+
+    dataset = store.tables['dataset']
+    summary = store.tables['dataset_summary']
+    query = select([dataset.c.id]) \
+        .select_from(dataset.outerjoin(summary, summary.c.dataset_id == dataset.c.id)) \
+        .where(and_(dataset.c.status == DATASET_ACTIVE, or_(summary.c.dataset_id == None, summary.c.stale == true())))
+    if dataset_id is not None:
+        query = query.where(dataset.c.id == dataset_id)
+    dataset_ids = [row.id for row in store.connection.execute(query.order_by(dataset.c.id))]
+    for stale_id in dataset_ids:
+        refreshSummary(store, stale_id)
+    return dataset_ids
+
+
+def channelTotals(rows):
+    '''
+    Dictionary of channel name to a dictionary of total and abundances from
+    (name, total, abundances) rows
+    '''
+    return dict((row[0], {'total' : row[1], 'abundances' : row[2]}) for row in rows)
+
+
+def datasetSummaries(store, dataset_id=None):
+    '''
+    Dictionary of dataset name to the summary of the dataset, for every
+    dataset or just dataset_id.  See summary.
+    '''
+    dataset = store.tables['dataset']
+    summary = store.tables['dataset_summary']
+    protein = store.tables['protein_summary']
+    channel = store.tables['channel_summary']
+    channelnames = store.tables['abundance_channel']
+    connection = store.connection
+
+    proteins = select([protein.c.dataset_id, func.count().label('proteins')]) \
+        .where(protein.c.peptides > 0) \
+        .group_by(protein.c.dataset_id) \
+        .alias('proteins')
+    query = select([dataset.c.id, dataset.c.name, summary, proteins.c.proteins]) \
+        .select_from(
+            dataset.outerjoin(summary, summary.c.dataset_id == dataset.c.id)
+            .outerjoin(proteins, proteins.c.dataset_id == dataset.c.id)
+        )
+    channels = select([channel.c.dataset_id, channelnames.c.name, channel.c.total, channel.c.abundances]) \
+        .select_from(channel.join(channelnames, channelnames.c.id == channel.c.channel_id))
+    if dataset_id is not None:
+        query = query.where(dataset.c.id == dataset_id)
+        channels = channels.where(channel.c.dataset_id == dataset_id)
+
+    bydataset = {}
+    for row in connection.execute(channels):
+        bydataset.setdefault(row.dataset_id, []).append((row.name, row.total, row.abundances))
+    result = {}
+    for row in connection.execute(query):
+        result[row.name] = {
+            'dataset'       : row.name,
+            'peptides'      : row.peptides or 0,
+            'psms'          : row.psms or 0,
+            'contaminants'  : row.contaminants or 0,
+            'phospho_sites' : row.phospho_sites or 0,
+            'proteins'      : row.proteins or 0,
+            'channels'      : channelTotals(bydataset.get(row.id, [])),
+        }
+    return result
+
+
+def proteinSummaries(store, accession, dataset_id=None):
+    '''
+    Dictionary of dataset name to the summary of a protein in the dataset,
+    for the datasets it has peptides in, or just dataset_id.  See summary.
+    '''
+    dataset = store.tables['dataset']
+    acc = store.tables['accession']
+    protein = store.tables['protein_summary']
+    channel = store.tables['protein_channel_summary']
+    channelnames = store.tables['abundance_channel']
+    connection = store.connection
+
+    criteria = [acc.c.name == accession]
+    if dataset_id is not None:
+        criteria.append(protein.c.dataset_id == dataset_id)
+    query = select([dataset.c.name, protein]) \
+        .select_from(
+            protein.join(acc, acc.c.id == protein.c.accession_id)
+            .join(dataset, dataset.c.id == protein.c.dataset_id)
+        ) \
+        .where(and_(protein.c.peptides > 0, *criteria))
+    result = {}
+    for row in connection.execute(query):
+        result[row.name] = {
+            'dataset'       : row.name,
+            'accession'     : accession,
+            'peptides'      : row.peptides,
+            'psms'          : row.psms,
+            'phospho_sites' : row.phospho_sites,
+            'channels'      : {},
+        }
+
+    channelcriteria = [acc.c.name == accession]
+    if dataset_id is not None:
+        channelcriteria.append(channel.c.dataset_id == dataset_id)
+    channels = select([dataset.c.name.label('dataset'), channelnames.c.name, channel.c.total, channel.c.abundances]) \
+        .select_from(
+            channel.join(acc, acc.c.id == channel.c.accession_id)
+            .join(dataset, dataset.c.id == channel.c.dataset_id)
+            .join(channelnames, channelnames.c.id == channel.c.channel_id)
+        ) \
+        .where(and_(*channelcriteria))
+    for row in connection.execute(channels):
+        if row.dataset in result:
+            result[row.dataset]['channels'][row.name] = {'total' : row.total, 'abundances' : row.abundances}
+    return result
+
+
+def addTotals(total, summary, names):
+    '''
+    Adds the named counts and the channel totals of summary to total
+    '''
+    for name in names:
+        total[name] += summary[name]
+    for channelname, counts in summary['channels'].items():
+        channel = total['channels'].setdefault(channelname, {'total' : 0, 'abundances' : 0})
+        channel['total'] += counts['total']
+        channel['abundances'] += counts['abundances']
+
+
+def summary(store, dataset=None, accession=None):
+    '''
+    Returns the summary of a dataset, a protein, or a protein in a dataset,
+    from the summary tables.  Stale datasets are rebuilt first.
+
+    With dataset, a dictionary of dataset, peptides, psms, contaminants,
+    phospho_sites, proteins (the number with peptides) and channels, a
+    dictionary of channel name to the total and number of its abundances.
+
+    With accession, a dictionary of accession and the peptides, psms,
+    phospho_sites and channels of the protein over every dataset, and
+    datasets, a dictionary of dataset name to the same counts for each
+    dataset it has peptides in.  With dataset as well, the counts of the
+    protein in that dataset, which are zero if it has no peptides there.
+
+    With neither, the counts of the dataset summary over every dataset and
+    datasets, a dictionary of dataset name to the summary of each.
+    '''
+    dataset_id = None
+    if dataset is not None:
+        dataset_id = store.datasetId(dataset)
+        if dataset_id is None:
+            raise Exception('There is no dataset %s' % dataset)
+    refreshSummaries(store, dataset_id)
+
+    if accession is None:
+        datasets = datasetSummaries(store, dataset_id)
+        if dataset is not None:
+            return datasets[dataset]
+        names = ['peptides', 'psms', 'contaminants', 'phospho_sites', 'proteins']
+    else:
+        datasets = proteinSummaries(store, accession, dataset_id)
+        names = ['peptides', 'psms', 'phospho_sites']
+        if dataset is not None:
+            empty = dict((name, 0) for name in names)
+            empty.update({'dataset' : dataset, 'accession' : accession, 'channels' : {}})
+            return datasets.get(dataset, empty)
+
+    result = dict((name, 0) for name in names)
+    result['channels'] = {}
+    for name in sorted(datasets):
+        addTotals(result, datasets[name], names)
+    if accession is not None:
+        result['accession'] = accession
+    result['datasets'] = datasets
+    return result
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of the synthetic export generator and benchmark runner
+
+Created on  2026-10-18 18:40:19
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile
+from dimadb import Store, loadPeptideDataFile
+from dimadb.benchmark import ExportGenerator, writeExport, exportHeaders, runScenario, runStartupBenchmark
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def testGenerator(self):
+        '''
+        Exports have the test file header, are reproducible and load
+        '''
+        with open(PEPTIDE_DATA_FILE, 'r') as f:
+            self.assertEqual(exportHeaders(10), f.readline().rstrip('\r\n').split('\t'))
+        self.assertEqual(len(exportHeaders(16)), len(exportHeaders(10)) + 12)
+        self.assertEqual(ExportGenerator(seed=3).row(), ExportGenerator(seed=3).row())
+
+        filename = os.path.join(self.dir, 'export.txt')
+        writeExport(filename, rows=50, channels=6, modification_density=3, fanout=2)
+        store = Store('sqlite://')
+        store.create()
+        self.assertEqual(loadPeptideDataFile(store, filename), 50)
+        counts = [store.connection.execute('select count(*) from %s' % table).scalar() for table in ('peptide_seq_match', 'abundance_channel')]
+        self.assertEqual(counts, [100, 6])
+
+    def testScenario(self):
+        '''
+        A scenario reports timings by stage and the statements issued
+        '''
+        filename = os.path.join(self.dir, 'export.txt')
+        writeExport(filename, rows=30)
+        result = runScenario(filename, 'file', 'row', batch_size=10)
+        self.assertEqual(result['peptides'], 30)
+        self.assertEqual(sorted(result['stages']), ['parse', 'transform', 'write'])
+        self.assertTrue(result['statements'] > 3)
+        self.assertTrue(result['statement_rows'] > result['statements'])
+        self.assertTrue(result['peak_rss_kb'] > 0)
+
+    def testStartup(self):
+        '''
+        Importing the package and loader --version load nothing heavy, and
+        a small load does
+        '''
+        results = runStartupBenchmark(['import', 'version', 'load'], repeat=1, rows=10)
+        self.assertEqual(results['import']['modules'], [])
+        self.assertEqual(results['version']['modules'], [])
+        self.assertTrue('sqlalchemy' in results['load']['modules'])
+        self.assertTrue(results['version']['best'] > 0)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of the bulk load path against SQLite
+
+Created on  2026-10-18 13:15:09
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile
+from dimadb import loadPeptideDataFile, Store, ABUNDANCE_BOTH, CHANNEL_RATIO
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+def dumpTables(store):
+    '''
+    Contents of the peptide tables joined back to the peptide, so that they
+    can be compared regardless of the ids assigned
+    '''
+    queries = [
+        '''select p.id, p.confidence, p.annotated_sequence, p.modifications, p.no_psms, p.theo_mh_da,
+            p.contaminant, p.off_by_x, p.dataset from peptide p''',
+        '''select p.annotated_sequence, c.name, a.val from peptide_abundance a join peptide p on p.id = a.peptide_id
+            join abundance_channel c on c.id = a.channel_id''',
+        '''select p.annotated_sequence, acc.name, m.start, m."end", m.confidence, md.name, d.strval, d.fval
+            from peptide_seq_match m join peptide p on p.id = m.peptide_id
+            join accession acc on acc.id = m.accession_id
+            join peptide_seq_match_data d on d.peptide_seq_match_id = m.id
+            join metric md on md.id = d.metric_id''',
+        '''select p.annotated_sequence, t.name, m.loc_base, m.loc_pos, m.loc_str
+            from peptide_modification m join peptide p on p.id = m.peptide_id
+            join modification_type t on t.id = m.mod_type_id''',
+    ]
+    return [sorted(tuple(row) for row in store.connection.execute(query)) for query in queries]
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.store = Store('sqlite://')
+        self.store.create()
+        self.bulkstore = Store('sqlite://')
+        self.bulkstore.create()
+
+    def tearDown(self):
+        del self.store
+        del self.bulkstore
+
+    def testBulkLoad(self):
+        '''
+        The sample file loads identically through the normal and bulk paths
+        '''
+        count = loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, batch_size=7)
+        bulkcount = loadPeptideDataFile(self.bulkstore, PEPTIDE_DATA_FILE, batch_size=7, bulk=True)
+        self.assertEqual(count, 38)
+        self.assertEqual(bulkcount, 38)
+        self.assertEqual(dumpTables(self.store), dumpTables(self.bulkstore))
+        self.assertTrue(self.bulkstore.bulk is None)
+
+    def testBulkNaN(self):
+        '''
+        NaN values load as NULL through the bulk path, as they do through inserts
+        '''
+        with open(PEPTIDE_DATA_FILE, 'r') as f:
+            lines = [line.rstrip('\r\n').split('\t') for line in f]
+        index = lines[0].index('Theo. MH+ [Da]')
+        for fields in lines[1:5]:
+            fields[index] = 'NaN'
+        dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dir, 'nan.txt')
+            with open(path, 'w') as f:
+                for fields in lines:
+                    f.write('\t'.join(fields) + '\n')
+            loadPeptideDataFile(self.store, path, batch_size=7)
+            loadPeptideDataFile(self.bulkstore, path, batch_size=7, bulk=True)
+        finally:
+            shutil.rmtree(dir, True)
+        self.assertEqual(dumpTables(self.store), dumpTables(self.bulkstore))
+        self.assertEqual(self.bulkstore.connection.execute('select count(*) from peptide where theo_mh_da is null').scalar(), 4)
+
+    def testBulkAbort(self):
+        '''
+        A failed bulk load leaves nothing behind
+        '''
+        self.bulkstore.beginBulk()
+        stagingdir = self.bulkstore.bulk.dir
+        self.bulkstore.abortBulk()
+        self.assertFalse(os.path.exists(stagingdir))
+        self.assertRaises(Exception, loadPeptideDataFile, self.bulkstore, '/nonexistent', bulk=True)
+        self.assertTrue(self.bulkstore.bulk is None)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def testAbundanceMatrix(self):
+        '''
+        The matrix layout reads back the same channels through both paths
+        '''
+        store = Store('sqlite://', abundancelayout=ABUNDANCE_BOTH)
+        store.create()
+        bulkstore = Store('sqlite://', abundancelayout=ABUNDANCE_BOTH)
+        bulkstore.create()
+        loadPeptideDataFile(store, PEPTIDE_DATA_FILE, dataset='matrix')
+        loadPeptideDataFile(bulkstore, PEPTIDE_DATA_FILE, dataset='matrix', bulk=True)
+
+        matrix = store.getAbundanceMatrix('matrix')
+        self.assertEqual(matrix.values.shape, (38, 10))
+        self.assertEqual(matrix.channels[:2], ['126', '127N'])
+        self.assertEqual(list(matrix.values[0][:2]), [7900.0, 6580.0])
+        self.assertTrue(numpy.array_equal(matrix.values, bulkstore.getAbundanceMatrix('matrix').values))
+
+        # Same values as the long layout
+        self.assertEqual(
+            sorted(row for row in store.connection.execute(
+                'select a.peptide_id, c.name, a.val from peptide_abundance a join abundance_channel c on c.id = a.channel_id'
+            )),
+            sorted(
+                (peptide_id, name, int(val))
+                for peptide_id, vals in zip(matrix.peptide_ids, matrix.values)
+                for name, val in zip(matrix.channels, vals)
+            )
+        )
+
+        ratios = store.getAbundanceMatrix('matrix', CHANNEL_RATIO)
+        self.assertEqual(ratios.values.shape, (38, 8))
+        self.assertEqual(ratios.channels[0], '127N/126')
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def testColumnarLoad(self):
+        '''
+        Columnar parsing loads the same rows as the line by line path
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, batch_size=7)
+        count = loadPeptideDataFile(self.bulkstore, PEPTIDE_DATA_FILE, batch_size=7, columnar=True)
+        self.assertEqual(count, 38)
+        self.assertEqual(dumpTables(self.store), dumpTables(self.bulkstore))
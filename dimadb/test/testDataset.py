@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of dataset keys, dropDataset and archiveDataset against SQLite
+
+Created on  2026-10-18 21:42:05
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile
+from dimadb import loadPeptideDataFile, Store, DATASET_ACTIVE, DATASET_ARCHIVED, PEPTIDE_TABLES
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+def datasetCounts(store, tablename):
+    '''
+    Dictionary of dataset name to row count for a peptide table, through dataset_id
+    '''
+    return dict(store.connection.execute(
+        'select dataset.name, count(*) from %s join dataset on dataset.id = %s.dataset_id group by dataset.name' % (tablename, tablename)
+    ).fetchall())
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = Store('sqlite://')
+        self.store.create()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def checkKeys(self):
+        '''
+        Every peptide table row has the dataset_id of its peptide
+        '''
+        for tablename in PEPTIDE_TABLES:
+            missing = self.store.connection.execute('select count(*) from %s where dataset_id is null' % tablename).scalar()
+            self.assertEqual(missing, 0, tablename)
+        self.assertEqual(datasetCounts(self.store, 'peptide'), {'first': 38, 'second': 38})
+        for tablename in ('peptide_modification', 'peptide_seq_match', 'peptide_abundance'):
+            counts = datasetCounts(self.store, tablename)
+            self.assertEqual(counts['first'], counts['second'], tablename)
+            self.assertTrue(counts['first'] > 0, tablename)
+        mismatched = self.store.connection.execute(
+            'select count(*) from peptide_seq_match_data d join peptide_seq_match m on m.id = d.peptide_seq_match_id where d.dataset_id != m.dataset_id'
+        ).scalar()
+        self.assertEqual(mismatched, 0)
+
+    def testRowKeys(self):
+        '''
+        The row path fills dataset_id on every table
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'first', batch_size=7)
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'second', batch_size=7)
+        self.checkKeys()
+        datasets = self.store.listDatasets()
+        self.assertEqual([row.name for row in datasets], ['first', 'second'])
+        self.assertEqual(set(row.status for row in datasets), set([DATASET_ACTIVE]))
+
+    def testColumnarAndBulkKeys(self):
+        '''
+        The columnar and bulk paths fill dataset_id the same way
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'first', batch_size=7, columnar=True)
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'second', batch_size=7, bulk=True)
+        self.checkKeys()
+
+    def testDropDataset(self):
+        '''
+        Dropping a dataset removes its rows and leaves the other one alone
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'first')
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'second')
+        before = dict((tablename, datasetCounts(self.store, tablename).get('second')) for tablename in PEPTIDE_TABLES)
+
+        self.assertEqual(self.store.dropDataset('first'), 38)
+        self.assertTrue(self.store.datasetId('first') is None)
+        for tablename in PEPTIDE_TABLES:
+            self.assertEqual(datasetCounts(self.store, tablename).get('first'), None, tablename)
+            self.assertEqual(datasetCounts(self.store, tablename).get('second'), before[tablename], tablename)
+        self.assertRaises(Exception, self.store.dropDataset, 'first')
+
+        # The name can be loaded again with a new dataset row
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'first')
+        self.assertEqual(datasetCounts(self.store, 'peptide'), {'first': 38, 'second': 38})
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def testArchiveDataset(self):
+        '''
+        Archiving exports the dataset, deletes its rows and marks the dataset row
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'first')
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'second')
+        path = os.path.join(self.dir, 'first.parquet')
+
+        self.assertEqual(self.store.archiveDataset('first', path), 38)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(datasetCounts(self.store, 'peptide'), {'second': 38})
+        row = [row for row in self.store.listDatasets() if row.name == 'first'][0]
+        self.assertEqual(row.status, DATASET_ARCHIVED)
+        self.assertEqual(row.archive, path)
+        self.assertTrue(row.archived is not None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of dataset export against SQLite
+
+Created on  2026-10-18 19:58:12
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, sys, shutil, tempfile, logging
+from StringIO import StringIO
+from dimadb import loadPeptideDataFile, Store, ABUNDANCE_LONG, ABUNDANCE_MATRIX
+from dimadb.export import openExport, EXPORT_ARROW, EXPORT_PARQUET
+from dimadb import export
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def loadStore(self, abundancelayout):
+        store = Store('sqlite://', abundancelayout)
+        store.create()
+        loadPeptideDataFile(store, PEPTIDE_DATA_FILE, 'export')
+        loadPeptideDataFile(store, PEPTIDE_DATA_FILE, 'other')
+        return store
+
+    def checkExport(self, store, table):
+        '''
+        The exported rows match the peptides of the dataset and their child rows
+        '''
+        connection = store.connection
+        peptides = connection.execute("select id, annotated_sequence from peptide where dataset = 'export' order by id").fetchall()
+        rows = table.to_pydict()
+        self.assertEqual(rows['id'], [row.id for row in peptides])
+        self.assertEqual(rows['annotated_sequence'], [row.annotated_sequence for row in peptides])
+        self.assertEqual(set(rows['dataset']), set(['export']))
+
+        for i, peptide_id in enumerate(rows['id']):
+            sites = [row[0] for row in connection.execute(
+                'select loc_str from peptide_modification where peptide_id = ? order by id', peptide_id
+            )]
+            self.assertEqual(rows['modification_sites'][i], sites)
+            matches = connection.execute(
+                'select name, start, end from peptide_seq_match join accession on accession.id = accession_id where peptide_id = ? order by peptide_seq_match.id', peptide_id
+            ).fetchall()
+            self.assertEqual(zip(rows['match_accessions'][i], rows['match_starts'][i], rows['match_ends'][i]), [tuple(match) for match in matches])
+
+        first = connection.execute(
+            "select name, val from peptide_abundance join abundance_channel on abundance_channel.id = channel_id where peptide_id = ?", rows['id'][0]
+        ).fetchall()
+        for name, val in first:
+            self.assertEqual(rows['abundance_%s' % name][0], val)
+
+    def testParquet(self):
+        '''
+        A long layout dataset is exported to Parquet a row group per chunk
+        '''
+        store = self.loadStore(ABUNDANCE_LONG)
+        path = os.path.join(self.dir, 'export.parquet')
+        self.assertEqual(store.exportDataset('export', path, chunk_size=10), 38)
+        self.assertEqual(pyarrow.parquet.ParquetFile(path).num_row_groups, 4)
+        table = openExport(path)
+        self.assertFalse(any(name.startswith('ratio_') for name in table.schema.names))
+        self.checkExport(store, table)
+
+    def testArrow(self):
+        '''
+        A matrix layout dataset is exported to a memory mappable Arrow file
+        with its ratios
+        '''
+        store = self.loadStore(ABUNDANCE_MATRIX)
+        path = os.path.join(self.dir, 'export.arrow')
+        self.assertEqual(store.exportDataset('export', path, EXPORT_ARROW, chunk_size=10), 38)
+        table = openExport(path)
+        self.assertTrue('ratio_127N/126' in table.schema.names)
+        self.assertEqual(table.column('abundance_126').null_count, 0)
+
+        long = self.loadStore(ABUNDANCE_LONG)
+        self.checkExport(long, openExport(path))
+
+    def testCommandLine(self):
+        '''
+        The export command reads a SQLite file and takes the abundances from
+        the table the dataset has them in, whatever the Store's layout
+        '''
+        database = os.path.join(self.dir, 'dimadb.db')
+        with Store('sqlite:///%s' % database, ABUNDANCE_MATRIX) as store:
+            store.create()
+            loadPeptideDataFile(store, PEPTIDE_DATA_FILE, 'export')
+
+        path = os.path.join(self.dir, 'export.parquet')
+        argv, stdout, level = sys.argv, sys.stdout, logging.getLogger().level
+        sys.argv = ['export.py', '--driver', 'sqlite', '--database', database, '--dataset', 'export', '--loglevel', 'ERROR', path]
+        sys.stdout = StringIO()
+        try:
+            self.assertEqual(export.main(), None)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.argv, sys.stdout = argv, stdout
+            logging.getLogger().setLevel(level)
+        self.assertEqual(output, 'Exported 38 peptides to %s\n' % path)
+
+        table = openExport(path)
+        self.assertEqual(table.num_rows, 38)
+        self.assertTrue('ratio_127N/126' in table.schema.names)
+        self.assertEqual(table.column('abundance_126').null_count, 0)
+
+        # The same through a long layout Store
+        with Store('sqlite:///%s' % database, ABUNDANCE_LONG) as store:
+            store.exportDataset('export', path)
+        self.assertEqual(openExport(path).to_pydict(), table.to_pydict())
+
+    def testEmpty(self):
+        '''
+        A dataset without peptides exports an empty file, and unknown formats are refused
+        '''
+        store = self.loadStore(ABUNDANCE_LONG)
+        path = os.path.join(self.dir, 'empty.parquet')
+        self.assertEqual(store.exportDataset('missing', path, EXPORT_PARQUET), 0)
+        self.assertEqual(openExport(path).num_rows, 0)
+        self.assertRaises(Exception, store.exportDataset, 'export', path, 'csv')
+
+
+if __name__ == "__main__":
+    unittest.main()
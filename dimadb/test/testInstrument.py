@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of load instrumentation against SQLite
+
+Created on  2026-10-18 19:24:05
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, logging
+from dimadb import loadPeptideDataFile, Store, Instrumentation, statementTarget, formatReport
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+class LogCapture(logging.Handler):
+    '''
+    Keeps the messages logged while it is installed
+    '''
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.store = Store('sqlite://')
+        self.store.create()
+        self.capture = LogCapture()
+        logger = logging.getLogger()
+        self.level = logger.level
+        logger.setLevel(logging.INFO)
+        logger.addHandler(self.capture)
+
+    def tearDown(self):
+        logger = logging.getLogger()
+        logger.removeHandler(self.capture)
+        logger.setLevel(self.level)
+        self.store.close()
+
+    def testStatementTarget(self):
+        '''
+        Statements are counted by kind and table
+        '''
+        self.assertEqual(statementTarget('INSERT INTO peptide (sequence) VALUES (?)'), ('insert', 'peptide'))
+        self.assertEqual(statementTarget('UPDATE load_job SET status=?'), ('update', 'load_job'))
+        self.assertEqual(statementTarget('DELETE FROM peptide_modification WHERE id IN (?)'), ('delete', 'peptide_modification'))
+        self.assertEqual(statementTarget('SELECT id FROM peptide'), ('select', None))
+        self.assertEqual(statementTarget('PRAGMA table_info(peptide)'), ('other', None))
+
+    def testInstrumentedLoad(self):
+        '''
+        Steps, statements and commits of an instrumented load are counted and
+        the final progress line is logged
+        '''
+        instrumentation = Instrumentation(progress_interval=None)
+        self.store.instrument(instrumentation)
+        count = loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'instrumented', batch_size=10)
+        self.store.instrument(None)
+        self.assertIsNone(instrumentation.engine)
+
+        report = instrumentation.report()
+        counters = report['counters']
+        self.assertEqual(counters['calls.addPeptide'], count)
+        self.assertEqual(counters['calls.addPeptideModifications'], count)
+        self.assertEqual(counters['rows.insert.peptide'], count)
+        self.assertEqual(counters['calls.writeBatch'], (count + 9) // 10)
+        self.assertTrue(counters['statements.insert.peptide'] > 0)
+        self.assertTrue(counters['commits.peptide'] >= (count + 9) // 10)
+        self.assertTrue(counters['commits'] >= counters['commits.peptide'])
+        self.assertTrue(report['timers']['parse'] > 0)
+
+        progress = [message for message in self.capture.messages if 'done in' in message]
+        self.assertEqual(len(progress), 1)
+        self.assertTrue(progress[0].startswith('%s: %d peptides' % (PEPTIDE_DATA_FILE, count)))
+        self.assertTrue('100.0%' in progress[0])
+
+        lines = formatReport(report)
+        self.assertTrue(any(line.split()[0] == 'addPeptideModifications' for line in lines))
+
+    def testProgressRate(self):
+        '''
+        The rate and ETA are of the rows and bytes since the load began
+        '''
+        clock = [1000.0]
+        instrumentation = Instrumentation(progress_interval=5, clock=lambda: clock[0])
+        instrumentation.startProgress('resumed', 0, 2000)
+        clock[0] += 3
+        instrumentation.progress('resumed', 1000, 3000, 10000)
+        self.assertEqual(self.capture.messages, [])
+        clock[0] += 7
+        instrumentation.progress('resumed', 6020, 4000, 10000)
+        self.assertEqual(self.capture.messages, ['resumed: 6020 peptides, 602 rows/s, 40.0%, ETA 0:00:30'])
+
+        # Without startProgress the first call is the baseline
+        instrumentation.progress('late', 500, 100, 1000)
+        clock[0] += 10
+        instrumentation.progress('late', 1500, 600, 1000, final=True)
+        self.assertEqual(self.capture.messages[-1], 'late: 1500 peptides, 100 rows/s, 60.0%, ETA 0:00:08, done in 0:00:10')
+
+    def testNotInstrumented(self):
+        '''
+        Without an Instrumentation the Store methods are not wrapped and no
+        engine events are listened for
+        '''
+        self.assertIsNone(self.store.instrumentation)
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'plain', batch_size=10)
+        self.assertEqual(len(self.store.engine.dispatch.before_cursor_execute), 0)
+        self.assertEqual(self.store.stepMethods(['addPeptide']), [self.store.addPeptide])
+        self.assertEqual(self.capture.messages, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
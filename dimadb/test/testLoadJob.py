@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of resumable loads against SQLite
+
+Created on  2026-10-18 15:48:20
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile
+from dimadb import loadPeptideDataFile, Store, LOAD_COMPLETE, LOAD_FAILED
+from dimadb.test.testBulkLoad import dumpTables
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.store = Store('sqlite://')
+        self.store.create()
+        self.reference = Store('sqlite://')
+        self.reference.create()
+        loadPeptideDataFile(self.reference, PEPTIDE_DATA_FILE, 'resume')
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        del self.store
+        del self.reference
+        shutil.rmtree(self.dir, True)
+
+    def loadJobs(self):
+        return self.store.connection.execute('select status, rows_committed, byte_offset from load_job order by id').fetchall()
+
+    def testResume(self):
+        '''
+        A load that dies after two batches picks up where it left off and a
+        second run of the same file does nothing
+        '''
+        save = self.store.savePeptideFields
+        calls = []
+        def failingSave(plan, chunk, checkpoint=None):
+            calls.append(len(chunk))
+            if len(calls) > 2:
+                raise Exception('Interrupted')
+            return save(plan, chunk, checkpoint)
+        self.store.savePeptideFields = failingSave
+        self.assertRaises(Exception, loadPeptideDataFile, self.store, PEPTIDE_DATA_FILE, 'resume', batch_size=10, resume=True)
+        self.assertEqual([job[:2] for job in self.loadJobs()], [(LOAD_FAILED, 20)])
+
+        self.store.savePeptideFields = save
+        count = loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'resume', batch_size=10, resume=True)
+        self.assertEqual(count, 18)
+        self.assertEqual(self.loadJobs(), [(LOAD_COMPLETE, 38, os.path.getsize(PEPTIDE_DATA_FILE))])
+        self.assertEqual(dumpTables(self.store)[1:], dumpTables(self.reference)[1:])
+
+        self.assertEqual(loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'resume', resume=True), 0)
+        self.assertEqual(len(self.loadJobs()), 1)
+
+    def testSkipStored(self):
+        '''
+        Rows already in the dataset are skipped when a longer export of the same data is loaded
+        '''
+        partial = os.path.join(self.dir, 'partial.txt')
+        with open(PEPTIDE_DATA_FILE, 'rb') as f:
+            lines = f.readlines()
+        with open(partial, 'wb') as f:
+            f.writelines(lines[:16])
+
+        self.assertEqual(loadPeptideDataFile(self.store, partial, 'resume', resume=True), 15)
+        self.assertEqual(loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'resume', batch_size=7, resume=True, columnar=numpy is not None), 23)
+        self.assertEqual(dumpTables(self.store)[1:], dumpTables(self.reference)[1:])
+        self.assertEqual(self.loadJobs()[1][:2], (LOAD_COMPLETE, 23))
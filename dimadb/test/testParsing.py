@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of the modification and position string parsers
+
+Created on  2026-10-18 11:58:02
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, threading
+from dimadb.parsing import parseModifications, parsePositions, parseModificationString, \
+    Modification, ModificationLocation, SeqPosition, modificationcache
+from dimadb.cache import LRUCache
+
+
+class Test(unittest.TestCase):
+
+    def testModifications(self):
+        '''
+        Semicolons inside brackets separate locations, not modifications
+        '''
+        mods = parseModifications('2xPhospho [S21; S25]; 2xOxidation [M3; M18]; 1xTMT6plex [N-Term]')
+        self.assertEqual(len(mods), 3)
+        self.assertEqual(mods[0], Modification('phospho', 2, (
+            ModificationLocation('S21', 'S', 21),
+            ModificationLocation('S25', 'S', 25),
+        )))
+        self.assertEqual(mods[2], Modification('tmt6plex', 1, (ModificationLocation('N-Term', None, None),)))
+
+        # No count prefix and site probabilities
+        mods = parseModifications('1xCarbamidomethyl [C13]; TMT6plex [K]; 1xPhospho [S14(98.9)]')
+        self.assertEqual([m.mod_type for m in mods], ['carbamidomethyl', 'tmt6plex', 'phospho'])
+        self.assertEqual(mods[1].count, 1)
+        self.assertEqual(mods[2].locations[0], ModificationLocation('S14(98.9)', 'S', 14))
+
+        self.assertEqual(parseModifications(None), ())
+        self.assertEqual(parseModifications(''), ())
+
+    def testBadModifications(self):
+        '''
+        Garbage anywhere in the string is an error
+        '''
+        self.assertRaises(Exception, parseModificationString, 'garbage')
+        self.assertRaises(Exception, parseModificationString, '1xPhospho [S7] garbage')
+
+    def testPositions(self):
+        '''
+        Master protein positions
+        '''
+        self.assertEqual(parsePositions('F4JLS6 [1-27]'), (SeqPosition('F4JLS6', 1, 27),))
+        self.assertEqual(
+            parsePositions('Q9SEU4-3 [1-12]; Q9LHP2 [1-12]'),
+            (SeqPosition('Q9SEU4-3', 1, 12), SeqPosition('Q9LHP2', 1, 12))
+        )
+        self.assertRaises(Exception, parsePositions, 'F4JLS6 1-27')
+
+    def testCache(self):
+        '''
+        Repeat parses are cache hits and return the same object
+        '''
+        modificationcache.clear()
+        first = parseModifications('1xPhospho [S8]; 1xTMT6plex [K/M]')
+        second = parseModifications('1xPhospho [S8]; 1xTMT6plex [K/M]')
+        self.assertTrue(first is second)
+        stats = modificationcache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+
+    def testThreads(self):
+        '''
+        Writer threads can share the caches
+        '''
+        modificationcache.clear()
+        strings = ['%dxPhospho [S%d]' % (i % 3 + 1, i) for i in range(200)]
+        errors = []
+
+        def parse():
+            try:
+                for i in range(2000):
+                    modstr = strings[i * 7 % len(strings)]
+                    if parseModifications(modstr) != parseModificationString(modstr):
+                        errors.append(modstr)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=parse) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        stats = modificationcache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 8 * 2000)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of the read side queries against SQLite
+
+Created on  2026-10-18 15:41:20
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os
+from dimadb import loadPeptideDataFile, Store
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.store = Store('sqlite://')
+        self.store.create()
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, dataset='first')
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, dataset='second')
+
+    def tearDown(self):
+        del self.store
+
+    def testFindPeptides(self):
+        '''
+        Criteria combine and results stream across chunk boundaries
+        '''
+        self.assertEqual(len(list(self.store.findPeptides())), 76)
+        self.assertEqual(len(list(self.store.findPeptides(dataset='first', chunk_size=5))), 38)
+
+        peptides = list(self.store.findPeptides(dataset='first', accession='P51430'))
+        self.assertEqual(len(peptides), 2)
+        self.assertTrue(all('P51430' in p.positions_in_master_proteins for p in peptides))
+
+        phospho = list(self.store.findPeptides(dataset='first', mod_type='Phospho'))
+        self.assertTrue(all('Phospho' in p.modifications for p in phospho))
+        self.assertEqual(len(phospho), 23)
+        self.assertEqual(len(list(self.store.findPeptides(dataset='first', min_confidence='Medium'))), 38)
+        self.assertRaises(Exception, self.store.findPeptides, min_confidence='Great')
+
+    def testCoverage(self):
+        '''
+        Overlapping seq matches merge into one interval
+        '''
+        coverage = self.store.proteinCoverage('Q9SE60', dataset='first')
+        self.assertEqual(coverage['peptides'], 2)
+        self.assertEqual(coverage['intervals'], [(1, 8)])
+        self.assertEqual(coverage['residues'], 8)
+        self.assertEqual(self.store.proteinCoverage('Q9SE60')['peptides'], 4)
+
+    def testDatasetSummary(self):
+        '''
+        Per dataset counts
+        '''
+        summary = self.store.datasetSummary('first')
+        self.assertEqual(summary['peptides'], 38)
+        self.assertEqual(summary['accessions'], 33)
+        self.assertEqual(summary['contaminants'], 0)
+        self.assertEqual(summary['modifications']['tmt6plex'], 38)
+        self.assertEqual(self.store.datasetSummary('missing')['peptides'], 0)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of the Parquet and Arrow readers against SQLite
+
+Created on  2026-10-18 20:34:50
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile
+from dimadb import loadPeptideDataFile, updatePeptideDataFile, Store, LOAD_COMPLETE
+from dimadb.reader import openReader, fileFormat, TextReader, FORMAT_TSV, FORMAT_PARQUET, FORMAT_ARROW
+from dimadb.columns import ColumnPlan
+from dimadb.test.testBulkLoad import dumpTables
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+def typedColumn(values):
+    '''
+    Arrow array for a column of the text export, as int, float or boolean
+    if every value parses as one, with nulls for empty values
+    '''
+    present = [v for v in values if v != '']
+    for converter in (int, float):
+        try:
+            converted = [converter(v) for v in present]
+        except ValueError:
+            continue
+        return pyarrow.array([converter(v) if v != '' else None for v in values])
+    if present and set(present) <= set(['TRUE', 'FALSE']):
+        return pyarrow.array([v == 'TRUE' if v != '' else None for v in values])
+    return pyarrow.array([v if v != '' else None for v in values], type=pyarrow.string())
+
+
+def writeTyped(filename, format, record_size=15):
+    '''
+    Writes the test file as a typed Parquet or Arrow file of record_size row
+    record batches
+    '''
+    with TextReader(PEPTIDE_DATA_FILE) as reader:
+        headers = reader.headers
+        lines = [fields for batch in reader.batches() for fields in batch]
+    lines = [fields + [''] * (len(headers) - len(fields)) for fields in lines]
+    columns = zip(*lines)
+    table = pyarrow.Table.from_arrays([typedColumn(list(column)) for column in columns], headers)
+    if format == FORMAT_PARQUET:
+        pyarrow.parquet.write_table(table, filename, row_group_size=record_size)
+    else:
+        with open(filename, 'wb') as f:
+            writer = pyarrow.RecordBatchFileWriter(f, table.schema)
+            for record in table.to_batches(record_size):
+                writer.write_batch(record)
+            writer.close()
+
+
+def typedTables(store):
+    '''
+    dumpTables without the seq match data strval, since typed values are not
+    written the way the text export had them, e.g. 1.39e-06 for 0.00000139
+    '''
+    tables = dumpTables(store)
+    tables[2] = sorted(row[:6] + row[7:] for row in tables[2])
+    return tables
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.reference = Store('sqlite://')
+        self.reference.create()
+        loadPeptideDataFile(self.reference, PEPTIDE_DATA_FILE, 'typed')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def typedFile(self, format):
+        filename = os.path.join(self.dir, 'peptides.%s' % format)
+        writeTyped(filename, format)
+        return filename
+
+    def testFormats(self):
+        '''
+        Formats come from the extension unless given
+        '''
+        self.assertEqual(fileFormat('peptides.txt'), FORMAT_TSV)
+        self.assertEqual(fileFormat('peptides.PARQUET'), FORMAT_PARQUET)
+        self.assertEqual(fileFormat('peptides.arrow'), FORMAT_ARROW)
+        self.assertRaises(Exception, openReader, PEPTIDE_DATA_FILE, 'xlsx')
+
+        filename = self.typedFile(FORMAT_ARROW)
+        with openReader(filename) as reader:
+            self.assertTrue(reader.typed)
+            self.assertEqual(reader.size, 38)
+            self.assertEqual([len(batch) for batch in reader.batches(10)], [10, 5, 10, 5, 8])
+            self.assertEqual(reader.position, 38)
+
+    def testTypedLoads(self):
+        '''
+        Parquet and Arrow files load the same rows as the text export
+        '''
+        expected = typedTables(self.reference)
+        for format in (FORMAT_PARQUET, FORMAT_ARROW):
+            filename = self.typedFile(format)
+            with openReader(filename) as reader:
+                batch = next(reader.batches(10))
+                block = reader.block(ColumnPlan(reader.headers), batch)
+                abundance = reader.headers.index('Abundances (Grouped): 126')
+                self.assertEqual(block.numeric[abundance].tolist()[:2], [float(fields[abundance]) for fields in batch[:2]])
+
+            store = Store('sqlite://')
+            store.create()
+            self.assertEqual(loadPeptideDataFile(store, filename, 'typed', batch_size=10), 38)
+            self.assertEqual(typedTables(store), expected)
+
+    def testResumeAndUpdate(self):
+        '''
+        Parquet loads resume from the row reached and update datasets like text files
+        '''
+        filename = self.typedFile(FORMAT_PARQUET)
+        store = Store('sqlite://')
+        store.create()
+        save = store.savePeptideBlock
+        calls = []
+        def failingSave(block, checkpoint=None):
+            calls.append(len(block))
+            if len(calls) > 2:
+                raise Exception('Interrupted')
+            return save(block, checkpoint)
+        store.savePeptideBlock = failingSave
+        self.assertRaises(Exception, loadPeptideDataFile, store, filename, 'typed', batch_size=10, resume=True)
+        self.assertEqual(store.connection.execute('select byte_offset from load_job').scalar(), 15)
+
+        store.savePeptideBlock = save
+        self.assertEqual(loadPeptideDataFile(store, filename, 'typed', batch_size=10, resume=True), 23)
+        self.assertEqual(store.connection.execute('select status from load_job').scalar(), LOAD_COMPLETE)
+        self.assertEqual(typedTables(store), typedTables(self.reference))
+
+        changes = updatePeptideDataFile(store, filename, 'typed', batch_size=10)
+        self.assertEqual(changes, {'inserted' : 0, 'updated' : 0, 'deleted' : 0, 'unchanged' : 38})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of the slotted row records of a PeptideBatch
+
+Created on  2026-10-18 23:58:40
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, sys, math
+from dimadb import Store, ABUNDANCE_BOTH
+from dimadb.columns import ColumnPlan
+from dimadb.columnar import parseBlock
+from dimadb.records import PeptideRecord, AbundanceRecord, AbundanceValueRecord, SeqMatchRecord
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.store = Store('sqlite://', abundancelayout=ABUNDANCE_BOTH)
+        self.store.create()
+        self.batches = []
+        self.store.writeBatch = lambda batch, checkpoint=None, replace=False: self.batches.append(batch)
+        with open(PEPTIDE_DATA_FILE, 'r') as f:
+            lines = [line.rstrip('\r\n').split('\t') for line in f]
+        self.plan = ColumnPlan(lines[0], 'records')
+        self.lines = lines[1:]
+
+    def testRecords(self):
+        '''
+        The batch holds records whose rows have just the table columns
+        '''
+        self.store.savePeptideFields(self.plan, self.lines)
+        batch = self.batches[0]
+        self.assertEqual(len(batch), len(self.lines))
+        self.assertTrue(all(isinstance(record, PeptideRecord) for record in batch.peptides))
+        self.assertTrue(all(isinstance(record, AbundanceRecord) for record in batch.abundances))
+        self.assertTrue(all(isinstance(record, SeqMatchRecord) for record in batch.seqmatches))
+
+        # Seq matches of a peptide share its match data
+        first = [record for record in batch.seqmatches if record.peptide_id == batch.seqmatches[0].peptide_id]
+        self.assertTrue(all(record.matchdata is first[0].matchdata for record in first))
+
+        inserts = dict(self.store.batchRows(batch))
+        for tablename, records in inserts.items():
+            columns = set(column.name for column in self.store.tables[tablename].columns)
+            for record in records:
+                self.assertTrue(set(record.row()) <= columns, tablename)
+                self.assertFalse(hasattr(record, '__dict__'))
+                self.assertTrue(record.dataset_id is not None)
+        record = batch.peptides[0]
+        self.assertTrue(sys.getsizeof(record) < sys.getsizeof(record.row()))
+        self.assertEqual(record['annotated_sequence'], record.annotated_sequence)
+        self.assertRaises(KeyError, record.__getitem__, 'nothere')
+
+    def testAbundances(self):
+        '''
+        AbundanceRecords split into a peptide_abundance row for each channel with a value
+        '''
+        record = AbundanceRecord(peptide_id=5, channels=('126', '127N', '127C', '128N'), vals=[1234.0, float('nan'), 99.7, 12.2])
+        self.assertEqual(record.values(), [
+            AbundanceValueRecord(peptide_id=5, channel='126', val=1234),
+            AbundanceValueRecord(peptide_id=5, channel='127C', val=100),
+            AbundanceValueRecord(peptide_id=5, channel='128N', val=12),
+        ])
+        self.store.savePeptideFields(self.plan, self.lines)
+        expected = 0
+        for fields in self.lines:
+            fields = self.plan.pad(fields)
+            expected += len([index for index, name in self.plan.abundances if fields[index] != ''])
+        self.assertEqual(len(dict(self.store.batchRows(self.batches[0]))['peptide_abundance']), expected)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def testBlockRecords(self):
+        '''
+        A ColumnBlock makes the same records as the split lines
+        '''
+        self.store.savePeptideFields(self.plan, self.lines)
+        self.store.savePeptideBlock(parseBlock(self.plan, self.lines))
+        lines, block = [dict(self.store.batchRows(batch)) for batch in self.batches]
+        for tablename in lines:
+            linerows = [record.row() for record in lines[tablename]]
+            blockrows = [record.row() for record in block[tablename]]
+            for rows in (linerows, blockrows):
+                for row in rows:
+                    # Ids come from different allocations
+                    for column in ('id', 'peptide_id', 'peptide_seq_match_id'):
+                        row.pop(column, None)
+                    for column, value in row.items():
+                        if isinstance(value, float) and math.isnan(value):
+                            row[column] = None
+            self.assertEqual(linerows, blockrows, tablename)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of the protein sequence index
+
+Created on  2026-10-18 22:31:17
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile
+from dimadb import loadPeptideDataFile, Store, SEQINDEX_ALGORITHM
+from dimadb.parsing import SeqPosition
+from dimadb.seqindex import buildSequenceIndex, SequenceIndex, uniprotEntries
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SEQUENCE_FILE = os.path.join(os.path.dirname(__file__),'sample.xml')
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'sample.seqidx')
+        self.count = buildSequenceIndex(SEQUENCE_FILE, self.path)
+        self.index = SequenceIndex(self.path)
+        self.entries = {}
+        for accessions, sequence in uniprotEntries(SEQUENCE_FILE):
+            for accession in accessions:
+                self.entries.setdefault(accession, sequence)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.dir, True)
+
+    def testSequences(self):
+        '''
+        Every accession, primary or secondary, maps to its entry's sequence
+        '''
+        self.assertEqual(self.count, 36)
+        self.assertEqual(len(self.index), 36)
+        for accession, sequence in self.entries.items():
+            self.assertEqual(self.index.sequence(accession), sequence, accession)
+        self.assertTrue(self.index.sequence('NOTTHERE') is None)
+        self.assertFalse('NOTTHERE' in self.index)
+
+    def testFind(self):
+        '''
+        The k-mer lookup and the scan for short peptides find every occurrence
+        '''
+        sequences = dict((self.index.accession(protein), self.index.proteinSequence(protein)) for protein in range(len(self.index)))
+        for peptide in ['MASPRVVSEDRK', 'GSDEEDF', 'LSPR', 'K', 'MREILHIQGGQCGNQIG']:
+            expected = []
+            for accession, sequence in sequences.items():
+                start = sequence.find(peptide)
+                while start >= 0:
+                    expected.append(SeqPosition(accession, start + 1, start + len(peptide)))
+                    start = sequence.find(peptide, start + 1)
+            self.assertEqual(sorted(self.index.find(peptide)), sorted(expected), peptide)
+        self.assertEqual(self.index.find('ZZZZZZZZ'), ())
+        self.assertEqual(self.index.find('MASP-VVSEDRK'), ())
+
+    def testCheckPositions(self):
+        '''
+        Confirmed and unindexed positions are kept, wrong ones replaced and
+        the other occurrences added
+        '''
+        peptide = 'MEALISNLFGNISSLK'
+        self.assertEqual(self.index.checkPositions(peptide, [SeqPosition('F4JJY4', 12, 27)]), [(SeqPosition('F4JJY4', 12, 27), False)])
+        self.assertEqual(self.index.checkPositions(peptide, [SeqPosition('F4JJY4', 1, 16)]), [(SeqPosition('F4JJY4', 12, 27), True)])
+        self.assertEqual(
+            self.index.checkPositions('MRGRSYTPSPPR', [SeqPosition('Q9SEU4-3', 1, 12)]),
+            [(SeqPosition('Q9SEU4-3', 1, 12), False), (SeqPosition('Q9LHP2', 1, 12), True), (SeqPosition('Q9SEU4', 1, 12), True)],
+        )
+
+    def testCoverage(self):
+        '''
+        Coverage merges the ranges of the peptides found in the protein
+        '''
+        coverage = self.index.coverage('P41127', ['[-].MKHNNVIPNGHFK.[K]', 'MKHNNVIPNGHFKK', 'NOTINIT'])
+        self.assertEqual(coverage['peptides'], 2)
+        self.assertEqual(coverage['intervals'], [(1, 14)])
+        self.assertEqual(coverage['residues'], 14)
+        self.assertEqual(coverage['length'], len(self.entries['P41127']))
+        self.assertTrue(self.index.coverage('NOTTHERE', ['K']) is None)
+
+    def testLoad(self):
+        '''
+        Loads with an index store the corrected and added seq matches on
+        both the row and columnar paths
+        '''
+        rows = []
+        for columnar in (False, True):
+            store = Store('sqlite://')
+            store.create()
+            store.useSequenceIndex(self.index)
+            loadPeptideDataFile(store, PEPTIDE_DATA_FILE, 'seqindex', batch_size=7, columnar=columnar)
+            rows.append(store.connection.execute(
+                'select peptide_id, name, start, end, algorithm from peptide_seq_match join accession on accession.id = accession_id order by peptide_seq_match.id'
+            ).fetchall())
+        self.assertEqual(rows[0], rows[1])
+        added = set((name, start, end) for peptide_id, name, start, end, algorithm in rows[0] if algorithm == SEQINDEX_ALGORITHM)
+        self.assertTrue(('F4JJY4', 12, 27) in added)
+        self.assertTrue(('Q9SEU4', 1, 12) in added)
+        self.assertFalse(('F4JJY4', 1, 16) in set((name, start, end) for peptide_id, name, start, end, algorithm in rows[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of the ingestion service against SQLite
+
+Created on  2026-10-18 17:05:48
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile, threading, httplib, json, socket
+from dimadb import Store
+from dimadb.service import IngestService, IngestServer, UnixIngestServer
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    '''
+    HTTPConnection over a Unix socket
+    '''
+
+    def __init__(self, path):
+        httplib.HTTPConnection.__init__(self, 'localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def post(connection, path, body):
+    connection.request('POST', path, body, {'Content-Length' : str(len(body))})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.connectstring = 'sqlite:///%s' % os.path.join(self.dir, 'dimadb.db')
+        self.store = Store(self.connectstring)
+        self.store.create()
+        self.service = IngestService(self.connectstring, writers=2, queue_size=2, batch_size=5)
+        self.service.start()
+        with open(PEPTIDE_DATA_FILE, 'rb') as f:
+            self.body = f.read()
+
+    def tearDown(self):
+        self.service.stop()
+        self.store.close()
+        shutil.rmtree(self.dir, True)
+
+    def serve(self, server):
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def testUploads(self):
+        '''
+        Concurrent uploads are all written, through the small queue
+        '''
+        server = IngestServer(('127.0.0.1', 0), self.service)
+        self.serve(server)
+        host, port = server.server_address
+
+        results = {}
+        def upload(dataset):
+            results[dataset] = post(httplib.HTTPConnection(host, port), '/datasets/%s' % dataset, self.body)
+        threads = [threading.Thread(target=upload, args=('run%d' % i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i in range(3):
+            status, result = results['run%d' % i]
+            self.assertEqual(status, 200)
+            self.assertEqual(result, {'dataset' : 'run%d' % i, 'peptides' : 38, 'batches' : 8, 'error' : None})
+        self.assertEqual(
+            self.store.connection.execute('select dataset, count(*) from peptide group by dataset').fetchall(),
+            [('run0', 38), ('run1', 38), ('run2', 38)]
+        )
+        self.assertEqual(self.store.connection.execute('select count(*) from peptide_abundance').scalar(), 3 * 380)
+
+        connection = httplib.HTTPConnection(host, port)
+        connection.request('GET', '/status')
+        status = json.loads(connection.getresponse().read())
+        self.assertEqual((status['uploads'], status['peptides'], status['active']), (3, 3 * 38, 0))
+
+    def testBadUploads(self):
+        '''
+        Uploads that cannot be parsed or have nowhere to go are rejected
+        '''
+        server = IngestServer(('127.0.0.1', 0), self.service)
+        self.serve(server)
+        host, port = server.server_address
+
+        status, result = post(httplib.HTTPConnection(host, port), '/datasets/empty', '')
+        self.assertEqual(status, 400)
+        self.assertTrue('no header' in result['error'])
+
+        headers = 'Confidence\tAnnotated Sequence\tModifications\n'
+        status, result = post(httplib.HTTPConnection(host, port), '/datasets/bad', headers + 'High\tAAK\tgarbage\n')
+        self.assertEqual(status, 400)
+
+        status, result = post(httplib.HTTPConnection(host, port), '/elsewhere', self.body)
+        self.assertEqual(status, 404)
+        self.assertEqual(self.store.connection.execute('select count(*) from peptide').scalar(), 0)
+
+    def testUnixSocket(self):
+        '''
+        Uploads over a Unix socket
+        '''
+        path = os.path.join(self.dir, 'dimadb.sock')
+        server = UnixIngestServer(path, self.service)
+        self.serve(server)
+
+        status, result = post(UnixHTTPConnection(path), '/datasets/local', self.body)
+        self.assertEqual(status, 200)
+        self.assertEqual(result['peptides'], 38)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of parallel parsing of tab separated files
+
+Created on  2026-10-18 21:20:03
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os
+from dimadb import loadPeptideDataFile, Store
+from dimadb.columns import ColumnPlan
+from dimadb.columnar import parseBlock
+from dimadb.reader import TextReader, openReader
+from dimadb.splitter import ParallelTextReader, newlineRanges
+from dimadb.test.testBulkLoad import dumpTables
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+class Test(unittest.TestCase):
+
+    def textLines(self):
+        with TextReader(PEPTIDE_DATA_FILE) as reader:
+            return [fields for batch in reader.batches() for fields in batch]
+
+    def testNewlineRanges(self):
+        '''
+        Ranges cover the buffer and end just past newlines
+        '''
+        buf = 'a\tb\nccc\n\nd\ne'
+        ranges = newlineRanges(buf, 0, len(buf), 3)
+        self.assertEqual(ranges, [(0, 4), (4, 8), (8, 11), (11, 12)])
+        self.assertEqual(newlineRanges(buf, 4, len(buf), 100), [(4, 12)])
+        self.assertEqual(newlineRanges(buf, 12, len(buf)), [])
+
+    def testParallelBatches(self):
+        '''
+        Workers parse small ranges into the same lines as the TextReader, in
+        file order, and the position reached is the end of each batch
+        '''
+        expected = self.textLines()
+        with ParallelTextReader(PEPTIDE_DATA_FILE, 3, range_size=1000) as reader:
+            self.assertTrue(len(reader.ranges()) > 3)
+            lines = []
+            for batch in reader.batches(4):
+                self.assertTrue(len(batch) <= 4)
+                with open(PEPTIDE_DATA_FILE, 'rb') as f:
+                    self.assertTrue(f.read(reader.position).endswith('\n'))
+                lines.extend(batch)
+            self.assertEqual(reader.position, reader.size)
+        self.assertEqual(lines, expected)
+
+        with ParallelTextReader(PEPTIDE_DATA_FILE, 2, range_size=1000) as reader:
+            batches = reader.batches(10)
+            first = next(batches)
+            position = reader.position
+            batches.close()
+        with ParallelTextReader(PEPTIDE_DATA_FILE, 2, range_size=1000) as reader:
+            reader.seek(position)
+            rest = [fields for batch in reader.batches(10) for fields in batch]
+        self.assertEqual(first + rest, expected)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def testParallelLoad(self):
+        '''
+        Loads with parse workers store the same rows, including blocks built
+        by the workers
+        '''
+        reference = Store('sqlite://')
+        reference.create()
+        loadPeptideDataFile(reference, PEPTIDE_DATA_FILE, 'split')
+
+        with openReader(PEPTIDE_DATA_FILE, workers=2) as reader:
+            self.assertTrue(isinstance(reader, ParallelTextReader))
+            plan = ColumnPlan(reader.headers, 'split')
+            block = next(reader.batches(10, plan))
+            self.assertTrue(reader.block(plan, block) is block)
+            self.assertEqual(len(block), 10)
+            self.assertEqual(block.fingerprints, parseBlock(plan, self.textLines()[:10]).fingerprints)
+
+        for columnar in (False, True):
+            store = Store('sqlite://')
+            store.create()
+            count = loadPeptideDataFile(store, PEPTIDE_DATA_FILE, 'split', batch_size=10, columnar=columnar, parse_workers=2)
+            self.assertEqual(count, 38)
+            self.assertEqual(dumpTables(store), dumpTables(reference))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of the SQLite profiles, deferred indexes and merging SQLite files
+
+Created on  2026-10-19 00:47:13
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile, sqlite3
+from sqlalchemy import inspect
+from dimadb import loadPeptideDataFile, Store, ColumnPlan, SQLITE_INGEST, PEPTIDE_TABLES, ABUNDANCE_BOTH, CHANNEL_ABUNDANCE
+from dimadb.sqlite import pragmaValues
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Peptides joined to all of their child rows and reference data, by dataset
+JOINED_COUNTS = '''
+select dataset.name, count(*) from peptide
+join dataset on dataset.id = peptide.dataset_id
+join peptide_seq_match m on m.peptide_id = peptide.id and m.dataset_id = dataset.id
+join accession on accession.id = m.accession_id
+join peptide_seq_match_data d on d.peptide_seq_match_id = m.id and d.dataset_id = dataset.id
+join metric on metric.id = d.metric_id
+group by dataset.name
+'''
+
+
+def matrixByChannel(store, dataset):
+    '''
+    Dictionary of channel name to the list of its abundances in peptide order
+    from getAbundanceMatrix, with None for NaN
+    '''
+    matrix = store.getAbundanceMatrix(dataset)
+    order = numpy.argsort(matrix.peptide_ids)
+    return dict(
+        (name, [None if numpy.isnan(v) else v for v in matrix.values[order, i]])
+        for i, name in enumerate(matrix.channels)
+    )
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def sqliteStore(self, name, **options):
+        store = Store('sqlite:///%s' % os.path.join(self.dir, name), **options)
+        store.create()
+        return store
+
+    def testProfiles(self):
+        '''
+        Every connection gets the PRAGMAs of the Store's profile
+        '''
+        names = ['journal_mode', 'synchronous', 'cache_size', 'temp_store', 'busy_timeout']
+        with self.sqliteStore('default.db') as store:
+            self.assertEqual(pragmaValues(store.connection, names), {
+                'journal_mode'  : 'wal',
+                'synchronous'   : 1,
+                'cache_size'    : -65536,
+                'temp_store'    : 2,
+                'busy_timeout'  : 30000,
+            })
+        with self.sqliteStore('ingest.db', sqlite_profile=SQLITE_INGEST) as store:
+            values = pragmaValues(store.connection, names)
+            self.assertEqual(values['synchronous'], 0)
+            self.assertEqual(values['cache_size'], -262144)
+        self.assertRaises(Exception, Store, 'sqlite://', sqlite_profile='fast')
+
+    def testDeferIndexes(self):
+        '''
+        Deferred indexes are gone during the load and all back after createIndexes
+        '''
+        with self.sqliteStore('dimadb.db') as store:
+            indexes = lambda: set(index['name'] for tablename in PEPTIDE_TABLES for index in inspect(store.connection).get_indexes(tablename))
+            before = indexes()
+            dropped = store.deferIndexes()
+            self.assertEqual(set(dropped), before)
+            self.assertEqual(indexes(), set())
+            loadPeptideDataFile(store, PEPTIDE_DATA_FILE, 'deferred')
+            self.assertEqual(set(store.createIndexes()), before)
+            self.assertEqual(indexes(), before)
+            self.assertEqual(store.createIndexes(), [])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def testMerge(self):
+        '''
+        Datasets of instrument files are merged with their ids and reference data remapped
+        '''
+        central = self.sqliteStore('central.db', abundancelayout=ABUNDANCE_BOTH)
+        # Channels with ids that differ from the instruments' ones, and one they do not have
+        with open(PEPTIDE_DATA_FILE, 'r') as f:
+            channels = [name for index, name in ColumnPlan(f.readline().rstrip('\r\n').split('\t')).abundances]
+        for name in ['999X'] + list(reversed(channels)):
+            central.lookupIds('abundance_channel', [name], {'kind' : CHANNEL_ABUNDANCE})
+        loadPeptideDataFile(central, PEPTIDE_DATA_FILE, 'central')
+        expected = dict(central.connection.execute(JOINED_COUNTS).fetchall())['central']
+
+        paths = []
+        for name in ('first', 'second'):
+            with self.sqliteStore('%s.db' % name, abundancelayout=ABUNDANCE_BOTH) as instrument:
+                # Reference data ids that differ from the central ones
+                instrument.lookupIds('accession', ['%s-only' % name])
+                loadPeptideDataFile(instrument, PEPTIDE_DATA_FILE, name)
+            paths.append(os.path.join(self.dir, '%s.db' % name))
+
+        for path in paths:
+            counts = central.mergeDatabase(path)
+            self.assertEqual(counts['peptide'], 38)
+        self.assertEqual(dict(central.connection.execute(JOINED_COUNTS).fetchall()), {
+            'central'   : expected,
+            'first'     : expected,
+            'second'    : expected,
+        })
+        self.assertEqual(
+            central.connection.execute('select count(*) from peptide_abundance').scalar(),
+            3 * central.connection.execute("select count(*) from peptide_abundance join dataset on dataset.id = dataset_id where dataset.name = 'central'").scalar(),
+        )
+
+        # Matrix layout values stay under their channels
+        expected = matrixByChannel(central, 'central')
+        self.assertEqual(sorted(expected), sorted(channels))
+        for name in ('first', 'second'):
+            self.assertEqual(matrixByChannel(central, name), expected)
+
+        # A dataset that is already there stops the merge
+        self.assertRaises(Exception, central.mergeDatabase, paths[0])
+        self.assertEqual(central.connection.execute('select count(*) from peptide').scalar(), 3 * 38)
+        central.close()
+
+    def testMergeLeavesSource(self):
+        '''
+        Merging only reads the instrument file, which keeps its journal mode
+        '''
+        path = os.path.join(self.dir, 'instrument.db')
+        with self.sqliteStore('instrument.db', sqlite_profile=None) as instrument:
+            loadPeptideDataFile(instrument, PEPTIDE_DATA_FILE, 'instrument')
+        with open(path, 'rb') as f:
+            before = f.read()
+
+        central = self.sqliteStore('central.db')
+        self.assertEqual(central.mergeDatabase(path)['peptide'], 38)
+        central.close()
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), before)
+        connection = sqlite3.connect(path)
+        self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+        connection.close()
+        self.assertFalse(os.path.exists(path + '-wal'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of Store engine sharing and connection handling
+
+Created on  2026-10-18 17:32:06
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile
+from dimadb import Store, TABLES, getEngine
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.connectstring = 'sqlite:///%s' % os.path.join(self.dir, 'dimadb.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def testSharedEngine(self):
+        '''
+        Stores for the same database share the engine and the schema
+        '''
+        first = Store(self.connectstring)
+        second = Store(self.connectstring)
+        self.assertTrue(first.engine is second.engine)
+        self.assertTrue(first.tables is second.tables is TABLES)
+        self.assertFalse(getEngine(self.connectstring, pool_pre_ping=False) is first.engine)
+
+        # In memory databases are never shared
+        self.assertFalse(Store('sqlite://').engine is Store('sqlite://').engine)
+
+    def testConnection(self):
+        '''
+        The connection is checked out on first use and returned by close
+        '''
+        with Store(self.connectstring) as store:
+            self.assertTrue(store._connection is None)
+            store.create()
+            connection = store.connection
+            self.assertTrue(store.connection is connection)
+        self.assertTrue(store._connection is None)
+        self.assertEqual(store.connection.execute('select count(*) from peptide').scalar(), 0)
+        store.close()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of the summary tables, Store.summary and the TTLCache against SQLite
+
+Created on  2026-10-19 01:41:52
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile
+from dimadb import loadPeptideDataFile, Store, SUMMARY_TABLES
+from dimadb.cache import TTLCache
+from dimadb.summary import refreshSummary
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+def summaryRows(store):
+    '''
+    Dictionary of summary table name to its sorted rows, without stale
+    '''
+    rows = {}
+    for tablename in SUMMARY_TABLES:
+        table = store.tables[tablename]
+        columns = [column for column in table.columns if column.name != 'stale']
+        rows[tablename] = sorted(tuple(row) for row in store.connection.execute(table.select().with_only_columns(columns)))
+    return rows
+
+
+class Clock(object):
+    '''
+    Clock for the TTLCache that only moves when told to
+    '''
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = Store('sqlite://')
+        self.store.create()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def staleDatasets(self):
+        return [row[0] for row in self.store.connection.execute('select dataset_id from dataset_summary where stale order by dataset_id')]
+
+    def testIncremental(self):
+        '''
+        The counts added batch by batch, on each load path, match a rebuild and datasetSummary
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'rows', batch_size=7)
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'columnar', batch_size=7, columnar=True)
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'bulk', batch_size=7, bulk=True)
+        self.assertEqual(self.staleDatasets(), [])
+        incremental = summaryRows(self.store)
+        self.assertTrue(all(incremental[tablename] for tablename in SUMMARY_TABLES))
+
+        for row in self.store.listDatasets():
+            refreshSummary(self.store, row.id)
+        self.assertEqual(summaryRows(self.store), incremental)
+
+        for dataset in ('rows', 'columnar', 'bulk'):
+            summary = self.store.summary(dataset)
+            expected = self.store.datasetSummary(dataset)
+            for name in ('peptides', 'psms', 'contaminants'):
+                self.assertEqual(summary[name], expected[name], name)
+            self.assertEqual(summary['phospho_sites'], expected['modifications'].get('phospho', 0))
+            self.assertEqual(summary['proteins'], expected['accessions'])
+            total = self.store.connection.execute(
+                'select sum(val) from peptide_abundance a join dataset on dataset.id = a.dataset_id where dataset.name = ?', dataset
+            ).scalar()
+            self.assertAlmostEqual(sum(channel['total'] for channel in summary['channels'].values()), total)
+
+        everything = self.store.summary()
+        self.assertEqual(sorted(everything['datasets']), ['bulk', 'columnar', 'rows'])
+        self.assertEqual(everything['peptides'], 3 * 38)
+        self.assertRaises(Exception, self.store.summary, 'nothere')
+
+    def testProtein(self):
+        '''
+        A protein's summary counts the distinct peptides that match it, by dataset and over all of them
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'first', batch_size=7)
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'second', batch_size=7)
+        accession, peptides, psms = self.store.connection.execute('''
+            select accession.name, count(distinct peptide.id), sum(peptide.no_psms)
+            from accession
+            join peptide_seq_match m on m.accession_id = accession.id
+            join peptide on peptide.id = m.peptide_id
+            where peptide.dataset = 'first'
+            group by accession.name
+            order by count(distinct peptide.id) desc, accession.name
+        ''').first()
+
+        protein = self.store.summary('first', accession)
+        self.assertEqual((protein['peptides'], protein['psms']), (peptides, psms))
+        self.assertEqual(protein['accession'], accession)
+        self.assertTrue(protein['channels'])
+
+        overall = self.store.summary(accession=accession)
+        self.assertEqual(sorted(overall['datasets']), ['first', 'second'])
+        self.assertEqual(overall['peptides'], 2 * peptides)
+        self.assertEqual(overall['datasets']['second'], dict(protein, dataset='second'))
+
+        self.assertEqual(self.store.summary('first', 'NOTAPROTEIN')['peptides'], 0)
+        self.assertEqual(self.store.summary(accession='NOTAPROTEIN')['datasets'], {})
+
+    def testStale(self):
+        '''
+        Deleting peptides marks the dataset stale and it is rebuilt when read
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'stale', batch_size=7)
+        before = self.store.summary('stale')
+        dataset_id = self.store.datasetId('stale')
+        peptide_ids = [row[0] for row in self.store.connection.execute('select id from peptide order by id limit 5')]
+        self.store.deletePeptides(peptide_ids)
+        self.assertEqual(self.staleDatasets(), [dataset_id])
+
+        after = self.store.summary('stale')
+        self.assertEqual(self.staleDatasets(), [])
+        self.assertEqual(after['peptides'], before['peptides'] - 5)
+        self.assertEqual(after['peptides'], self.store.datasetSummary('stale')['peptides'])
+
+        # Summaries that are missing, like those of datasets loaded before there were any, are built too
+        self.store.connection.execute('delete from dataset_summary')
+        self.assertEqual(self.store.refreshSummaries(), [dataset_id])
+        self.assertEqual(self.store.summary('stale'), after)
+
+    def testLoadWithoutSummary(self):
+        '''
+        Loading into a dataset that has peptides but no summary rows, such as
+        one merged from an instrument file, makes it stale rather than counting
+        only the new peptides
+        '''
+        path = os.path.join(self.dir, 'instrument.db')
+        with Store('sqlite:///%s' % path) as instrument:
+            instrument.create()
+            loadPeptideDataFile(instrument, PEPTIDE_DATA_FILE, 'merged', batch_size=7)
+        self.store.mergeDatabase(path)
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'merged', batch_size=7)
+        self.assertEqual(self.staleDatasets(), [self.store.datasetId('merged')])
+        self.assertEqual(self.store.summary('merged')['peptides'], 2 * 38)
+
+        # A dataset loaded before there were summary tables
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'older', batch_size=7)
+        dataset_id = self.store.datasetId('older')
+        for tablename in reversed(SUMMARY_TABLES):
+            self.store.connection.execute('delete from %s where dataset_id = ?' % tablename, dataset_id)
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'older', batch_size=7, bulk=True)
+        self.assertEqual(self.staleDatasets(), [dataset_id])
+        self.assertEqual(self.store.summary('older')['peptides'], self.store.datasetSummary('older')['peptides'])
+        self.assertEqual(self.store.summary('older')['peptides'], 2 * 38)
+
+    def testDropAndArchive(self):
+        '''
+        Dropping a dataset takes its summary rows with it
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'kept', batch_size=7)
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'dropped', batch_size=7)
+        kept = self.store.summary('kept')
+        self.store.summary('dropped')
+        self.store.dropDataset('dropped')
+        self.assertRaises(Exception, self.store.summary, 'dropped')
+        dataset_id = self.store.datasetId('kept')
+        for tablename in SUMMARY_TABLES:
+            self.assertEqual(
+                self.store.connection.execute('select count(*) from %s where dataset_id != ?' % tablename, dataset_id).scalar(),
+                0,
+                tablename,
+            )
+        self.assertEqual(self.store.summary()['datasets'], {'kept' : kept})
+
+    def testCache(self):
+        '''
+        Summaries are cached until this Store writes or they expire
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'cached', batch_size=7)
+        summary = self.store.summary('cached')
+        summary['peptides'] = -1
+        self.assertEqual(self.store.summary('cached')['peptides'], 38)
+        self.assertEqual(self.store.summarycache.hits, 1)
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'other', batch_size=7)
+        self.assertEqual(len(self.store.summarycache), 0)
+
+        clock = Clock()
+        cache = TTLCache(10, 60, clock)
+        cache.put('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        clock.now += 59
+        self.assertEqual(cache.get('key'), 'value')
+        clock.now += 1
+        self.assertEqual(cache.get('key'), None)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
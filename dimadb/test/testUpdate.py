@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+'''
+test of incremental dataset updates against SQLite
+
+Created on  2026-10-18 16:21:37
+
+@author: akitzmiller
+@copyright: 2016 The Presidents and Fellows of Harvard College. All rights reserved.
+@license: GPL v2.0
+'''
+
+import unittest, os, shutil, tempfile
+from dimadb import loadPeptideDataFile, updatePeptideDataFile, Store
+from dimadb.test.testBulkLoad import dumpTables
+
+PEPTIDE_DATA_FILE = os.path.join(os.path.dirname(__file__),'partialSpreadforTesting.txt')
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.store = Store('sqlite://')
+        self.store.create()
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        del self.store
+        shutil.rmtree(self.dir, True)
+
+    def peptideIds(self, store):
+        return dict(
+            ((row.annotated_sequence, row.modifications), row.id)
+            for row in store.connection.execute('select id, annotated_sequence, modifications from peptide')
+        )
+
+    def testUpdate(self):
+        '''
+        Only the added, changed and removed peptides are written and the result
+        matches a fresh load of the new file
+        '''
+        loadPeptideDataFile(self.store, PEPTIDE_DATA_FILE, 'update')
+        before = self.peptideIds(self.store)
+
+        with open(PEPTIDE_DATA_FILE, 'r') as f:
+            lines = [line.rstrip('\r\n').split('\t') for line in f if line.strip()]
+        headers = lines[0]
+        psms = headers.index('# PSMs')
+        sequence = headers.index('Annotated Sequence')
+
+        # Drop two peptides, change the PSM count of three and add one
+        rows = lines[1:3] + lines[5:]
+        for fields in rows[10:13]:
+            fields[psms] = str(int(fields[psms]) + 1)
+        added = list(rows[0])
+        added[sequence] = '[K].NEWPEPTIDEK.[R]'
+        rows.append(added)
+
+        updated = os.path.join(self.dir, 'updated.txt')
+        with open(updated, 'w') as f:
+            for fields in [headers] + rows:
+                f.write('\t'.join(fields) + '\n')
+
+        changes = updatePeptideDataFile(self.store, updated, 'update', batch_size=10)
+        self.assertEqual(changes, {'inserted' : 1, 'updated' : 3, 'deleted' : 2, 'unchanged' : 33})
+
+        reference = Store('sqlite://')
+        reference.create()
+        loadPeptideDataFile(reference, updated, 'update')
+        self.assertEqual(dumpTables(self.store)[1:], dumpTables(reference)[1:])
+
+        # Peptides that were kept or replaced keep their ids
+        after = self.peptideIds(self.store)
+        for key, peptide_id in after.items():
+            if key in before:
+                self.assertEqual(before[key], peptide_id)
+
+        # Nothing left to do the second time around
+        changes = updatePeptideDataFile(self.store, updated, 'update')
+        self.assertEqual(changes, {'inserted' : 0, 'updated' : 0, 'deleted' : 0, 'unchanged' : 37})